@@ -1,3 +1,22 @@
+-- Esquema completo para una base vacía. Es equivalente a aplicar migraciones.py (que además lo
+-- actualiza en bases existentes y anota la versión en VersionEsquema); al cambiar el esquema,
+-- agregar una migración nueva y reflejarla aquí.
+
+CREATE TABLE Rol (
+    ID INT PRIMARY KEY IDENTITY(1,1),
+    Nombre NVARCHAR(50) NOT NULL UNIQUE
+);
+
+CREATE TABLE Persona (
+    RUT NVARCHAR(12) PRIMARY KEY,
+    Nombre NVARCHAR(100) NOT NULL,
+    Apellido NVARCHAR(100) NOT NULL,
+    Telefono NVARCHAR(20) NULL,
+    ID_Rol INT NULL,
+    Activo BIT NOT NULL DEFAULT 1,
+    CONSTRAINT FK_Persona_Rol FOREIGN KEY (ID_Rol) REFERENCES Rol(ID)
+);
+
 CREATE TABLE Vehiculos (
     Patente NVARCHAR(10) PRIMARY KEY,
     Estado NVARCHAR(10) NOT NULL CHECK (Estado IN ('Dentro', 'Fuera')),
@@ -12,20 +31,87 @@ CREATE TABLE Movimientos (
     TipoMovimiento NVARCHAR(10) NOT NULL CHECK (TipoMovimiento IN ('Entrada', 'Salida')),
     FechaHora DATETIME NOT NULL
 );
+GO
 
-CREATE TABLE Rol (
-    ID INT PRIMARY KEY IDENTITY(1,1),
-    Nombre NVARCHAR(50) NOT NULL UNIQUE
+-- Historial paginado por (FechaHora, ID): cada página es una búsqueda en el índice, sin OFFSET
+CREATE INDEX IX_Movimientos_FechaHora ON Movimientos (FechaHora DESC, ID DESC) INCLUDE (Patente, TipoMovimiento);
+-- Historial de una patente (filtro por prefijo)
+CREATE INDEX IX_Movimientos_Patente ON Movimientos (Patente, FechaHora DESC, ID DESC) INCLUDE (TipoMovimiento);
+-- Vehículos dentro: el índice filtrado solo contiene los que están en el estacionamiento
+CREATE INDEX IX_Vehiculos_Dentro ON Vehiculos (Patente) INCLUDE (UltimoMovimiento, RUT_Persona) WHERE Estado = 'Dentro';
+-- JOIN Persona por dueño y desvinculación de vehículos al eliminar una persona
+CREATE INDEX IX_Vehiculos_RUT_Persona ON Vehiculos (RUT_Persona) WHERE RUT_Persona IS NOT NULL;
+-- Verificación de la clave foránea al eliminar un rol y JOIN con Rol
+CREATE INDEX IX_Persona_ID_Rol ON Persona (ID_Rol) WHERE ID_Rol IS NOT NULL;
+-- Combo de asignación: personas activas ordenadas por apellido
+CREATE INDEX IX_Persona_Activas ON Persona (Apellido, Nombre) INCLUDE (RUT) WHERE Activo = 1;
+GO
+
+-- Agregados de analitica.py, mantenidos de forma incremental a partir de Movimientos
+CREATE TABLE OcupacionHoraria (
+    Hora DATETIME PRIMARY KEY,
+    Entradas INT NOT NULL,
+    Salidas INT NOT NULL,
+    OcupacionMaxima INT NOT NULL,
+    OcupacionFinal INT NOT NULL
 );
 
-CREATE TABLE Persona (
-    RUT NVARCHAR(12) PRIMARY KEY,
-    Nombre NVARCHAR(100) NOT NULL,
-    Apellido NVARCHAR(100) NOT NULL,
-    Telefono NVARCHAR(20) NULL,
-    ID_Rol INT NULL,
-    Activo BIT NOT NULL DEFAULT 1,
-    CONSTRAINT FK_Persona_Rol FOREIGN KEY (ID_Rol) REFERENCES Rol(ID)
+-- ID_Rol = 0: vehículos sin dueño o dueños sin rol
+CREATE TABLE EstadiaDiaria (
+    Dia DATE NOT NULL,
+    ID_Rol INT NOT NULL,
+    Estadias INT NOT NULL,
+    SegundosTotales BIGINT NOT NULL,
+    SegundosMaximos INT NOT NULL,
+    PRIMARY KEY (Dia, ID_Rol)
+);
+
+CREATE TABLE ProgresoAnalitica (
+    Clave NVARCHAR(50) PRIMARY KEY,
+    UltimoID INT NOT NULL
 );
+GO
+
+-- Contadores que incrementan las escrituras de core.py sobre Vehiculos, Persona y Rol: la GUI
+-- detecta cambios leyendo estas tres filas en vez de recorrer las tablas
+CREATE TABLE MarcasCambios (
+    Tabla NVARCHAR(20) PRIMARY KEY,
+    Version BIGINT NOT NULL DEFAULT 0
+);
+INSERT INTO MarcasCambios (Tabla) VALUES ('vehiculos'), ('personas'), ('roles');
+GO
+
+-- Alterna Entrada/Salida de una patente en una sola operación atómica (un solo round trip).
+-- Devuelve una fila con el TipoMovimiento registrado, o ninguna fila si la patente ya tuvo
+-- un movimiento hace menos de @VentanaSegundos (lectura duplicada, aunque venga de otro proceso)
+-- o uno posterior a @FechaHora (evento fuera de orden: el estado solo avanza en el tiempo).
+CREATE OR ALTER PROCEDURE dbo.sp_RegistrarMovimiento
+    @Patente NVARCHAR(10),
+    @FechaHora DATETIME,
+    @VentanaSegundos INT = 10
+AS
+BEGIN
+    SET NOCOUNT ON;
+    SET XACT_ABORT ON;
+    -- OUTPUT INTO no admite tablas destino con restricciones CHECK (Movimientos): se pasa por una variable de tabla
+    DECLARE @Registrado TABLE (TipoMovimiento NVARCHAR(10) NOT NULL);
+
+    BEGIN TRANSACTION;
+    -- HOLDLOCK serializa los MERGE concurrentes sobre la misma patente (dos cámaras a la vez)
+    MERGE Vehiculos WITH (HOLDLOCK) AS v
+    USING (SELECT @Patente AS Patente) AS s
+        ON v.Patente = s.Patente
+    WHEN MATCHED AND v.UltimoMovimiento <= DATEADD(SECOND, -@VentanaSegundos, @FechaHora) THEN
+        UPDATE SET Estado = CASE v.Estado WHEN 'Dentro' THEN 'Fuera' ELSE 'Dentro' END,
+                   UltimoMovimiento = @FechaHora
+    WHEN NOT MATCHED THEN
+        INSERT (Patente, Estado, UltimoMovimiento) VALUES (@Patente, 'Dentro', @FechaHora)
+    OUTPUT CASE inserted.Estado WHEN 'Dentro' THEN 'Entrada' ELSE 'Salida' END INTO @Registrado (TipoMovimiento);
 
+    INSERT INTO Movimientos (Patente, TipoMovimiento, FechaHora)
+    SELECT @Patente, TipoMovimiento, @FechaHora FROM @Registrado;
+    COMMIT TRANSACTION;
 
+    SELECT TipoMovimiento FROM @Registrado;
+END
+GO
@@ -0,0 +1,214 @@
+"""
+Reportes de ocupación y estadías a partir de tablas de agregados que se mantienen de forma incremental:
+cada actualización procesa solo los movimientos con ID mayor al último procesado, así los reportes
+nunca recorren todo Movimientos.
+- OcupacionHoraria: entradas, salidas, ocupación máxima y ocupación al cierre de cada hora, calculadas
+  con una suma acumulada (SUM() OVER) de +1/-1 desde la ocupación de la hora anterior.
+- EstadiaDiaria: estadías por día de salida y rol del dueño; cada Salida se empareja con el movimiento
+  anterior de su patente con LAG() OVER (PARTITION BY Patente).
+
+    python analitica.py               # Procesa los movimientos nuevos
+    python analitica.py --recalcular  # Rehace los agregados desde cero
+"""
+import argparse
+import collections
+import datetime
+import sys
+from db_config import conexion_bd
+
+HoraOcupacion = collections.namedtuple('HoraOcupacion', 'hora entradas salidas ocupacion_maxima ocupacion_final')
+EstadiaRol = collections.namedtuple('EstadiaRol', 'rol estadias promedio_min maxima_min')
+HoraPunta = collections.namedtuple('HoraPunta', 'hora entradas_por_dia ocupacion_maxima')
+
+# Rehace las horas desde @Desde: un movimiento reenviado tarde (bitácora local) puede caer en una hora ya calculada
+_SQL_OCUPACION = """
+SET NOCOUNT ON;
+DECLARE @Desde DATETIME = ?, @Hasta INT = ?;
+DECLARE @Base INT = ISNULL((SELECT TOP (1) OcupacionFinal FROM OcupacionHoraria WHERE Hora < @Desde ORDER BY Hora DESC), 0);
+DELETE FROM OcupacionHoraria WHERE Hora >= @Desde;
+WITH Deltas AS (
+    SELECT DATEADD(HOUR, DATEDIFF(HOUR, 0, FechaHora), 0) AS Hora, TipoMovimiento,
+           @Base + SUM(CASE TipoMovimiento WHEN 'Entrada' THEN 1 ELSE -1 END)
+               OVER (ORDER BY FechaHora, ID ROWS UNBOUNDED PRECEDING) AS Ocupacion,
+           ROW_NUMBER() OVER (PARTITION BY DATEADD(HOUR, DATEDIFF(HOUR, 0, FechaHora), 0)
+                              ORDER BY FechaHora DESC, ID DESC) AS DesdeElFinal
+    FROM Movimientos
+    WHERE FechaHora >= @Desde AND ID <= @Hasta
+)
+INSERT INTO OcupacionHoraria (Hora, Entradas, Salidas, OcupacionMaxima, OcupacionFinal)
+SELECT Hora,
+       SUM(CASE TipoMovimiento WHEN 'Entrada' THEN 1 ELSE 0 END),
+       SUM(CASE TipoMovimiento WHEN 'Salida' THEN 1 ELSE 0 END),
+       MAX(Ocupacion),
+       MAX(CASE WHEN DesdeElFinal = 1 THEN Ocupacion END)
+FROM Deltas
+GROUP BY Hora;
+"""
+
+# La Entrada de una Salida nueva puede haberse procesado antes: se agrega el último movimiento ya
+# procesado de cada patente afectada y LAG() empareja sobre ese conjunto. Por patente, el orden de ID
+# coincide con el de FechaHora (sp_RegistrarMovimiento ignora movimientos más antiguos que el último).
+_SQL_ESTADIAS = """
+SET NOCOUNT ON;
+DECLARE @Desde INT = ?, @Hasta INT = ?;
+WITH Nuevos AS (
+    SELECT ID, Patente, TipoMovimiento, FechaHora FROM Movimientos WHERE ID > @Desde AND ID <= @Hasta
+),
+Previos AS (
+    SELECT p.ID, p.Patente, p.TipoMovimiento, p.FechaHora
+    FROM (SELECT DISTINCT Patente FROM Nuevos) a
+    CROSS APPLY (SELECT TOP (1) m.ID, m.Patente, m.TipoMovimiento, m.FechaHora FROM Movimientos m
+                 WHERE m.Patente = a.Patente AND m.ID <= @Desde
+                 ORDER BY m.FechaHora DESC, m.ID DESC) p
+),
+Pares AS (
+    SELECT ID, Patente, TipoMovimiento, FechaHora,
+           LAG(TipoMovimiento) OVER (PARTITION BY Patente ORDER BY FechaHora, ID) AS TipoAnterior,
+           LAG(FechaHora) OVER (PARTITION BY Patente ORDER BY FechaHora, ID) AS FechaAnterior
+    FROM (SELECT * FROM Nuevos UNION ALL SELECT * FROM Previos) m
+),
+Estadias AS (
+    SELECT CAST(pa.FechaHora AS DATE) AS Dia, ISNULL(pe.ID_Rol, 0) AS ID_Rol,
+           DATEDIFF(SECOND, pa.FechaAnterior, pa.FechaHora) AS Segundos
+    FROM Pares pa
+    LEFT JOIN Vehiculos v ON v.Patente = pa.Patente
+    LEFT JOIN Persona pe ON pe.RUT = v.RUT_Persona
+    WHERE pa.ID > @Desde AND pa.TipoMovimiento = 'Salida' AND pa.TipoAnterior = 'Entrada'
+)
+MERGE EstadiaDiaria AS d
+USING (SELECT Dia, ID_Rol, COUNT(*) AS Estadias, SUM(CAST(Segundos AS BIGINT)) AS Segundos, MAX(Segundos) AS Maximo
+       FROM Estadias GROUP BY Dia, ID_Rol) AS e
+    ON d.Dia = e.Dia AND d.ID_Rol = e.ID_Rol
+WHEN MATCHED THEN UPDATE SET
+    Estadias = d.Estadias + e.Estadias,
+    SegundosTotales = d.SegundosTotales + e.Segundos,
+    SegundosMaximos = CASE WHEN e.Maximo > d.SegundosMaximos THEN e.Maximo ELSE d.SegundosMaximos END
+WHEN NOT MATCHED THEN
+    INSERT (Dia, ID_Rol, Estadias, SegundosTotales, SegundosMaximos) VALUES (e.Dia, e.ID_Rol, e.Estadias, e.Segundos, e.Maximo);
+"""
+
+def _inicio_de_hora(fecha_hora):
+    return fecha_hora.replace(minute=0, second=0, microsecond=0)
+
+def actualizar_agregados(recalcular=False):
+    """
+    Incorpora a los agregados los movimientos registrados desde la última actualización, en una sola
+    transacción. Un bloqueo de aplicación evita que dos procesos cuenten dos veces los mismos movimientos.
+    :param recalcular: Borra los agregados y los rehace con todo el historial.
+    :return: (success, msg)
+    """
+    try:
+        with conexion_bd() as conn:
+            if not conn: return False, "Sin conexión a BD"
+            cursor = conn.cursor()
+            cursor.execute("EXEC sp_getapplock @Resource = 'analitica', @LockMode = 'Exclusive', "
+                           "@LockOwner = 'Transaction', @LockTimeout = 30000")
+            if recalcular:
+                cursor.execute("DELETE FROM OcupacionHoraria; DELETE FROM EstadiaDiaria; DELETE FROM ProgresoAnalitica")
+            row = cursor.execute("SELECT UltimoID FROM ProgresoAnalitica WHERE Clave = 'movimientos'").fetchone()
+            desde = row.UltimoID if row else 0
+            hasta, primera_fecha = cursor.execute(
+                "SELECT MAX(ID), MIN(FechaHora) FROM Movimientos WHERE ID > ?", (desde,)
+            ).fetchone()
+            if hasta is None:
+                conn.commit()
+                return True, "Los reportes están al día."
+            cursor.execute(_SQL_OCUPACION, (_inicio_de_hora(primera_fecha), hasta))
+            cursor.execute(_SQL_ESTADIAS, (desde, hasta))
+            cursor.execute("""
+                MERGE ProgresoAnalitica AS p USING (SELECT 'movimientos' AS Clave) AS s ON p.Clave = s.Clave
+                WHEN MATCHED THEN UPDATE SET UltimoID = ?
+                WHEN NOT MATCHED THEN INSERT (Clave, UltimoID) VALUES ('movimientos', ?);
+            """, (hasta, hasta))
+            conn.commit()
+            return True, f"Reportes actualizados hasta el movimiento {hasta}."
+    except Exception as e:
+        print(f"❌ Error al actualizar los agregados de reportes: {e}")
+        return False, str(e)
+
+def obtener_ocupacion_horaria(desde, hasta):
+    """
+    Curva de ocupación por hora en [desde, hasta). Las horas sin movimientos, que no tienen fila en
+    OcupacionHoraria, se completan con la ocupación con que cerró la hora anterior.
+    :return: Lista de HoraOcupacion, una por hora del rango.
+    """
+    try:
+        with conexion_bd() as conn:
+            if not conn: return []
+            cursor = conn.cursor()
+            row = cursor.execute("SELECT TOP (1) OcupacionFinal FROM OcupacionHoraria WHERE Hora < ? ORDER BY Hora DESC",
+                                 (desde,)).fetchone()
+            ocupacion = row.OcupacionFinal if row else 0
+            cursor.execute("""
+                SELECT Hora, Entradas, Salidas, OcupacionMaxima, OcupacionFinal FROM OcupacionHoraria
+                WHERE Hora >= ? AND Hora < ? ORDER BY Hora
+            """, (desde, hasta))
+            por_hora = {r.Hora: HoraOcupacion(*r) for r in cursor.fetchall()}
+    except Exception as e:
+        print(f"❌ Error al obtener la ocupación por hora: {e}")
+        return []
+    horas = []
+    hora = _inicio_de_hora(desde)
+    while hora < hasta:
+        fila = por_hora.get(hora) or HoraOcupacion(hora, 0, 0, ocupacion, ocupacion)
+        horas.append(fila)
+        ocupacion = fila.ocupacion_final
+        hora += datetime.timedelta(hours=1)
+    return horas
+
+def obtener_estadia_por_rol(desde, hasta):
+    """Estadías terminadas en [desde, hasta) por rol del dueño: cantidad, promedio y máxima en minutos."""
+    sql = """
+        SELECT ISNULL(r.Nombre, 'Sin rol / sin dueño') AS Rol, SUM(e.Estadias) AS Estadias,
+               SUM(e.SegundosTotales) / 60.0 / SUM(e.Estadias) AS PromedioMin, MAX(e.SegundosMaximos) / 60.0 AS MaximaMin
+        FROM EstadiaDiaria e
+        LEFT JOIN Rol r ON r.ID = e.ID_Rol
+        WHERE e.Dia >= ? AND e.Dia < ?
+        GROUP BY ISNULL(r.Nombre, 'Sin rol / sin dueño')
+        ORDER BY Estadias DESC
+    """
+    try:
+        with conexion_bd() as conn:
+            if not conn: return []
+            cursor = conn.cursor()
+            cursor.execute(sql, (desde.date(), hasta.date()))
+            return [EstadiaRol(*row) for row in cursor.fetchall()]
+    except Exception as e:
+        print(f"❌ Error al obtener las estadías por rol: {e}")
+        return []
+
+def obtener_horas_punta(desde, hasta):
+    """
+    Horas del día ordenadas de mayor a menor ocupación máxima en [desde, hasta), con el promedio de
+    entradas por día en cada hora.
+    """
+    dias = max(1, (hasta - desde).days)
+    sql = """
+        SELECT DATEPART(HOUR, Hora) AS Hora, SUM(Entradas) * 1.0 / ? AS EntradasPorDia, MAX(OcupacionMaxima) AS OcupacionMaxima
+        FROM OcupacionHoraria
+        WHERE Hora >= ? AND Hora < ?
+        GROUP BY DATEPART(HOUR, Hora)
+        ORDER BY OcupacionMaxima DESC, EntradasPorDia DESC
+    """
+    try:
+        with conexion_bd() as conn:
+            if not conn: return []
+            cursor = conn.cursor()
+            cursor.execute(sql, (dias, desde, hasta))
+            return [HoraPunta(*row) for row in cursor.fetchall()]
+    except Exception as e:
+        print(f"❌ Error al obtener las horas punta: {e}")
+        return []
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--recalcular', action='store_true', help="Borrar los agregados y rehacerlos con todo el historial")
+    args = parser.parse_args()
+    from migraciones import migrar_al_iniciar
+    migrar_al_iniciar()
+    success, msg = actualizar_agregados(recalcular=args.recalcular)
+    print(msg)
+    sys.exit(0 if success else 1)
+
+if __name__ == "__main__":
+    main()
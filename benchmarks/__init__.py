@@ -0,0 +1,5 @@
+"""
+Scripts de medición de rendimiento. Se ejecutan desde la raíz del proyecto, por ejemplo:
+
+    python -m benchmarks.arranque
+"""
@@ -0,0 +1,49 @@
+"""
+Compara el tiempo de arranque de la GUI con carga diferida de modelos frente a la carga
+anticipada que hacía core.py al importarse (YOLO + EasyOCR construidos antes de mostrar la ventana).
+
+Cada escenario se mide en un intérprete nuevo para que no se reutilicen módulos ya importados.
+
+    python -m benchmarks.arranque --repeticiones 5
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+
+ESCENARIOS = {
+    'core (solo CRUD)': "import core",
+    'gui (carga diferida)': "import gui",
+    'gui + modelos (carga anticipada)': "import gui, vision; vision.obtener_modelo(); vision.obtener_ocr()",
+}
+
+def medir(sentencia):
+    """Ejecuta la sentencia en un proceso nuevo y devuelve los segundos que tardó."""
+    codigo = (
+        "import time; _t = time.perf_counter()\n"
+        f"{sentencia}\n"
+        "print(time.perf_counter() - _t)"
+    )
+    salida = subprocess.run([sys.executable, "-c", codigo], capture_output=True, text=True, check=True)
+    return float(salida.stdout.strip().splitlines()[-1])
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeticiones', type=int, default=3)
+    parser.add_argument('--json', action='store_true', help="Imprimir los resultados en JSON")
+    args = parser.parse_args()
+
+    resultados = {}
+    for nombre, sentencia in ESCENARIOS.items():
+        tiempos = [medir(sentencia) for _ in range(args.repeticiones)]
+        resultados[nombre] = {'mediana_s': statistics.median(tiempos), 'min_s': min(tiempos), 'max_s': max(tiempos)}
+
+    if args.json:
+        print(json.dumps(resultados, indent=2, ensure_ascii=False))
+        return
+    for nombre, r in resultados.items():
+        print(f"{nombre:<35} mediana {r['mediana_s']:.3f} s  (min {r['min_s']:.3f} s, max {r['max_s']:.3f} s)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""
+Sustituto de pyodbc sobre SQLite en memoria, para medir la capa de base de datos sin SQL Server.
+Implementa solo lo que usan registrar_movimiento_patente y el pool de conexiones: connect(), cursores
+con execute/fetchone/fetchall, commit/rollback y dbo.sp_RegistrarMovimiento, reescrito en Python con
+la lógica de migraciones.py (alternar Dentro/Fuera e ignorar lecturas dentro de la ventana de duplicados).
+Sirve para comparar el costo del lado de la aplicación entre versiones, no los tiempos de SQL Server;
+`latencia_ms` agrega un round trip de red simulado a cada execute. No ejecuta el T-SQL del procedimiento:
+que la medición funcione no prueba que dbo.sp_RegistrarMovimiento compile o corra en SQL Server.
+
+    from benchmarks import bd_falsa
+    bd_falsa.instalar() # Antes de importar db_config o core
+"""
+import datetime
+import sqlite3
+import sys
+import time
+
+class Error(Exception):
+    pass
+
+class InterfaceError(Error):
+    pass
+
+class DatabaseError(Error):
+    pass
+
+class OperationalError(DatabaseError):
+    pass
+
+class IntegrityError(DatabaseError):
+    pass
+
+class ProgrammingError(DatabaseError):
+    pass
+
+_URI = 'file:bd_falsa?mode=memory&cache=shared' # La misma base para todas las conexiones del proceso
+_ESQUEMA = """
+CREATE TABLE IF NOT EXISTS Vehiculos (
+    Patente TEXT PRIMARY KEY, Estado TEXT NOT NULL, UltimoMovimiento TEXT NOT NULL, RUT_Persona TEXT);
+CREATE TABLE IF NOT EXISTS Movimientos (
+    ID INTEGER PRIMARY KEY AUTOINCREMENT, Patente TEXT NOT NULL, TipoMovimiento TEXT NOT NULL, FechaHora TEXT NOT NULL);
+"""
+
+_ancla = None # Conexión que mantiene viva la base en memoria aunque el pool cierre las suyas
+_latencia = 0.0
+
+def instalar(latencia_ms=0.0):
+    """Reemplaza pyodbc por este módulo (sys.modules) y deja la base vacía. Llamar antes de importar db_config."""
+    global _ancla, _latencia
+    _latencia = latencia_ms / 1000
+    if _ancla is None:
+        _ancla = sqlite3.connect(_URI, uri=True, check_same_thread=False)
+        _ancla.executescript(_ESQUEMA)
+    reiniciar()
+    sys.modules['pyodbc'] = sys.modules[__name__]
+
+def reiniciar():
+    """Borra vehículos y movimientos, para que cada medición empiece con la base vacía."""
+    with _ancla:
+        _ancla.execute("DELETE FROM Movimientos")
+        _ancla.execute("DELETE FROM Vehiculos")
+
+def movimientos_registrados():
+    return _ancla.execute("SELECT COUNT(*) FROM Movimientos").fetchone()[0]
+
+def connect(cadena_conexion=None, timeout=None, **kwargs):
+    return Conexion()
+
+def _sp_registrar_movimiento(conn, patente, fecha_hora, ventana_segundos=10):
+    """dbo.sp_RegistrarMovimiento: una fila con el TipoMovimiento registrado, o ninguna si es un duplicado."""
+    fila = conn.execute("SELECT Estado, UltimoMovimiento FROM Vehiculos WHERE Patente = ?", (patente,)).fetchone()
+    fecha = fecha_hora.isoformat(sep=' ')
+    if fila is None:
+        estado = 'Dentro'
+        conn.execute("INSERT INTO Vehiculos (Patente, Estado, UltimoMovimiento) VALUES (?, ?, ?)", (patente, estado, fecha))
+    elif datetime.datetime.fromisoformat(fila[1]) <= fecha_hora - datetime.timedelta(seconds=ventana_segundos):
+        estado = 'Fuera' if fila[0] == 'Dentro' else 'Dentro'
+        conn.execute("UPDATE Vehiculos SET Estado = ?, UltimoMovimiento = ? WHERE Patente = ?", (estado, fecha, patente))
+    else:
+        return []
+    tipo = 'Entrada' if estado == 'Dentro' else 'Salida'
+    conn.execute("INSERT INTO Movimientos (Patente, TipoMovimiento, FechaHora) VALUES (?, ?, ?)", (patente, tipo, fecha))
+    return [(tipo,)]
+
+class Conexion:
+    def __init__(self):
+        self._conn = sqlite3.connect(_URI, uri=True, check_same_thread=False)
+
+    def cursor(self):
+        return Cursor(self._conn)
+
+    def commit(self):
+        self._conn.commit()
+
+    def rollback(self):
+        self._conn.rollback()
+
+    def close(self):
+        self._conn.close()
+
+class Cursor:
+    def __init__(self, conn):
+        self._conn = conn
+        self._filas = []
+        self.fast_executemany = False
+
+    def execute(self, sql, params=()):
+        if _latencia:
+            time.sleep(_latencia)
+        try:
+            if sql.strip().upper().startswith('EXEC DBO.SP_REGISTRARMOVIMIENTO'):
+                self._filas = _sp_registrar_movimiento(self._conn, *params)
+            else:
+                self._filas = self._conn.execute(sql.replace('GETDATE()', 'CURRENT_TIMESTAMP'), params).fetchall()
+        except sqlite3.IntegrityError as e:
+            raise IntegrityError('23000', str(e))
+        except sqlite3.Error as e:
+            raise ProgrammingError('42000', f"{e} (la base falsa no implementa esta sentencia)")
+        return self
+
+    def fetchone(self):
+        return self._filas.pop(0) if self._filas else None
+
+    def fetchall(self):
+        filas, self._filas = self._filas, []
+        return filas
+
+    def nextset(self):
+        return False
+
+    def close(self):
+        pass
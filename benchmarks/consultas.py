@@ -0,0 +1,171 @@
+"""
+Mide las consultas frecuentes de la aplicación contra SQL Server: tiempo (mediana y p95) y lecturas
+lógicas (SET STATISTICS IO), con los índices de migraciones.py y, con --sin-indices, también con esos
+índices deshabilitados, para confirmar que el plan mejora.
+
+Usar una base de pruebas: --sembrar inserta datos sintéticos en la base indicada.
+
+    python -m benchmarks.consultas --base EstacionamientoPruebas --sembrar 20000 --movimientos 2000000
+    python -m benchmarks.consultas --base EstacionamientoPruebas --sin-indices --json
+"""
+import argparse
+import datetime
+import json
+import random
+import re
+import statistics
+import time
+from db_config import obtener_config, get_connection
+from migraciones import aplicar_migraciones
+from benchmarks.sinteticos import patente_aleatoria
+
+# Las mismas formas de consulta que usan core.py y la GUI
+CONSULTAS = {
+    'ocupacion': ("SELECT COUNT(*) FROM Vehiculos WHERE Estado = 'Dentro'", ()),
+    'vehiculos_dentro': ("""
+        SELECT v.Patente, p.Nombre, p.Apellido FROM Vehiculos v
+        LEFT JOIN Persona p ON v.RUT_Persona = p.RUT
+        WHERE v.Estado = 'Dentro' ORDER BY v.UltimoMovimiento DESC""", ()),
+    'historial_primera_pagina': ("""
+        SELECT TOP (101) ID, Patente, TipoMovimiento, FechaHora FROM Movimientos
+        ORDER BY FechaHora DESC, ID DESC""", ()),
+    'historial_hace_90_dias': ("""
+        SELECT TOP (101) ID, Patente, TipoMovimiento, FechaHora FROM Movimientos
+        WHERE (FechaHora < ? OR (FechaHora = ? AND ID < ?)) ORDER BY FechaHora DESC, ID DESC""", 'hace_90_dias'),
+    'historial_patente': ("""
+        SELECT TOP (101) ID, Patente, TipoMovimiento, FechaHora FROM Movimientos
+        WHERE Patente LIKE ? ORDER BY FechaHora DESC, ID DESC""", 'prefijo_patente'),
+    'historial_salidas_dia': ("""
+        SELECT TOP (101) ID, Patente, TipoMovimiento, FechaHora FROM Movimientos
+        WHERE FechaHora >= ? AND FechaHora < ? AND TipoMovimiento = 'Salida'
+        ORDER BY FechaHora DESC, ID DESC""", 'un_dia'),
+    'vehiculos_de_persona': ("SELECT Patente FROM Vehiculos WHERE RUT_Persona = ?", 'rut'),
+    'personas_activas': ("SELECT RUT, Nombre, Apellido FROM Persona WHERE Activo = 1 ORDER BY Apellido, Nombre", ()),
+    'marcas_cambios': ("SELECT 'movimientos', CAST(MAX(ID) AS BIGINT) FROM Movimientos UNION ALL SELECT Tabla, Version FROM MarcasCambios", ()),
+}
+
+def _parametros(cursor):
+    """Valores para las consultas parametrizadas, tomados de los datos que hay en la base."""
+    ahora = cursor.execute("SELECT MAX(FechaHora) FROM Movimientos").fetchone()[0] or datetime.datetime.now()
+    hace_90 = ahora - datetime.timedelta(days=90)
+    patente = cursor.execute("SELECT TOP (1) Patente FROM Vehiculos ORDER BY NEWID()").fetchone()
+    rut = cursor.execute("SELECT TOP (1) RUT_Persona FROM Vehiculos WHERE RUT_Persona IS NOT NULL").fetchone()
+    dia = datetime.datetime.combine(hace_90.date(), datetime.time())
+    return {
+        'hace_90_dias': (hace_90, hace_90, 2 ** 31 - 1),
+        'prefijo_patente': ((patente[0][:4] if patente else 'AB') + '%',),
+        'un_dia': (dia, dia + datetime.timedelta(days=1)),
+        'rut': (rut[0] if rut else '',),
+    }
+
+def _lecturas_logicas(cursor):
+    """Suma las 'logical reads' de los mensajes de SET STATISTICS IO del último execute."""
+    total = 0
+    for _, mensaje in getattr(cursor, 'messages', None) or []:
+        total += sum(int(n) for n in re.findall(r'logical reads (\d+)', str(mensaje)))
+    return total
+
+def medir(cursor, repeticiones):
+    parametros = _parametros(cursor)
+    resultados = {}
+    for nombre, (sql, clave) in CONSULTAS.items():
+        valores = parametros[clave] if isinstance(clave, str) else clave
+        tiempos, lecturas = [], 0
+        for _ in range(repeticiones):
+            inicio = time.perf_counter()
+            cursor.execute(sql, valores)
+            lecturas = _lecturas_logicas(cursor)
+            cursor.fetchall()
+            while cursor.nextset(): # Según el driver, STATISTICS IO llega después de las filas
+                lecturas += _lecturas_logicas(cursor)
+            tiempos.append((time.perf_counter() - inicio) * 1000)
+        tiempos.sort()
+        resultados[nombre] = {
+            'mediana_ms': statistics.median(tiempos),
+            'p95_ms': tiempos[min(len(tiempos) - 1, int(len(tiempos) * 0.95))],
+            'lecturas_logicas': lecturas,
+        }
+    return resultados
+
+def _indices(cursor):
+    """Índices no agrupados de las tablas de la aplicación (los que crean las migraciones)."""
+    return cursor.execute("""
+        SELECT OBJECT_NAME(object_id), name FROM sys.indexes
+        WHERE name LIKE 'IX[_]%' AND OBJECT_NAME(object_id) IN ('Vehiculos', 'Movimientos', 'Persona', 'Rol')
+    """).fetchall()
+
+def sembrar(conn, vehiculos, movimientos, rng):
+    """Inserta personas, vehículos y movimientos sintéticos repartidos en los últimos 180 días."""
+    cursor = conn.cursor()
+    cursor.fast_executemany = True
+    cursor.execute("IF NOT EXISTS (SELECT 1 FROM Rol WHERE Nombre = 'Prueba') INSERT INTO Rol (Nombre) VALUES ('Prueba')")
+    id_rol = cursor.execute("SELECT ID FROM Rol WHERE Nombre = 'Prueba'").fetchone()[0]
+    ruts = [f"{90000000 + i}-0" for i in range(max(1, vehiculos // 2))]
+    cursor.execute("DELETE FROM Movimientos; DELETE FROM Vehiculos; DELETE FROM Persona WHERE ID_Rol = ?", (id_rol,))
+    cursor.executemany("INSERT INTO Persona (RUT, Nombre, Apellido, ID_Rol, Activo) VALUES (?, ?, ?, ?, ?)",
+                       [(rut, f"Nombre{i}", f"Apellido{i}", id_rol, rng.random() < 0.9) for i, rut in enumerate(ruts)])
+    patentes = list({patente_aleatoria(rng) for _ in range(vehiculos * 2)})[:vehiculos]
+    ahora = datetime.datetime.now().replace(microsecond=0)
+    cursor.executemany("INSERT INTO Vehiculos (Patente, Estado, UltimoMovimiento, RUT_Persona) VALUES (?, ?, ?, ?)",
+                       [(p, 'Dentro' if rng.random() < 0.05 else 'Fuera', ahora, rng.choice(ruts) if rng.random() < 0.7 else None)
+                        for p in patentes])
+    inicio = ahora - datetime.timedelta(days=180)
+    for desde in range(0, movimientos, 50000):
+        lote = sorted(inicio + datetime.timedelta(seconds=rng.randrange(180 * 86400)) for _ in range(min(50000, movimientos - desde)))
+        cursor.executemany("INSERT INTO Movimientos (Patente, TipoMovimiento, FechaHora) VALUES (?, ?, ?)",
+                           [(rng.choice(patentes), rng.choice(('Entrada', 'Salida')), fecha) for fecha in lote])
+        conn.commit()
+    cursor.execute("UPDATE STATISTICS Movimientos; UPDATE STATISTICS Vehiculos; UPDATE STATISTICS Persona")
+    conn.commit()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--base', help="Base de datos a usar en vez de la de config.ini")
+    parser.add_argument('--sembrar', type=int, metavar='VEHICULOS', help="Borrar y cargar datos sintéticos con N vehículos")
+    parser.add_argument('--movimientos', type=int, default=1000000, help="Movimientos a sembrar")
+    parser.add_argument('--repeticiones', type=int, default=20)
+    parser.add_argument('--sin-indices', action='store_true', help="Medir también con los índices IX_* deshabilitados")
+    parser.add_argument('--semilla', type=int, default=0)
+    parser.add_argument('--json', action='store_true', help="Imprimir los resultados en JSON")
+    args = parser.parse_args()
+    if args.base:
+        obtener_config().set('database', 'database', args.base)
+
+    success, msg = aplicar_migraciones()
+    if not success:
+        raise SystemExit(f"❌ {msg}")
+    conn = get_connection()
+    if conn is None:
+        raise SystemExit(1)
+    if args.sembrar:
+        sembrar(conn, args.sembrar, args.movimientos, random.Random(args.semilla))
+    cursor = conn.cursor()
+    cursor.execute("SET STATISTICS IO ON")
+
+    resultados = {'con_indices': medir(cursor, args.repeticiones)}
+    if args.sin_indices:
+        indices = _indices(cursor)
+        try:
+            for tabla, nombre in indices:
+                cursor.execute(f"ALTER INDEX {nombre} ON {tabla} DISABLE")
+            conn.commit()
+            resultados['sin_indices'] = medir(cursor, args.repeticiones)
+        finally:
+            for tabla, nombre in indices:
+                cursor.execute(f"ALTER INDEX {nombre} ON {tabla} REBUILD")
+            conn.commit()
+    conn.close()
+
+    if args.json:
+        print(json.dumps(resultados, indent=2, ensure_ascii=False))
+        return
+    for nombre in CONSULTAS:
+        con = resultados['con_indices'][nombre]
+        linea = f"{nombre:<26} {con['mediana_ms']:8.2f} ms (p95 {con['p95_ms']:8.2f})  {con['lecturas_logicas']:>8} lecturas"
+        if 'sin_indices' in resultados:
+            sin = resultados['sin_indices'][nombre]
+            linea += f"   | sin índices {sin['mediana_ms']:8.2f} ms  {sin['lecturas_logicas']:>8} lecturas"
+        print(linea)
+
+if __name__ == "__main__":
+    main()
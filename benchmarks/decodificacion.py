@@ -0,0 +1,70 @@
+"""
+Mide cuánta CPU se ahorra al saltar frames con grab() en vez de decodificarlos todos con read():
+- read: cap.read() en cada frame y luego se descarta lo que no toca analizar (el bucle anterior);
+- grab: FuenteVideo.siguiente(decodificar=...) decodifica solo 1 de cada N frames.
+Sin video se graba uno sintético de 720p en un directorio temporal.
+
+    python -m benchmarks.decodificacion img/VideoFuncional.mp4 --intervalos 1 3 5 10
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+import cv2
+from fuente_video import FuenteVideo
+from benchmarks.sinteticos import video_sintetico
+
+def con_read(ruta, intervalo):
+    cap = cv2.VideoCapture(ruta)
+    n = 0
+    while True:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        if n % intervalo == 0:
+            pass # Aquí se analizaría el frame
+        n += 1
+    cap.release()
+    return n
+
+def con_grab(ruta, intervalo):
+    with FuenteVideo(ruta) as fuente:
+        n = 0
+        while fuente.siguiente(decodificar=n % intervalo == 0)[0]:
+            n += 1
+    return n
+
+def medir(funcion, ruta, intervalo):
+    cpu, pared = time.process_time(), time.perf_counter()
+    frames = funcion(ruta, intervalo)
+    return {'frames': frames, 'cpu_s': time.process_time() - cpu, 'pared_s': time.perf_counter() - pared}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('video', nargs='?', help="Video a recorrer (por defecto, uno sintético)")
+    parser.add_argument('--intervalos', type=int, nargs='+', default=[1, 2, 3, 5, 10])
+    parser.add_argument('--json', action='store_true', help="Imprimir los resultados en JSON")
+    args = parser.parse_args()
+
+    cv2.setNumThreads(1) # Comparar el costo de CPU de un solo hilo
+    with tempfile.TemporaryDirectory() as tmp:
+        ruta = args.video
+        if ruta is None:
+            ruta = os.path.join(tmp, 'sintetico.mp4')
+            video_sintetico(ruta)
+        resultados = {}
+        for intervalo in args.intervalos:
+            read, grab = medir(con_read, ruta, intervalo), medir(con_grab, ruta, intervalo)
+            resultados[intervalo] = {'read': read, 'grab': grab,
+                                     'ahorro_cpu': 1 - grab['cpu_s'] / read['cpu_s'] if read['cpu_s'] else 0.0}
+
+    if args.json:
+        print(json.dumps(resultados, indent=2))
+        return
+    print(f"{'1 de N':>7} {'read CPU (s)':>13} {'grab CPU (s)':>13} {'ahorro':>8}")
+    for intervalo, r in resultados.items():
+        print(f"{intervalo:>7} {r['read']['cpu_s']:>13.2f} {r['grab']['cpu_s']:>13.2f} {r['ahorro_cpu']:>8.0%}")
+
+if __name__ == "__main__":
+    main()
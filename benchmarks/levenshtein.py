@@ -0,0 +1,71 @@
+"""
+Compara la verificación de similitud entre patentes (distancia <= 1):
+- por par: levenshtein_distance completa frente a distancia_maxima_uno;
+- contra N patentes conocidas: un bucle de son_patentes_similares frente a IndicePatentes (NumPy).
+
+    python -m benchmarks.levenshtein --conocidas 1000 10000 100000
+"""
+import argparse
+import json
+import random
+import time
+from core import levenshtein_distance, distancia_maxima_uno, son_patentes_similares, IndicePatentes
+from benchmarks.sinteticos import patente_aleatoria, lectura_ruidosa
+
+def medir_us(funcion, repeticiones):
+    inicio = time.perf_counter()
+    for _ in range(repeticiones):
+        funcion()
+    return (time.perf_counter() - inicio) * 1e6 / repeticiones
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--pares', type=int, default=50000)
+    parser.add_argument('--conocidas', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--lecturas', type=int, default=50)
+    parser.add_argument('--semilla', type=int, default=0)
+    parser.add_argument('--json', action='store_true', help="Imprimir los resultados en JSON")
+    args = parser.parse_args()
+    rng = random.Random(args.semilla)
+
+    pares = []
+    for _ in range(args.pares):
+        patente = patente_aleatoria(rng)
+        otra = patente if rng.random() < 0.5 else patente_aleatoria(rng)
+        pares.append((patente, lectura_ruidosa(otra, rng)))
+    assert all((levenshtein_distance(a, b) <= 1) == distancia_maxima_uno(a, b) for a, b in pares)
+    it = iter(pares * 2)
+    resultados = {'por_par_us': {
+        'levenshtein_distance': medir_us(lambda: levenshtein_distance(*next(it)) <= 1, args.pares),
+        'distancia_maxima_uno': medir_us(lambda: distancia_maxima_uno(*next(it)), args.pares),
+    }, 'contra_conocidas_ms': {}}
+
+    for n in args.conocidas:
+        conocidas = [patente_aleatoria(rng) for _ in range(n)]
+        inicio = time.perf_counter()
+        indice = IndicePatentes(conocidas)
+        construccion_ms = (time.perf_counter() - inicio) * 1000
+        lecturas = [lectura_ruidosa(rng.choice(conocidas), rng) for _ in range(args.lecturas)]
+        for lectura in lecturas[:5]:
+            assert sorted(indice.similares(lectura)) == sorted(p for p in conocidas if son_patentes_similares(lectura, p))
+        def bucle(lectura):
+            return [p for p in conocidas if levenshtein_distance(lectura, p) <= 1]
+        it_bucle, it_indice = iter(lecturas), iter(lecturas)
+        resultados['contra_conocidas_ms'][str(n)] = {
+            'bucle_levenshtein': medir_us(lambda: bucle(next(it_bucle)), args.lecturas) / 1000,
+            'indice_numpy': medir_us(lambda: indice.similares(next(it_indice)), args.lecturas) / 1000,
+            'construccion_indice': construccion_ms,
+        }
+
+    if args.json:
+        print(json.dumps(resultados, indent=2))
+        return
+    print("Por par (µs):")
+    for nombre, us in resultados['por_par_us'].items():
+        print(f"  {nombre:<22} {us:8.2f}")
+    print("Una lectura contra N patentes conocidas (ms):")
+    for n, r in resultados['contra_conocidas_ms'].items():
+        print(f"  N={n:<8} bucle {r['bucle_levenshtein']:9.2f}   índice NumPy {r['indice_numpy']:7.3f}   (construcción {r['construccion_indice']:.1f})")
+
+if __name__ == "__main__":
+    main()
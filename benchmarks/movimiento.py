@@ -0,0 +1,73 @@
+"""
+Mide sobre un video el costo y la sensibilidad de la compuerta de movimiento frente al muestreo fijo:
+- cada_frame: YOLO en todos los frames (referencia de sensibilidad);
+- frame_skip_3: el muestreo fijo anterior de procesar_video;
+- movimiento: YOLO solo cuando DetectorMovimiento ve cambios en el ROI.
+Reporta tiempo de CPU, frames analizados y qué fracción de las patentes de la referencia se confirman.
+
+    python -m benchmarks.movimiento img/VideoFuncional.mp4
+"""
+import argparse
+import json
+import time
+from detectar_video import AnalizadorVideo
+from fuente_video import FuenteVideo
+from vision import obtener_modelo, obtener_ocr, crear_detector_movimiento, DetectorMovimiento, ParametrosDeteccion
+
+def recorrer(ruta, analizador):
+    """Procesa el video completo sin pausas ni dibujo. Devuelve (patentes confirmadas, cpu_s, pared_s, duracion_s)."""
+    fuente = FuenteVideo(ruta)
+    fps = fuente.fps
+    confirmadas = set()
+    n = 0
+    cpu, pared = time.process_time(), time.perf_counter()
+    while True:
+        analizar = analizador.muestrear()
+        ret, frame = fuente.siguiente(decodificar=analizar) # Los frames saltados no se decodifican
+        if not ret:
+            break
+        confirmadas.update(analizador.procesar(frame, instante=n / fps, muestreado=analizar)) # Tiempo del video para la expiración
+        n += 1
+    fuente.liberar()
+    return confirmadas, time.process_time() - cpu, time.perf_counter() - pared, n / fps
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('video', nargs='?', default='img/VideoFuncional.mp4')
+    parser.add_argument('--json', action='store_true', help="Imprimir los resultados en JSON")
+    args = parser.parse_args()
+
+    obtener_modelo() # La carga de los modelos no forma parte de la medición
+    obtener_ocr()
+    parametros = ParametrosDeteccion.desde_config(args.video)
+    modos = {
+        'cada_frame': lambda: AnalizadorVideo(frame_skip=1, parametros=parametros),
+        'frame_skip_3': lambda: AnalizadorVideo(frame_skip=3, parametros=parametros),
+        'movimiento': lambda: AnalizadorVideo(detector_movimiento=crear_detector_movimiento(parametros) or DetectorMovimiento(parametros.roi),
+                                              parametros=parametros),
+    }
+    resultados = {}
+    referencia = None
+    for nombre, crear in modos.items():
+        analizador = crear()
+        confirmadas, cpu_s, pared_s, duracion_s = recorrer(args.video, analizador)
+        referencia = confirmadas if referencia is None else referencia
+        resultados[nombre] = {
+            'frames': analizador.frames_vistos,
+            'frames_analizados': analizador.frames_analizados,
+            'cpu_s': cpu_s,
+            'cpu_por_segundo_de_video': cpu_s / duracion_s if duracion_s else 0.0,
+            'pared_s': pared_s,
+            'patentes': sorted(confirmadas),
+            'sensibilidad': len(confirmadas & referencia) / len(referencia) if referencia else 1.0,
+        }
+
+    if args.json:
+        print(json.dumps(resultados, indent=2))
+        return
+    print(f"{'modo':<14} {'analizados':>12} {'CPU (s)':>9} {'CPU/s video':>12} {'sensibilidad':>13}")
+    for nombre, r in resultados.items():
+        print(f"{nombre:<14} {r['frames_analizados']:>5}/{r['frames']:<6} {r['cpu_s']:>9.1f} {r['cpu_por_segundo_de_video']:>12.2f} {r['sensibilidad']:>13.0%}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""
+Compara la latencia de OCR por patente (CPU) entre la ruta anterior, que llamaba a
+ocr.readtext sobre cada recorte, y vision.leer_patentes_lote, que reconoce todos los
+recortes de un frame en una sola llamada.
+
+    python -m benchmarks.ocr_lotes --frames 20 --patentes-por-frame 1 2 3 5
+"""
+import argparse
+import json
+import random
+import statistics
+import time
+from vision import obtener_ocr, preprocesar_para_ocr, leer_patentes_lote, limpiar_texto_ocr
+from benchmarks.sinteticos import patente_aleatoria, imagen_patente
+
+def leer_por_recorte(imagenes):
+    """La ruta anterior: una llamada completa a readtext (detector + reconocedor) por recorte."""
+    ocr = obtener_ocr()
+    return [limpiar_texto_ocr(" ".join(ocr.readtext(img, detail=0, paragraph=True))) for img in imagenes]
+
+def medir(funcion, frames):
+    """Devuelve (ms por patente de cada frame, aciertos, total de patentes)."""
+    ms_por_patente = []
+    aciertos = total = 0
+    for textos_esperados, imagenes in frames:
+        inicio = time.perf_counter()
+        leidos = funcion(imagenes)
+        ms_por_patente.append((time.perf_counter() - inicio) * 1000 / len(imagenes))
+        aciertos += sum(a == b for a, b in zip(textos_esperados, leidos))
+        total += len(imagenes)
+    return ms_por_patente, aciertos, total
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--frames', type=int, default=20)
+    parser.add_argument('--patentes-por-frame', type=int, nargs='+', default=[1, 2, 3, 5])
+    parser.add_argument('--semilla', type=int, default=0)
+    parser.add_argument('--json', action='store_true', help="Imprimir los resultados en JSON")
+    args = parser.parse_args()
+
+    rng = random.Random(args.semilla)
+    obtener_ocr() # La carga del modelo no forma parte de la medición
+    resultados = {}
+    for n in args.patentes_por_frame:
+        frames = []
+        for _ in range(args.frames):
+            textos = [patente_aleatoria(rng) for _ in range(n)]
+            frames.append((textos, [preprocesar_para_ocr(imagen_patente(t)) for t in textos]))
+        leer_patentes_lote(frames[0][1]) # Calentamiento
+        for nombre, funcion in (('por_recorte', leer_por_recorte), ('lote', leer_patentes_lote)):
+            ms, aciertos, total = medir(funcion, frames)
+            resultados.setdefault(str(n), {})[nombre] = {
+                'ms_por_patente_mediana': statistics.median(ms),
+                'precision': aciertos / total,
+            }
+
+    if args.json:
+        print(json.dumps(resultados, indent=2))
+        return
+    print(f"{'patentes/frame':>14} {'por recorte (ms)':>17} {'lote (ms)':>10} {'acierto recorte':>16} {'acierto lote':>13}")
+    for n, r in resultados.items():
+        print(f"{n:>14} {r['por_recorte']['ms_por_patente_mediana']:>17.1f} {r['lote']['ms_por_patente_mediana']:>10.1f} "
+              f"{r['por_recorte']['precision']:>16.0%} {r['lote']['precision']:>13.0%}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,314 @@
+"""
+Suite de regresión de las rutas críticas del reconocimiento y el registro, sin GPU ni SQL Server:
+- preprocesar_para_ocr sobre recortes sintéticos (y, con --recortes, sobre recortes guardados de cámaras reales);
+- es_patente_valida y levenshtein_distance sobre lecturas con errores de OCR simulados;
+- confirmacion: ConfirmadorPatentes.registrar_lectura con varias lecturas por pista;
+- registrar_movimiento_patente contra benchmarks.bd_falsa (SQLite en memoria en lugar de pyodbc);
+- pipeline: un clip corto recorrido como detectar_lote (YOLO y EasyOCR en CPU), con latencia por etapa.
+
+Por etapa se informan p50/p90/p99/máximo por llamada, llamadas por segundo y el pico de memoria
+asignada (tracemalloc); del pipeline, frames/s. --salida guarda el JSON y --comparar lo contrasta con
+uno anterior: termina con código 1 si el p50 de alguna etapa empeoró más que --tolerancia.
+
+    python -m benchmarks.rutas_criticas --salida base.json
+    python -m benchmarks.rutas_criticas --recortes recortes/ --video img/VideoFuncional.mp4 --comparar base.json
+    python -m benchmarks.rutas_criticas --sin-pipeline --json
+"""
+import argparse
+import collections
+import contextlib
+import datetime
+import glob
+import io
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+import cv2
+import numpy as np
+from benchmarks import bd_falsa
+
+# La base falsa y una bitácora temporal tienen que estar listas antes de importar core, que crea el pool y
+# el escritor de movimientos al importarse: así la medición no toca SQL Server ni la bitácora de la instalación
+bd_falsa.instalar()
+from db_config import obtener_config
+_tmp = tempfile.TemporaryDirectory()
+obtener_config().set('bitacora', 'ruta', os.path.join(_tmp.name, 'bitacora.db'))
+
+from core import es_patente_valida, levenshtein_distance, crear_confirmador, registrar_movimiento_patente
+from vision import preprocesar_para_ocr
+from benchmarks.sinteticos import patente_aleatoria, lectura_ruidosa, imagen_patente, video_sintetico
+
+def percentiles(latencias):
+    """Resumen en ms de latencias en segundos (mismo criterio de percentil que benchmarks.consultas)."""
+    ordenadas = sorted(latencias)
+    def p(q):
+        return ordenadas[min(len(ordenadas) - 1, int(len(ordenadas) * q))] * 1000
+    return {'n': len(ordenadas), 'p50_ms': p(0.50), 'p90_ms': p(0.90), 'p99_ms': p(0.99), 'max_ms': ordenadas[-1] * 1000}
+
+def rss_maximo_mb():
+    """Pico de memoria residente del proceso, o None si el sistema no lo informa (Windows)."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return pico / 2 ** 20 if sys.platform == 'darwin' else pico / 1024 # bytes en macOS, KB en Linux
+
+def medir_etapa(preparar, lote=1):
+    """
+    :param preparar: Devuelve (funcion, argumentos) con estado nuevo; se llama una vez para medir tiempos
+                     y otra para medir memoria, así las etapas con estado (confirmador, base) parten igual.
+    :param lote: Llamadas por medición. Las funciones de microsegundos se miden en grupo para que el
+                 costo de perf_counter no pese más que la función; la latencia es el promedio del grupo.
+    """
+    funcion, argumentos = preparar()
+    latencias = []
+    inicio_total = time.perf_counter()
+    for i in range(0, len(argumentos), lote):
+        grupo = argumentos[i:i + lote]
+        inicio = time.perf_counter()
+        for args in grupo:
+            funcion(*args)
+        latencias.append((time.perf_counter() - inicio) / len(grupo))
+    resultado = percentiles(latencias)
+    resultado['n'] = len(argumentos)
+    resultado['por_segundo'] = len(argumentos) / (time.perf_counter() - inicio_total)
+
+    funcion, argumentos = preparar() # tracemalloc hace más lento el código: la memoria se mide en otra pasada
+    tracemalloc.start()
+    try:
+        for args in argumentos:
+            funcion(*args)
+        resultado['memoria_pico_kb'] = tracemalloc.get_traced_memory()[1] / 1024
+    finally:
+        tracemalloc.stop()
+    return resultado
+
+def recortes_de_prueba(directorio, cantidad, rng):
+    """Recortes sintéticos de distintos tamaños más los .jpg/.png de `directorio` (recortes reales de YOLO)."""
+    np_rng = np.random.default_rng(rng.randrange(2 ** 32))
+    recortes = []
+    for _ in range(cantidad):
+        alto = rng.randrange(30, 91)
+        recortes.append(imagen_patente(patente_aleatoria(rng), alto=alto, ancho=int(alto * 3.3), rng=np_rng))
+    if directorio:
+        for ruta in sorted(glob.glob(os.path.join(directorio, '*.jpg')) + glob.glob(os.path.join(directorio, '*.png'))):
+            imagen = cv2.imread(ruta)
+            if imagen is not None:
+                recortes.append(imagen)
+    return recortes
+
+def lecturas_ocr(cantidad, rng):
+    """Textos como los que entrega el OCR: patentes con errores, basura y cadenas vacías."""
+    lecturas = []
+    for _ in range(cantidad):
+        azar = rng.random()
+        if azar < 0.8:
+            lecturas.append(lectura_ruidosa(patente_aleatoria(rng), rng))
+        elif azar < 0.95:
+            lecturas.append("".join(rng.choices("ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789", k=rng.randrange(1, 10))))
+        else:
+            lecturas.append("")
+    return lecturas
+
+def lecturas_por_pista(autos, rng):
+    """(texto, id_pista, instante): cada auto se lee de 3 a 8 veces, a 10 lecturas por segundo y con errores de OCR."""
+    lecturas, instante = [], 0.0
+    for pista in range(autos):
+        patente = patente_aleatoria(rng)
+        for _ in range(rng.randrange(3, 9)):
+            lecturas.append((lectura_ruidosa(patente, rng), pista, instante))
+            instante += 0.1
+    return lecturas
+
+def movimientos(cantidad, patentes, rng):
+    """(patente, fecha_hora) cada 3 s sobre un grupo de patentes: entradas, salidas y algún duplicado."""
+    grupo = [patente_aleatoria(rng) for _ in range(patentes)]
+    inicio = datetime.datetime(2024, 1, 1, 8)
+    return [(rng.choice(grupo), inicio + datetime.timedelta(seconds=3 * i)) for i in range(cantidad)]
+
+def medir_pipeline(ruta, frame_skip):
+    """
+    Recorre el clip como detectar_lote (sin pausas ni dibujo) y registra cada patente confirmada en la
+    base falsa. Las etapas se miden envolviendo las funciones que usa detectar_video; 'frame' es el
+    tiempo total por frame, incluidos los que no se analizan.
+    """
+    import detectar_video
+    from fuente_video import FuenteVideo
+    from vision import obtener_modelo, obtener_ocr, crear_detector_movimiento, ParametrosDeteccion
+    obtener_modelo() # La carga de los modelos no forma parte de la medición
+    obtener_ocr()
+
+    latencias = collections.defaultdict(list)
+    def cronometrar(nombre, funcion):
+        def envoltura(*args, **kwargs):
+            inicio = time.perf_counter()
+            try:
+                return funcion(*args, **kwargs)
+            finally:
+                latencias[nombre].append(time.perf_counter() - inicio)
+        return envoltura
+
+    originales = {nombre: getattr(detectar_video, nombre) for nombre in ('detectar_patentes', 'preprocesar_para_ocr', 'leer_patentes_lote')}
+    fuente = FuenteVideo(ruta)
+    if not fuente.abierta():
+        raise RuntimeError(f"No se pudo abrir el video '{ruta}'")
+    try:
+        for nombre, funcion in originales.items():
+            setattr(detectar_video, nombre, cronometrar(nombre, funcion))
+        parametros = ParametrosDeteccion.desde_config(ruta)
+        analizador = detectar_video.AnalizadorVideo(frame_skip=frame_skip, detector_movimiento=crear_detector_movimiento(parametros),
+                                                    parametros=parametros)
+        analizador.confirmador.registrar_lectura = cronometrar('confirmacion', analizador.confirmador.registrar_lectura)
+        registrar = cronometrar('registrar_movimiento_patente', registrar_movimiento_patente)
+        fps, inicio_video = fuente.fps, datetime.datetime(2024, 1, 1, 8)
+        confirmadas, n = [], 0
+        inicio = time.perf_counter()
+        while True:
+            inicio_frame = time.perf_counter()
+            analizar = analizador.muestrear()
+            ret, frame = fuente.siguiente(decodificar=analizar)
+            if not ret:
+                break
+            latencias['decodificacion'].append(time.perf_counter() - inicio_frame)
+            for patente in analizador.procesar(frame, instante=n / fps, muestreado=analizar):
+                confirmadas.append(patente)
+                registrar(patente, inicio_video + datetime.timedelta(seconds=n / fps))
+            latencias['frame'].append(time.perf_counter() - inicio_frame)
+            n += 1
+        pared = time.perf_counter() - inicio
+    finally:
+        fuente.liberar()
+        for nombre, funcion in originales.items():
+            setattr(detectar_video, nombre, funcion)
+    return {
+        'video': ruta,
+        'frames': n,
+        'frames_analizados': analizador.frames_analizados,
+        'frames_por_segundo': n / pared if pared else 0.0,
+        'tiempo_real': (n / fps) / pared if pared and fps else 0.0, # > 1: más rápido que la reproducción
+        'patentes': confirmadas,
+        'etapas': {nombre: percentiles(valores) for nombre, valores in latencias.items()},
+    }
+
+def comparar(resultados, anterior, tolerancia):
+    """Líneas con el cambio de p50 por etapa respecto de `anterior` y si alguna empeoró más que `tolerancia`."""
+    lineas, empeoro = [], False
+    actuales = dict(resultados['etapas'])
+    previas = dict(anterior.get('etapas', {}))
+    for origen, destino in ((resultados, actuales), (anterior, previas)):
+        for nombre, etapa in ((origen.get('pipeline') or {}).get('etapas') or {}).items():
+            destino[f"pipeline.{nombre}"] = etapa
+    for nombre, etapa in actuales.items():
+        previa = previas.get(nombre)
+        if not previa or not previa['p50_ms']:
+            continue
+        cambio = etapa['p50_ms'] / previa['p50_ms'] - 1
+        marca = "  ⚠️ más lento" if cambio > tolerancia else ""
+        empeoro |= cambio > tolerancia
+        lineas.append(f"  {nombre:<40} {previa['p50_ms']:10.4f} -> {etapa['p50_ms']:10.4f} ms ({cambio:+.0%}){marca}")
+    return lineas, empeoro
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--recortes', help="Directorio con recortes de patentes reales (.jpg/.png) para preprocesar_para_ocr")
+    parser.add_argument('--cantidad', type=int, default=200, help="Recortes sintéticos")
+    parser.add_argument('--lecturas', type=int, default=50000, help="Lecturas para es_patente_valida y levenshtein_distance")
+    parser.add_argument('--autos', type=int, default=5000, help="Autos (pistas) para la confirmación")
+    parser.add_argument('--movimientos', type=int, default=5000, help="Llamadas a registrar_movimiento_patente")
+    parser.add_argument('--latencia-ms', type=float, default=0.0, help="Round trip simulado por sentencia en la base falsa")
+    parser.add_argument('--video', help="Clip para el pipeline (por defecto, uno sintético de --segundos)")
+    parser.add_argument('--segundos', type=float, default=5.0)
+    parser.add_argument('--frame-skip', type=int, default=3)
+    parser.add_argument('--sin-pipeline', action='store_true', help="Medir solo las etapas que no usan los modelos")
+    parser.add_argument('--semilla', type=int, default=0)
+    parser.add_argument('--salida', help="Guardar los resultados en este JSON")
+    parser.add_argument('--comparar', help="JSON de una medición anterior con el que comparar")
+    parser.add_argument('--tolerancia', type=float, default=0.10, help="Empeoramiento del p50 aceptado al comparar")
+    parser.add_argument('--json', action='store_true', help="Imprimir los resultados en JSON")
+    args = parser.parse_args()
+    bd_falsa.instalar(args.latencia_ms)
+
+    rng = random.Random(args.semilla)
+    recortes = recortes_de_prueba(args.recortes, args.cantidad, rng)
+    textos = lecturas_ocr(args.lecturas, rng)
+    pares = [(texto, patente_aleatoria(rng)) for texto in textos]
+    por_pista = lecturas_por_pista(args.autos, rng)
+    eventos = movimientos(args.movimientos, max(1, args.movimientos // 10), rng)
+
+    def preparar_confirmacion():
+        confirmador = crear_confirmador()
+        return (lambda texto, pista, instante: confirmador.registrar_lectura(texto, clave=pista, instante=instante)), por_pista
+    def preparar_registro():
+        bd_falsa.reiniciar()
+        return registrar_movimiento_patente, eventos
+
+    etapas = {
+        'preprocesar_para_ocr': (lambda: (preprocesar_para_ocr, [(r,) for r in recortes]), 1),
+        'es_patente_valida': (lambda: (es_patente_valida, [(t,) for t in textos]), 100),
+        'levenshtein_distance': (lambda: (levenshtein_distance, pares), 100),
+        'confirmacion': (preparar_confirmacion, 100),
+        'registrar_movimiento_patente': (preparar_registro, 1),
+    }
+    resultados = {
+        'fecha': datetime.datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'plataforma': platform.platform(),
+        'cpus': os.cpu_count(),
+        'parametros': {k: v for k, v in vars(args).items() if k not in ('salida', 'comparar', 'json')},
+        'etapas': {},
+    }
+    with contextlib.redirect_stdout(io.StringIO()): # registrar_movimiento_patente imprime cada movimiento
+        for nombre, (preparar, lote) in etapas.items():
+            resultados['etapas'][nombre] = medir_etapa(preparar, lote)
+        resultados['etapas']['registrar_movimiento_patente']['movimientos_en_bd'] = bd_falsa.movimientos_registrados()
+        if not args.sin_pipeline:
+            try:
+                ruta = args.video
+                if ruta is None:
+                    ruta = os.path.join(_tmp.name, 'sintetico.mp4')
+                    video_sintetico(ruta, segundos=args.segundos)
+                bd_falsa.reiniciar()
+                resultados['pipeline'] = medir_pipeline(ruta, args.frame_skip)
+            except Exception as e: # Sin modelos (model/best.pt, ultralytics, easyocr) se informan las demás etapas
+                resultados['pipeline'] = {'error': str(e)}
+    resultados['rss_maximo_mb'] = rss_maximo_mb()
+
+    if args.salida:
+        with open(args.salida, 'w', encoding='utf-8') as f:
+            json.dump(resultados, f, indent=2, ensure_ascii=False)
+    lineas_comparacion, empeoro = [], False
+    if args.comparar:
+        with open(args.comparar, encoding='utf-8') as f:
+            lineas_comparacion, empeoro = comparar(resultados, json.load(f), args.tolerancia)
+
+    if args.json:
+        print(json.dumps(resultados, indent=2, ensure_ascii=False))
+    else:
+        print(f"{'etapa':<30} {'p50 (ms)':>10} {'p90 (ms)':>10} {'p99 (ms)':>10} {'llamadas/s':>12} {'memoria (KB)':>13}")
+        for nombre, r in resultados['etapas'].items():
+            print(f"{nombre:<30} {r['p50_ms']:>10.4f} {r['p90_ms']:>10.4f} {r['p99_ms']:>10.4f} {r['por_segundo']:>12.0f} {r['memoria_pico_kb']:>13.1f}")
+        pipeline = resultados.get('pipeline')
+        if pipeline and 'error' in pipeline:
+            print(f"Pipeline no medido: {pipeline['error']}")
+        elif pipeline:
+            print(f"\nPipeline: {pipeline['frames']} frames ({pipeline['frames_analizados']} analizados), "
+                  f"{pipeline['frames_por_segundo']:.1f} frames/s ({pipeline['tiempo_real']:.1f}x tiempo real), "
+                  f"patentes: {', '.join(pipeline['patentes']) or 'ninguna'}")
+            for nombre, r in pipeline['etapas'].items():
+                print(f"  {nombre:<28} {r['p50_ms']:>10.2f} {r['p90_ms']:>10.2f} {r['p99_ms']:>10.2f}   n={r['n']}")
+        if resultados['rss_maximo_mb'] is not None:
+            print(f"Memoria residente máxima del proceso: {resultados['rss_maximo_mb']:.0f} MB")
+    if lineas_comparacion:
+        print(f"\nCambio del p50 respecto de '{args.comparar}':", file=sys.stderr)
+        for linea in lineas_comparacion:
+            print(linea, file=sys.stderr)
+    sys.exit(1 if empeoro else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""Generación de patentes sintéticas (texto e imagen) para las mediciones que no usan cámara."""
+import random
+import string
+import cv2
+import numpy as np
+
+def patente_aleatoria(rng=random):
+    """Devuelve una patente válida al azar, en formato nuevo (BBBB11) o antiguo (BB1111)."""
+    if rng.random() < 0.5:
+        return "".join(rng.choices(string.ascii_uppercase, k=4)) + "".join(rng.choices(string.digits, k=2))
+    return "".join(rng.choices(string.ascii_uppercase, k=2)) + "".join(rng.choices(string.digits, k=4))
+
+def lectura_ruidosa(patente, rng):
+    """Simula un error de OCR: cambia, borra o agrega un carácter la mitad de las veces."""
+    if rng.random() < 0.5:
+        return patente
+    i = rng.randrange(len(patente))
+    operacion = rng.choice(('sustituir', 'borrar', 'insertar'))
+    if operacion == 'sustituir':
+        return patente[:i] + rng.choice("ABCDEFGHJKLPRSTVWXYZ0123456789") + patente[i + 1:]
+    if operacion == 'borrar':
+        return patente[:i] + patente[i + 1:]
+    return patente[:i] + rng.choice("ABCDEFGHJKLPRSTVWXYZ0123456789") + patente[i:]
+
+def imagen_patente(texto, alto=60, ancho=200, ruido=8, rng=None):
+    """
+    Dibuja la patente como un recorte BGR parecido al que entrega YOLO: fondo claro, borde y
+    texto negro, con algo de ruido gaussiano para que el preprocesamiento tenga trabajo.
+    """
+    rng = rng or np.random.default_rng()
+    img = np.full((alto, ancho, 3), 235, dtype=np.uint8)
+    cv2.rectangle(img, (2, 2), (ancho - 3, alto - 3), (0, 0, 0), 2)
+    escala = alto / 40
+    (tw, th), _ = cv2.getTextSize(texto, cv2.FONT_HERSHEY_SIMPLEX, escala, 3)
+    origen = ((ancho - tw) // 2, (alto + th) // 2)
+    cv2.putText(img, texto, origen, cv2.FONT_HERSHEY_SIMPLEX, escala, (0, 0, 0), 3, cv2.LINE_AA)
+    if ruido:
+        img = np.clip(img + rng.normal(0, ruido, img.shape), 0, 255).astype(np.uint8)
+    return img
+
+def video_sintetico(ruta, segundos=10, fps=30, ancho=1280, alto=720, rng=None):
+    """
+    Graba un video de un auto (un rectángulo con patente) que cruza el cuadro sobre un fondo con ruido,
+    para medir decodificación y muestreo cuando no se tiene el video de ejemplo. Devuelve la patente usada.
+    """
+    rng = rng or np.random.default_rng(0)
+    texto = patente_aleatoria(random.Random(0))
+    patente = imagen_patente(texto, rng=rng)
+    fondo = rng.integers(0, 255, (alto, ancho, 3), dtype=np.uint8)
+    escritor = cv2.VideoWriter(ruta, cv2.VideoWriter_fourcc(*'mp4v'), fps, (ancho, alto))
+    total = int(segundos * fps)
+    for i in range(total):
+        frame = fondo.copy()
+        x = int((ancho - 400) * i / total)
+        cv2.rectangle(frame, (x, alto // 3), (x + 400, alto // 3 + 250), (40, 40, 160), -1)
+        frame[alto // 3 + 150:alto // 3 + 210, x + 100:x + 300] = patente
+        escritor.write(frame)
+    escritor.release()
+    return texto
@@ -0,0 +1,90 @@
+import datetime
+import os
+import sqlite3
+import threading
+
+# --- Bitácora local de movimientos pendientes ---
+
+class BitacoraMovimientos:
+    """
+    Cola durable en un archivo SQLite local para los movimientos que no se pudieron escribir en
+    SQL Server. Cada agregar() es una transacción con fsync (WAL + synchronous=FULL), que en un disco
+    local toma milisegundos, así un corte de red o un reinicio no pierden movimientos confirmados.
+    Los eventos se leen en el mismo orden en que se agregaron y se borran recién cuando el servidor
+    confirmó su escritura (confirmar). Es thread-safe.
+    """
+
+    def __init__(self, ruta):
+        """:param ruta: Archivo SQLite; se crea con el primer movimiento que haya que guardar."""
+        self.ruta = ruta
+        self._conn = None
+        self._lock = threading.Lock()
+        self._pendientes = None # Se cuenta al abrir el archivo
+
+    @property
+    def pendientes(self):
+        """Cantidad de movimientos guardados que aún no llegan a SQL Server."""
+        with self._lock:
+            if self._conn is None and not os.path.exists(self.ruta):
+                return 0
+            self._abrir()
+            return self._pendientes
+
+    def agregar(self, eventos):
+        """
+        Guarda en orden una lista de (patente, fecha_hora) en una sola transacción.
+        Devuelve False si no se pudieron guardar (disco lleno, archivo inaccesible...).
+        """
+        try:
+            with self._lock:
+                self._abrir()
+                with self._conn:
+                    self._conn.executemany(
+                        "INSERT INTO Pendientes (Patente, FechaHora) VALUES (?, ?)",
+                        [(patente, fecha_hora.isoformat()) for patente, fecha_hora in eventos],
+                    )
+                self._pendientes += len(eventos)
+            return True
+        except sqlite3.Error as e:
+            print(f"❌ Error al guardar {len(eventos)} movimientos en la bitácora local '{self.ruta}': {e}")
+            return False
+
+    def leer(self, limite):
+        """Devuelve hasta `limite` movimientos pendientes, los más antiguos primero: [(id, patente, fecha_hora)]."""
+        with self._lock:
+            if self._conn is None and not os.path.exists(self.ruta):
+                return []
+            self._abrir()
+            filas = self._conn.execute(
+                "SELECT ID, Patente, FechaHora FROM Pendientes ORDER BY ID LIMIT ?", (limite,)
+            ).fetchall()
+        return [(id_fila, patente, datetime.datetime.fromisoformat(fecha)) for id_fila, patente, fecha in filas]
+
+    def confirmar(self, hasta_id):
+        """Borra los movimientos ya escritos en SQL Server (todos los de ID <= hasta_id)."""
+        with self._lock:
+            self._abrir()
+            with self._conn:
+                borrados = self._conn.execute("DELETE FROM Pendientes WHERE ID <= ?", (hasta_id,)).rowcount
+            self._pendientes -= borrados
+
+    def cerrar(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+                self._pendientes = None
+
+    def _abrir(self):
+        # Debe llamarse con el lock tomado
+        if self._conn is not None:
+            return
+        conn = sqlite3.connect(self.ruta, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=FULL") # fsync en cada commit
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS Pendientes ("
+            "ID INTEGER PRIMARY KEY AUTOINCREMENT, Patente TEXT NOT NULL, FechaHora TEXT NOT NULL)"
+        )
+        self._pendientes = conn.execute("SELECT COUNT(*) FROM Pendientes").fetchone()[0]
+        self._conn = conn
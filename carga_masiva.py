@@ -0,0 +1,43 @@
+"""
+Importa o exporta roles, personas y vehículos en CSV (por ejemplo, la planilla de RR.HH. con miles
+de residentes o funcionarios). La importación valida cada fila, aplica todo en una sola transacción
+y lista las filas rechazadas con su motivo. Conviene importar en orden: roles, personas, vehículos.
+
+    python carga_masiva.py importar personas funcionarios.csv --errores rechazados.csv
+    python carga_masiva.py importar vehiculos patentes.csv
+    python carga_masiva.py exportar personas respaldo_personas.csv
+
+Columnas: roles (Nombre), personas (RUT, Nombre, Apellido, Telefono, Rol, Activo) y
+vehiculos (Patente, RUT). Se aceptan archivos separados por coma o por punto y coma.
+"""
+import argparse
+import sys
+from core import TIPOS_CARGA, importar_csv, exportar_csv, escribir_reporte_errores
+from migraciones import migrar_al_iniciar
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('accion', choices=('importar', 'exportar'))
+    parser.add_argument('tipo', choices=TIPOS_CARGA)
+    parser.add_argument('archivo', help="CSV a leer (importar) o a crear (exportar)")
+    parser.add_argument('--errores', help="Guardar el reporte de filas rechazadas en este CSV (por defecto se imprime)")
+    args = parser.parse_args()
+    migrar_al_iniciar()
+
+    if args.accion == 'exportar':
+        success, msg = exportar_csv(args.tipo, args.archivo)
+        print(msg, file=sys.stderr)
+        sys.exit(0 if success else 1)
+
+    success, msg, errores = importar_csv(args.tipo, args.archivo)
+    print(f"{'✅' if success else '❌'} {msg}", file=sys.stderr)
+    if errores and args.errores:
+        escribir_reporte_errores(errores, args.errores)
+        print(f"Reporte de errores guardado en '{args.errores}'.", file=sys.stderr)
+    else:
+        for linea, error in errores:
+            print(f"  Línea {linea}: {error}", file=sys.stderr)
+    sys.exit(0 if success and not errores else 1)
+
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,18 @@
-import cv2
-from ultralytics import YOLO
-import easyocr
 import re
+import csv
 import collections
+import unicodedata
 import numpy as np
-from db_config import get_connection
+import datetime
+import queue
+import threading
+import time
+import atexit
+from db_config import conexion_bd, obtener_config
+from eventos import bus_eventos, MOVIMIENTO_REGISTRADO
+from bitacora import BitacoraMovimientos
 import pyodbc # Added for specific exception handling and type hinting
 
-# --- Cargar modelo YOLO entrenado y OCR ---
-model = YOLO('model/best.pt')
-ocr = easyocr.Reader(['es'], gpu=False)
-
 # --- Funciones de Ayuda ---
 
 def levenshtein_distance(s1, s2):
@@ -30,9 +32,102 @@ def levenshtein_distance(s1, s2):
         previous_row = current_row
     return previous_row[-1]
 
+def distancia_maxima_uno(s1, s2):
+    """
+    Indica si la distancia de Levenshtein entre dos strings es <= 1, sin construir la matriz:
+    compara el prefijo común y luego exige que el resto coincida tras una sola edición.
+    """
+    if s1 == s2:
+        return True
+    len1, len2 = len(s1), len(s2)
+    if len1 > len2:
+        s1, s2, len1, len2 = s2, s1, len2, len1
+    if len2 - len1 > 1:
+        return False
+    i = 0
+    while i < len1 and s1[i] == s2[i]:
+        i += 1
+    if len1 == len2:
+        return s1[i + 1:] == s2[i + 1:] # Una sustitución en la posición i
+    return s1[i:] == s2[i + 1:] # Una inserción en la posición i
+
+def levenshtein_acotada(s1, s2, umbral):
+    """
+    Distancia de Levenshtein si es <= umbral, o umbral + 1 si la supera.
+    Solo calcula la banda diagonal de ancho 2*umbral+1 y corta apenas una fila entera supera el umbral.
+    """
+    if abs(len(s1) - len(s2)) > umbral:
+        return umbral + 1
+    if len(s1) < len(s2):
+        s1, s2 = s2, s1
+    fuera = umbral + 1
+    previous_row = [j if j <= umbral else fuera for j in range(len(s2) + 1)]
+    for i, c1 in enumerate(s1, start=1):
+        desde, hasta = max(1, i - umbral), min(len(s2), i + umbral)
+        current_row = [fuera] * (len(s2) + 1)
+        current_row[0] = i if i <= umbral else fuera
+        for j in range(desde, hasta + 1):
+            current_row[j] = min(previous_row[j] + 1, current_row[j - 1] + 1, previous_row[j - 1] + (c1 != s2[j - 1]))
+        if min(current_row[max(0, desde - 1):hasta + 1]) > umbral:
+            return fuera
+        previous_row = current_row
+    return min(previous_row[-1], fuera)
+
 def son_patentes_similares(p1, p2, umbral=1):
     """Verifica si dos patentes son similares según el umbral de Levenshtein."""
-    return levenshtein_distance(p1, p2) <= umbral
+    if umbral == 1:
+        return distancia_maxima_uno(p1, p2)
+    return levenshtein_acotada(p1, p2, umbral) <= umbral
+
+class IndicePatentes:
+    """
+    Conjunto de patentes conocidas (por ejemplo, toda la tabla Vehiculos) codificadas como matriz NumPy,
+    para encontrar en una sola operación vectorizada las que están a distancia de Levenshtein <= 1 de una lectura.
+    """
+
+    ANCHO = 7 # Largo máximo de una patente chilena
+
+    def __init__(self, patentes):
+        self.patentes = np.array(list(patentes), dtype=object)
+        self._codigos = np.zeros((len(self.patentes), self.ANCHO + 1), dtype=np.uint8) # +1: columna de relleno
+        self._largos = np.zeros(len(self.patentes), dtype=np.int8)
+        for i, patente in enumerate(self.patentes):
+            codigo = patente.encode('ascii', 'replace')[:self.ANCHO]
+            self._codigos[i, :len(codigo)] = np.frombuffer(codigo, dtype=np.uint8)
+            self._largos[i] = len(codigo)
+
+    def __len__(self):
+        return len(self.patentes)
+
+    def similares(self, lectura):
+        """Devuelve las patentes conocidas a distancia <= 1 de la lectura."""
+        codigo = np.frombuffer(lectura.encode('ascii', 'replace')[:self.ANCHO], dtype=np.uint8)
+        largo = len(codigo)
+        coincide = np.zeros(len(self.patentes), dtype=bool)
+
+        # Mismo largo: a lo más un carácter distinto (sustitución)
+        filas = self._largos == largo
+        if filas.any():
+            coincide[filas] = (self._codigos[filas, :largo] != codigo).sum(axis=1) <= 1
+
+        # Un carácter más o menos: el corto debe ser el largo sin uno de sus caracteres
+        for largo_conocido, lectura_es_corta in ((largo + 1, True), (largo - 1, False)):
+            filas = self._largos == largo_conocido
+            if largo_conocido <= 0 or not filas.any():
+                continue
+            conocidos = self._codigos[filas]
+            if lectura_es_corta:
+                corto, largo_m, n = codigo[None, :], conocidos, largo
+            else:
+                corto, largo_m, n = conocidos[:, :largo_conocido], codigo[None, :], largo_conocido
+            # prefijo[k]: los primeros k caracteres coinciden; sufijo[k]: corto[k:] == largo[k+1:]
+            iguales_prefijo = corto == largo_m[:, :n]
+            iguales_sufijo = corto == largo_m[:, 1:n + 1]
+            prefijo = np.concatenate([np.ones((iguales_prefijo.shape[0], 1), bool), np.cumprod(iguales_prefijo, axis=1, dtype=bool)], axis=1)
+            sufijo = np.concatenate([np.cumprod(iguales_sufijo[:, ::-1], axis=1, dtype=bool)[:, ::-1], np.ones((iguales_sufijo.shape[0], 1), bool)], axis=1)
+            coincide[filas] = (prefijo & sufijo).any(axis=1)
+
+        return list(self.patentes[coincide])
 
 def es_patente_valida(texto):
     """Verifica si el texto coincide con los formatos de patente chilena."""
@@ -42,172 +137,826 @@ def es_patente_valida(texto):
     patron2 = re.compile(r'^[A-Z]{2}[0-9]{4}$') # Formato antiguo: BB1111
     return bool(patron1.match(texto) or patron2.match(texto))
 
-def preprocesar_para_ocr(imagen_recortada):
-    """Aplica técnicas para mejorar la legibilidad de la imagen antes de pasarla al OCR."""
-    gray = cv2.cvtColor(imagen_recortada, cv2.COLOR_BGR2GRAY)
-    
-    # Agrandar la imagen (Interpolación) - Ayuda mucho al OCR
-    h, w = gray.shape
-    scale_factor = 3
-    gray_resized = cv2.resize(gray, (w * scale_factor, h * scale_factor), interpolation=cv2.INTER_CUBIC)
+# --- Confirmación de Patentes ---
+
+def _variantes_similitud(texto):
+    """
+    El texto y todas sus versiones con un carácter borrado. Dos patentes a distancia de Levenshtein <= 1
+    siempre comparten al menos una variante, por eso sirven como claves del índice de similitud.
+    """
+    return {texto} | {texto[:i] + texto[i + 1:] for i in range(len(texto))}
+
+class _Votacion:
+    """Últimas lecturas de una clave (pista o lectura global) con su conteo, ambos en O(1)."""
 
-    # Aplicar un filtro de enfoque (Sharpening) para realzar los bordes
-    kernel = np.array([[-1,-1,-1], [-1,9,-1], [-1,-1,-1]])
-    sharpened = cv2.filter2D(gray_resized, -1, kernel)
+    __slots__ = ('lecturas', 'conteo', 'ultima')
 
-    # Convertir a blanco y negro puro (Binarización con método de Otsu)
-    _, thresh = cv2.threshold(sharpened, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    def __init__(self, max_lecturas):
+        self.lecturas = collections.deque(maxlen=max_lecturas)
+        self.conteo = collections.Counter()
+        self.ultima = 0.0
 
-    return thresh
+    def votar(self, texto, instante):
+        if len(self.lecturas) == self.lecturas.maxlen:
+            mas_antigua = self.lecturas[0]
+            self.conteo[mas_antigua] -= 1
+            if not self.conteo[mas_antigua]:
+                del self.conteo[mas_antigua]
+        self.lecturas.append(texto)
+        self.conteo[texto] += 1
+        self.ultima = instante
+        return self.conteo[texto]
 
-def registrar_movimiento_patente(patente):
+class ConfirmadorPatentes:
     """
-    Registra el movimiento de una patente (entrada/salida) en la base de datos.
-    Actualiza la tabla 'Vehiculos' y registra el movimiento en 'Movimientos'.
+    Decide cuándo una lectura de OCR confirma una patente y evita registrar dos veces el mismo auto.
+    - Votos: Counter por clave (id de pista del seguidor, o None para lecturas sin seguimiento) sobre
+      las últimas `max_lecturas` lecturas; las claves sin lecturas por `ventana_votos` segundos se olvidan.
+    - Confirmadas: cada patente confirmada se recuerda `expiracion` segundos, así un auto que sale y
+      vuelve horas después se registra otra vez y la memoria queda acotada en sesiones de días.
+    - Índice de similitud: las lecturas se comparan solo con las confirmadas que comparten alguna variante
+      con un carácter borrado (ver _variantes_similitud), en vez de contra todas las confirmadas.
+    Es thread-safe. `instante` permite usar el tiempo del video en vez del reloj al procesar grabaciones.
     """
-    conn = None
-    try:
-        conn = get_connection()
-        if not conn:
-            print("Error: No se pudo establecer conexión con la base de datos.")
-            return
 
-        cursor = conn.cursor()
+    def __init__(self, umbral=3, expiracion=300.0, max_lecturas=30, ventana_votos=30.0, reloj=time.monotonic):
+        self.umbral = umbral
+        self.expiracion = expiracion
+        self.max_lecturas = max_lecturas
+        self.ventana_votos = ventana_votos
+        self._reloj = reloj
+        self._lock = threading.Lock()
+        self._votaciones = collections.OrderedDict() # clave -> _Votacion, la menos reciente primero
+        self._confirmadas = collections.OrderedDict() # patente -> instante de confirmación, la más antigua primero
+        self._indice = collections.defaultdict(set) # variante -> patentes confirmadas que la generan
+        self._stats = {'lecturas': 0, 'confirmadas': 0, 'repetidas': 0, 'expiradas': 0}
+
+    def registrar_lectura(self, texto, clave=None, instante=None):
+        """
+        Registra una lectura válida de OCR.
+        :return: (patente, nueva). `patente` es None mientras la lectura no alcance el umbral de votos.
+                 Si la lectura es similar a una patente ya confirmada se devuelve esa patente con nueva=False.
+                 nueva=True indica que la patente se acaba de confirmar y debe registrarse.
+        """
+        instante = self._reloj() if instante is None else instante
+        with self._lock:
+            self._stats['lecturas'] += 1
+            self._purgar(instante)
+
+            confirmada = self._buscar_similar(texto)
+            if confirmada is not None:
+                self._stats['repetidas'] += 1
+                return confirmada, False
+
+            votacion = self._votaciones.pop(clave, None) or _Votacion(self.max_lecturas)
+            self._votaciones[clave] = votacion # Al final: la más reciente
+            if votacion.votar(texto, instante) < self.umbral:
+                return None, False
+
+            del self._votaciones[clave]
+            self._confirmadas[texto] = instante
+            for variante in _variantes_similitud(texto):
+                self._indice[variante].add(texto)
+            self._stats['confirmadas'] += 1
+            return texto, True
+
+    def es_confirmada(self, texto, instante=None):
+        """Devuelve la patente confirmada (y vigente) similar a `texto`, o None."""
+        instante = self._reloj() if instante is None else instante
+        with self._lock:
+            self._purgar(instante)
+            return self._buscar_similar(texto)
 
-        # 1. Verificar el estado actual de la patente en la tabla Vehiculos
-        cursor.execute("SELECT Estado FROM Vehiculos WHERE Patente = ?", (patente,))
+    def olvidar(self, clave):
+        """Descarta los votos pendientes de una clave (por ejemplo, una pista que dejó de verse)."""
+        with self._lock:
+            self._votaciones.pop(clave, None)
+
+    def confirmadas(self):
+        """Patentes confirmadas vigentes, de la más antigua a la más reciente."""
+        with self._lock:
+            return list(self._confirmadas)
+
+    def metricas(self):
+        with self._lock:
+            metricas = dict(self._stats)
+            metricas['vigentes'] = len(self._confirmadas)
+            metricas['claves_votando'] = len(self._votaciones)
+            return metricas
+
+    def _buscar_similar(self, texto):
+        if texto in self._confirmadas:
+            return texto
+        candidatas = set()
+        for variante in _variantes_similitud(texto):
+            candidatas |= self._indice.get(variante, set())
+        for candidata in candidatas:
+            if distancia_maxima_uno(texto, candidata):
+                return candidata
+        return None
+
+    def _purgar(self, instante):
+        # Ambos diccionarios están ordenados por antigüedad: basta con recortar desde el inicio
+        while self._confirmadas:
+            patente, confirmada_en = next(iter(self._confirmadas.items()))
+            if instante - confirmada_en <= self.expiracion:
+                break
+            del self._confirmadas[patente]
+            for variante in _variantes_similitud(patente):
+                grupo = self._indice[variante]
+                grupo.discard(patente)
+                if not grupo:
+                    del self._indice[variante]
+            self._stats['expiradas'] += 1
+        while self._votaciones:
+            clave, votacion = next(iter(self._votaciones.items()))
+            if instante - votacion.ultima <= self.ventana_votos:
+                break
+            del self._votaciones[clave]
+
+def crear_confirmador():
+    """Crea un ConfirmadorPatentes con los parámetros de la sección [confirmacion] de config.ini."""
+    config = obtener_config()
+    return ConfirmadorPatentes(
+        umbral=config.getint('confirmacion', 'umbral', fallback=3),
+        expiracion=config.getfloat('confirmacion', 'expiracion', fallback=300.0),
+        max_lecturas=config.getint('confirmacion', 'max_lecturas', fallback=30),
+        ventana_votos=config.getfloat('confirmacion', 'ventana_votos', fallback=30.0),
+    )
+
+# --- Estado del Estacionamiento en Memoria ---
+
+VehiculoEstado = collections.namedtuple('VehiculoEstado', 'estado ultimo_movimiento rut_persona propietario')
+
+class EstadoEstacionamiento:
+    """
+    Copia en memoria de la tabla Vehiculos (patente -> estado, último movimiento y propietario).
+    Se carga una vez, se actualiza con cada movimiento que este proceso registra y se reconcilia con la
+    base de datos cada `reconciliar_cada` segundos (en segundo plano), para tomar los cambios hechos por
+    otros procesos. Así la ocupación y "¿está dentro?" se responden sin consultar SQL Server.
+    Es thread-safe: el escritor de movimientos la actualiza mientras la GUI la consulta.
+    """
+
+    def __init__(self, reconciliar_cada=60.0, reloj=time.monotonic):
+        self.reconciliar_cada = reconciliar_cada
+        self._reloj = reloj
+        self._lock = threading.Lock()
+        self._vehiculos = {} # Patente -> VehiculoEstado
+        self._dentro = 0
+        self._cargado = False
+        self._ultima_carga = float('-inf')
+        self._reconciliando = False
+        self._durante_carga = None # Movimientos aplicados mientras se recarga, para no perderlos al reemplazar
+        self._stats = {'cargas': 0, 'movimientos': 0, 'diferencias': 0, 'errores': 0}
+
+    def cargar(self):
+        """Lee Vehiculos completa y reemplaza el estado en memoria. Devuelve False si no se pudo."""
+        sql = """
+            SELECT v.Patente, v.Estado, v.UltimoMovimiento, v.RUT_Persona, p.Nombre, p.Apellido
+            FROM Vehiculos v
+            LEFT JOIN Persona p ON v.RUT_Persona = p.RUT
+        """
+        with self._lock:
+            self._durante_carga = []
+        try:
+            with conexion_bd() as conn:
+                if not conn:
+                    raise RuntimeError("sin conexión a la base de datos")
+                cursor = conn.cursor()
+                cursor.execute(sql)
+                vehiculos = {
+                    row.Patente: VehiculoEstado(row.Estado, row.UltimoMovimiento, row.RUT_Persona,
+                                                f"{row.Nombre} {row.Apellido}" if row.Nombre else "Sin Asignar")
+                    for row in cursor.fetchall()
+                }
+        except Exception as e:
+            print(f"❌ Error al cargar el estado del estacionamiento: {e}")
+            with self._lock:
+                self._durante_carga = None
+                self._stats['errores'] += 1
+                self._ultima_carga = self._reloj() # No reintentar en cada consulta
+            return False
+
+        with self._lock:
+            for patente, tipo, fecha_hora in self._durante_carga:
+                actual = vehiculos.get(patente)
+                if actual is None or actual.ultimo_movimiento < fecha_hora:
+                    self._aplicar(vehiculos, patente, tipo, fecha_hora)
+            if self._cargado:
+                self._stats['diferencias'] += sum(
+                    1 for patente in vehiculos.keys() | self._vehiculos.keys()
+                    if getattr(vehiculos.get(patente), 'estado', None) != getattr(self._vehiculos.get(patente), 'estado', None)
+                )
+            self._vehiculos = vehiculos
+            self._dentro = sum(1 for v in vehiculos.values() if v.estado == 'Dentro')
+            self._durante_carga = None
+            self._cargado = True
+            self._ultima_carga = self._reloj()
+            self._stats['cargas'] += 1
+        return True
+
+    def aplicar_movimiento(self, patente, tipo_movimiento, fecha_hora):
+        """Refleja un movimiento ya registrado en la base de datos ('Entrada' o 'Salida')."""
+        with self._lock:
+            if self._durante_carga is not None:
+                self._durante_carga.append((patente, tipo_movimiento, fecha_hora))
+            self._aplicar(self._vehiculos, patente, tipo_movimiento, fecha_hora)
+            self._stats['movimientos'] += 1
+
+    def asignar_propietario(self, patente, rut_persona, propietario):
+        with self._lock:
+            actual = self._vehiculos.get(patente)
+            if actual is not None:
+                self._vehiculos[patente] = actual._replace(rut_persona=rut_persona, propietario=propietario)
+
+    def invalidar(self):
+        """Pide reconciliar en la próxima consulta (p. ej. tras cambiar el nombre de un propietario)."""
+        with self._lock:
+            self._ultima_carga = float('-inf')
+
+    def ocupacion(self):
+        """Cantidad de vehículos 'Dentro'."""
+        self._asegurar()
+        with self._lock:
+            return self._dentro
+
+    def esta_dentro(self, patente):
+        self._asegurar()
+        with self._lock:
+            vehiculo = self._vehiculos.get(patente)
+            return vehiculo is not None and vehiculo.estado == 'Dentro'
+
+    def obtener(self, patente):
+        """VehiculoEstado de la patente, o None si nunca se registró."""
+        self._asegurar()
+        with self._lock:
+            return self._vehiculos.get(patente)
+
+    def vehiculos_dentro(self):
+        """Lista de (patente, propietario) de los vehículos dentro, del movimiento más reciente al más antiguo."""
+        self._asegurar()
+        with self._lock:
+            dentro = [(p, v) for p, v in self._vehiculos.items() if v.estado == 'Dentro']
+        dentro.sort(key=lambda item: item[1].ultimo_movimiento, reverse=True)
+        return [(patente, v.propietario) for patente, v in dentro]
+
+    def metricas(self):
+        with self._lock:
+            metricas = dict(self._stats)
+            metricas['vehiculos'] = len(self._vehiculos)
+            metricas['dentro'] = self._dentro
+        return metricas
+
+    def _aplicar(self, vehiculos, patente, tipo_movimiento, fecha_hora):
+        # Debe llamarse con el lock tomado
+        estado = 'Dentro' if tipo_movimiento == 'Entrada' else 'Fuera'
+        anterior = vehiculos.get(patente)
+        if anterior is None:
+            vehiculos[patente] = VehiculoEstado(estado, fecha_hora, None, "Sin Asignar")
+        else:
+            vehiculos[patente] = anterior._replace(estado=estado, ultimo_movimiento=fecha_hora)
+        if vehiculos is self._vehiculos:
+            self._dentro += (estado == 'Dentro') - (anterior is not None and anterior.estado == 'Dentro')
+
+    def _asegurar(self):
+        """La primera consulta carga el estado; después, si está vencido, se reconcilia en segundo plano."""
+        with self._lock:
+            # Tampoco se reintenta en cada consulta si la última carga falló hace poco
+            if self._reconciliando or self._reloj() - self._ultima_carga < self.reconciliar_cada:
+                return
+            en_segundo_plano = self._cargado
+            self._reconciliando = True
+        if en_segundo_plano:
+            threading.Thread(target=self._reconciliar, name="ReconciliarEstado", daemon=True).start()
+        else:
+            self._reconciliar()
+
+    def _reconciliar(self):
+        try:
+            self.cargar()
+        finally:
+            with self._lock:
+                self._reconciliando = False
+
+estado_estacionamiento = EstadoEstacionamiento(
+    reconciliar_cada=obtener_config().getfloat('estado', 'reconciliar_cada', fallback=60.0),
+)
+
+# Segundos en los que una misma patente no puede volver a alternar su estado
+VENTANA_DUPLICADOS = obtener_config().getint('registro', 'ventana_duplicados', fallback=10)
+
+def _registrar_movimiento(cursor, patente, fecha_hora):
+    """
+    Alterna el estado de una patente usando un cursor ya abierto (sin hacer commit).
+    Todo ocurre en el servidor en un solo round trip (ver dbo.sp_RegistrarMovimiento).
+    Devuelve el TipoMovimiento registrado, o None si el servidor lo ignoró: la patente ya tiene un movimiento
+    a menos de VENTANA_DUPLICADOS segundos antes de `fecha_hora` o uno posterior (el estado solo avanza en
+    el tiempo; un evento fuera de orden, como un video más antiguo que lo ya registrado, no se intercala).
+    """
+    cursor.execute("EXEC dbo.sp_RegistrarMovimiento ?, ?, ?", (patente, fecha_hora, VENTANA_DUPLICADOS))
+    resultado = cursor.fetchone()
+    return resultado[0] if resultado else None
+
+# Re-ejecuta en orden, en un solo batch, los movimientos cargados en #Pendientes; cada EXEC devuelve un result set
+_SQL_REENVIO = """
+SET NOCOUNT ON;
+DECLARE @Orden INT = 0, @Patente NVARCHAR(10), @FechaHora DATETIME;
+WHILE 1 = 1
+BEGIN
+    SELECT TOP (1) @Orden = Orden, @Patente = Patente, @FechaHora = FechaHora
+    FROM #Pendientes WHERE Orden > @Orden ORDER BY Orden;
+    IF @@ROWCOUNT = 0 BREAK;
+    EXEC dbo.sp_RegistrarMovimiento @Patente, @FechaHora, ?;
+END
+"""
+
+def _reenviar_movimientos(cursor, eventos):
+    """
+    Escribe una lista de (patente, fecha_hora) con dos round trips en vez de uno por evento:
+    los eventos se suben a una tabla temporal con fast_executemany y el servidor los recorre en orden
+    llamando a dbo.sp_RegistrarMovimiento. Devuelve los TipoMovimiento en el orden de `eventos`.
+    """
+    cursor.execute(
+        "DROP TABLE IF EXISTS #Pendientes; "
+        "CREATE TABLE #Pendientes (Orden INT PRIMARY KEY, Patente NVARCHAR(10), FechaHora DATETIME)"
+    )
+    cursor.fast_executemany = True
+    cursor.executemany(
+        "INSERT INTO #Pendientes (Orden, Patente, FechaHora) VALUES (?, ?, ?)",
+        [(orden, patente, fecha_hora) for orden, (patente, fecha_hora) in enumerate(eventos, 1)],
+    )
+    cursor.execute(_SQL_REENVIO, (VENTANA_DUPLICADOS,))
+    tipos = []
+    while True:
         resultado = cursor.fetchone()
+        tipos.append(resultado[0] if resultado else None)
+        if not cursor.nextset():
+            break
+    cursor.execute("DROP TABLE #Pendientes") # La conexión vuelve al pool: que no quede la tabla en la sesión
+    if len(tipos) != len(eventos):
+        raise pyodbc.Error('HY000', f"Se esperaban {len(eventos)} resultados del reenvío y llegaron {len(tipos)}")
+    return tipos
+
+def _es_error_de_conexion(ex):
+    """True si el error indica que no se llega al servidor (vale la pena guardar y reintentar más tarde)."""
+    if isinstance(ex, (pyodbc.OperationalError, pyodbc.InterfaceError)):
+        return True
+    return isinstance(ex, pyodbc.Error) and bool(ex.args) and str(ex.args[0]).startswith(('08', 'HYT'))
+
+def _movimiento_registrado(patente, tipo_movimiento, fecha_hora):
+    """Tras el commit: actualiza el estado en memoria y avisa a los suscriptores (p. ej. la GUI)."""
+    estado_estacionamiento.aplicar_movimiento(patente, tipo_movimiento, fecha_hora)
+    bus_eventos.publicar(MOVIMIENTO_REGISTRADO, patente=patente, tipo_movimiento=tipo_movimiento, fecha_hora=fecha_hora)
+
+def _mensaje_movimiento(patente, tipo_movimiento):
+    if tipo_movimiento is None:
+        return (f"ℹ️ Movimiento ignorado para {patente}: ya tiene uno registrado menos de {VENTANA_DUPLICADOS} s antes "
+                "de esta lectura, o uno posterior.")
+    return f"✅ {tipo_movimiento.upper()} registrada para la patente: {patente}"
+
+def registrar_movimiento_patente(patente, fecha_hora=None):
+    """
+    Registra el movimiento de una patente (entrada/salida) en la base de datos.
+    Actualiza la tabla 'Vehiculos' y registra el movimiento en 'Movimientos'.
+    Si SQL Server no está disponible el movimiento se guarda en la bitácora local y se escribe
+    después, en orden, desde el hilo del EscritorMovimientos.
+    :param fecha_hora: Instante de captura del movimiento; si es None se usa la hora actual.
+    :return: 'Entrada' o 'Salida', o None si no se registró (duplicado o anterior al último movimiento de la
+             patente, guardado en la bitácora o error).
+    """
+    fecha_hora = fecha_hora or datetime.datetime.now()
+    if escritor_movimientos.hay_atrasados():
+        # Mientras queden movimientos en la bitácora, los nuevos van detrás para no alterar el orden
+        escritor_movimientos.guardar_en_bitacora([(patente, fecha_hora)])
+        return None
+    try:
+        with conexion_bd() as conn:
+            if not conn:
+                print(f"Error: No se pudo establecer conexión con la base de datos, se guarda {patente} en la bitácora local.")
+                escritor_movimientos.guardar_en_bitacora([(patente, fecha_hora)])
+                return None
 
-        tipo_movimiento = ""
-        mensaje = ""
-
-        if resultado is None:
-            # La patente no existe, es una ENTRADA
-            tipo_movimiento = "Entrada"
-            cursor.execute("INSERT INTO Vehiculos (Patente, Estado, UltimoMovimiento) VALUES (?, ?, GETDATE())",
-                           (patente, "Dentro"))
-            mensaje = f"✅ ENTRADA registrada para la patente: {patente}"
-        elif resultado[0] == "Fuera":
-            # La patente existe y está "Fuera", es una ENTRADA
-            tipo_movimiento = "Entrada"
-            cursor.execute("UPDATE Vehiculos SET Estado = ?, UltimoMovimiento = GETDATE() WHERE Patente = ?",
-                           ("Dentro", patente))
-            mensaje = f"✅ ENTRADA registrada para la patente: {patente}"
-        elif resultado[0] == "Dentro":
-            # La patente existe y está "Dentro", es una SALIDA
-            tipo_movimiento = "Salida"
-            cursor.execute("UPDATE Vehiculos SET Estado = ?, UltimoMovimiento = GETDATE() WHERE Patente = ?",
-                           ("Fuera", patente))
-            mensaje = f"✅ SALIDA registrada para la patente: {patente}"
-        
-        # 2. Registrar el movimiento en la tabla Movimientos
-        if tipo_movimiento: # Solo si se determinó un tipo de movimiento
-            cursor.execute("INSERT INTO Movimientos (Patente, TipoMovimiento, FechaHora) VALUES (?, ?, GETDATE())",
-                           (patente, tipo_movimiento))
+            tipo_movimiento = _registrar_movimiento(conn.cursor(), patente, fecha_hora)
             conn.commit()
-            print(mensaje)
-        else:
-            print(f"ℹ️ No se pudo determinar el movimiento para la patente: {patente}")
+            if tipo_movimiento:
+                _movimiento_registrado(patente, tipo_movimiento, fecha_hora)
+            print(_mensaje_movimiento(patente, tipo_movimiento))
+            return tipo_movimiento
 
+    # conexion_bd() hace rollback de cualquier cambio pendiente si hay un error
     except pyodbc.Error as ex:
         sqlstate = ex.args[0]
         if sqlstate == '23000': # Integrity constraint violation (e.g., duplicate primary key)
             print(f"❌ Error de integridad al registrar movimiento para {patente}: {ex}")
+        elif _es_error_de_conexion(ex):
+            print(f"❌ Se perdió la conexión al registrar {patente}, se guarda en la bitácora local: {ex}")
+            escritor_movimientos.guardar_en_bitacora([(patente, fecha_hora)])
         else:
             print(f"❌ Error de base de datos al registrar movimiento para {patente}: {ex}")
-        if conn:
-            conn.rollback() # Revertir cualquier cambio si hay un error
     except Exception as e:
         print(f"❌ Error inesperado al registrar movimiento para {patente}: {e}")
-        if conn:
-            conn.rollback()
-    finally:
-        if conn:
-            conn.close()
+    return None
+
+# --- Escritura Asíncrona de Movimientos ---
+
+_FIN_ESCRITOR = object() # Marca para detener el hilo escritor
+_DESPERTAR_ESCRITOR = object() # Marca sin evento: el hilo vuelve a mirar la bitácora
+
+class EscritorMovimientos:
+    """
+    Escritor en segundo plano (write-behind) para los movimientos de patentes.
+    Los bucles de detección solo encolan (patente, fecha de captura) y siguen procesando;
+    un hilo aparte escribe los eventos en lotes pequeños, con un commit por lote.
+    Si SQL Server no responde, los lotes se guardan en una BitacoraMovimientos local y el mismo hilo
+    los reenvía en orden cuando el servidor vuelve; mientras tanto el circuito del pool evita pagar
+    el timeout de conexión en cada lote.
+    """
+
+    def __init__(self, max_cola=1000, tamano_lote=20, espera_lote=0.2, bitacora=None, intervalo_reenvio=5.0, lote_reenvio=500):
+        """
+        :param max_cola: Máximo de eventos pendientes; si la cola está llena el evento se descarta.
+        :param tamano_lote: Máximo de eventos escritos en una misma transacción.
+        :param espera_lote: Segundos que se espera por más eventos antes de escribir un lote incompleto.
+        :param bitacora: BitacoraMovimientos donde guardar lo que no se pudo escribir (None = se pierde).
+        :param intervalo_reenvio: Segundos entre intentos de reenviar la bitácora mientras el servidor no responde.
+        :param lote_reenvio: Máximo de eventos de la bitácora reenviados en una misma transacción.
+        """
+        self._cola = queue.Queue(maxsize=max_cola)
+        self._tamano_lote = tamano_lote
+        self._espera_lote = espera_lote
+        self._bitacora = bitacora
+        self._intervalo_reenvio = intervalo_reenvio
+        self._lote_reenvio = lote_reenvio
+        self._proximo_reenvio = 0.0
+        self._hilo = None
+        self._lock = threading.Lock()
+        self._pendientes = 0 # Eventos encolados que aún no se han escrito
+        self._sin_pendientes = threading.Condition(self._lock)
+        self._stats = {
+            'encolados': 0,
+            'escritos': 0,
+            'duplicados': 0, # Escritos o reenviados que el servidor ignoró (ventana de duplicados o fuera de orden)
+            'descartados': 0,
+            'fallidos': 0,
+            'en_bitacora': 0, # Guardados en la bitácora local por falta de servidor
+            'reenviados': 0,  # Escritos desde la bitácora cuando el servidor volvió
+            'lotes': 0,
+            'max_profundidad': 0,
+        }
+
+    def encolar(self, patente, fecha_hora=None):
+        """
+        Encola un movimiento sin bloquear. Devuelve False si la cola está llena.
+        :param fecha_hora: Instante de captura del fotograma; si es None se usa la hora actual.
+        """
+        self._iniciar()
+        evento = (patente, fecha_hora or datetime.datetime.now())
+        with self._lock:
+            try:
+                self._cola.put_nowait(evento)
+            except queue.Full:
+                self._stats['descartados'] += 1
+                print(f"❌ Cola de movimientos llena, se descarta la patente: {patente}")
+                return False
+            self._pendientes += 1
+            self._stats['encolados'] += 1
+            self._stats['max_profundidad'] = max(self._stats['max_profundidad'], self._cola.qsize())
+        return True
+
+    def flush(self, timeout=None):
+        """Espera a que se escriban todos los eventos encolados. Devuelve False si expira el timeout."""
+        with self._sin_pendientes:
+            return self._sin_pendientes.wait_for(lambda: self._pendientes == 0, timeout)
+
+    def detener(self, timeout=5.0):
+        """Escribe lo pendiente, detiene el hilo escritor y hace un último intento de reenviar la bitácora."""
+        with self._lock:
+            hilo = self._hilo
+        if hilo is not None and hilo.is_alive():
+            self._cola.put(_FIN_ESCRITOR)
+            hilo.join(timeout)
+            if hilo.is_alive():
+                return # Sigue escribiendo: reenviar desde aquí duplicaría su trabajo
+        if self.hay_atrasados():
+            self._reenviar() # Lo que no llegue queda en la bitácora para la próxima ejecución
+
+    def hay_atrasados(self):
+        """True si quedan movimientos en la bitácora esperando a que vuelva el servidor."""
+        return bool(self._bitacora and self._bitacora.pendientes)
+
+    def guardar_en_bitacora(self, eventos):
+        """
+        Guarda [(patente, fecha_hora)] en la bitácora para escribirlos más tarde y asegura que el
+        hilo que los reenvía esté corriendo. Devuelve False si no hay bitácora o no se pudo guardar.
+        """
+        if self._bitacora is None or not self._bitacora.agregar(eventos):
+            return False
+        with self._lock:
+            self._stats['en_bitacora'] += len(eventos)
+        self._iniciar()
+        try:
+            # El hilo puede estar esperando eventos sin timeout (registrar_movimiento_patente no encola):
+            # que despierte y empiece a reenviar. Con la cola llena ya está despierto.
+            self._cola.put_nowait(_DESPERTAR_ESCRITOR)
+        except queue.Full:
+            pass
+        return True
+
+    def metricas(self):
+        """Profundidad actual de la cola y contadores acumulados del escritor."""
+        with self._lock:
+            metricas = dict(self._stats)
+            metricas['profundidad'] = self._cola.qsize()
+            metricas['pendientes'] = self._pendientes
+        metricas['atrasados'] = self._bitacora.pendientes if self._bitacora else 0
+        return metricas
+
+    def _iniciar(self):
+        with self._lock:
+            if self._hilo is None or not self._hilo.is_alive():
+                self._hilo = threading.Thread(target=self._bucle, name="EscritorMovimientos", daemon=True)
+                self._hilo.start()
+
+    def _bucle(self):
+        fin = False
+        while not fin:
+            if self.hay_atrasados() and time.monotonic() >= self._proximo_reenvio:
+                self._reenviar()
+            try:
+                # Con bitácora pendiente no se bloquea indefinidamente: hay que volver a intentar el reenvío
+                evento = self._cola.get(timeout=self._intervalo_reenvio if self.hay_atrasados() else None)
+            except queue.Empty:
+                continue
+            if evento is _FIN_ESCRITOR:
+                break
+            if evento is _DESPERTAR_ESCRITOR:
+                continue
+            lote = [evento]
+            limite = time.monotonic() + self._espera_lote
+            while len(lote) < self._tamano_lote:
+                restante = limite - time.monotonic()
+                if restante <= 0:
+                    break
+                try:
+                    evento = self._cola.get(timeout=restante)
+                except queue.Empty:
+                    break
+                if evento is _FIN_ESCRITOR:
+                    fin = True
+                    break
+                if evento is not _DESPERTAR_ESCRITOR:
+                    lote.append(evento)
+            self._escribir_lote(lote)
+
+    def _escribir_lote(self, lote):
+        escritos = 0
+        duplicados = 0
+        guardados = 0
+        if self.hay_atrasados():
+            # Los nuevos van detrás de la bitácora para que el servidor reciba todo en orden
+            guardados = self._guardar(lote)
+        else:
+            try:
+                with conexion_bd() as conn:
+                    if not conn:
+                        guardados = self._guardar(lote, "No se pudo establecer conexión con la base de datos")
+                    else:
+                        cursor = conn.cursor()
+                        tipos = [_registrar_movimiento(cursor, patente, fecha_hora) for patente, fecha_hora in lote]
+                        conn.commit()
+                        escritos = len(lote)
+                        duplicados = tipos.count(None)
+                        for (patente, fecha_hora), tipo_movimiento in zip(lote, tipos):
+                            if tipo_movimiento:
+                                _movimiento_registrado(patente, tipo_movimiento, fecha_hora)
+                            print(_mensaje_movimiento(patente, tipo_movimiento))
+            except Exception as e:
+                # Un evento con error no debe perder el resto del lote: se reintentan uno por uno
+                print(f"❌ Error al escribir lote de {len(lote)} movimientos, reintentando individualmente: {e}")
+                for i, (patente, fecha_hora) in enumerate(lote):
+                    try:
+                        with conexion_bd() as conn:
+                            if not conn:
+                                guardados = self._guardar(lote[i:], "No se pudo establecer conexión con la base de datos")
+                                break
+                            tipo_movimiento = _registrar_movimiento(conn.cursor(), patente, fecha_hora)
+                            conn.commit()
+                        if tipo_movimiento:
+                            _movimiento_registrado(patente, tipo_movimiento, fecha_hora)
+                        escritos += 1
+                        duplicados += tipo_movimiento is None
+                        print(_mensaje_movimiento(patente, tipo_movimiento))
+                    except Exception as ex:
+                        if _es_error_de_conexion(ex):
+                            guardados = self._guardar(lote[i:], f"Se perdió la conexión ({ex})")
+                            break
+                        print(f"❌ Error al registrar movimiento para {patente}: {ex}")
+
+        with self._sin_pendientes:
+            self._pendientes -= len(lote)
+            self._stats['lotes'] += 1
+            self._stats['escritos'] += escritos
+            self._stats['duplicados'] += duplicados
+            self._stats['fallidos'] += len(lote) - escritos - guardados
+            self._sin_pendientes.notify_all()
+
+    def _guardar(self, eventos, motivo=None):
+        """Pasa eventos a la bitácora. Devuelve cuántos quedaron guardados (0 si se pierden)."""
+        if self.guardar_en_bitacora(eventos):
+            if motivo:
+                print(f"⚠️ {motivo}: se guardan {len(eventos)} movimientos en la bitácora local.")
+            return len(eventos)
+        if motivo:
+            print(f"Error: {motivo}, se pierden {len(eventos)} movimientos.")
+        return 0
+
+    def _reenviar(self):
+        """Escribe la bitácora en SQL Server en orden, por tandas, hasta vaciarla o perder la conexión."""
+        while True:
+            filas = self._bitacora.leer(self._lote_reenvio)
+            if not filas:
+                break
+            eventos = [(patente, fecha_hora) for _, patente, fecha_hora in filas]
+            try:
+                with conexion_bd() as conn:
+                    if not conn:
+                        break # Servidor caído o circuito abierto: se reintenta en intervalo_reenvio
+                    tipos = _reenviar_movimientos(conn.cursor(), eventos)
+                    conn.commit()
+            except Exception as e:
+                if _es_error_de_conexion(e):
+                    print(f"❌ Se perdió la conexión al reenviar la bitácora local: {e}")
+                    break
+                # Algún evento de la tanda hace fallar el batch: se reenvían uno por uno para aislarlo
+                print(f"❌ Error al reenviar {len(filas)} movimientos de la bitácora, reintentando individualmente: {e}")
+                if not self._reenviar_uno_a_uno(filas):
+                    break
+                continue
+            # Si el proceso se cae antes de confirmar, la tanda se reenvía y el servidor la ignora
+            # por la ventana de duplicados (misma patente con la misma FechaHora)
+            self._bitacora.confirmar(filas[-1][0])
+            for (patente, fecha_hora), tipo_movimiento in zip(eventos, tipos):
+                if tipo_movimiento:
+                    _movimiento_registrado(patente, tipo_movimiento, fecha_hora)
+            ignorados = tipos.count(None)
+            with self._lock:
+                self._stats['reenviados'] += len(filas)
+                self._stats['duplicados'] += ignorados
+            print(f"✅ Reenviados {len(filas)} movimientos de la bitácora local, {ignorados} ignorados por duplicados "
+                  f"o fuera de orden ({self._bitacora.pendientes} pendientes).")
+        self._proximo_reenvio = time.monotonic() + self._intervalo_reenvio
+
+    def _reenviar_uno_a_uno(self, filas):
+        """Reenvía una tanda evento por evento. Devuelve False si se cortó por falta de conexión."""
+        for id_fila, patente, fecha_hora in filas:
+            try:
+                with conexion_bd() as conn:
+                    if not conn:
+                        return False
+                    tipo_movimiento = _registrar_movimiento(conn.cursor(), patente, fecha_hora)
+                    conn.commit()
+                if tipo_movimiento:
+                    _movimiento_registrado(patente, tipo_movimiento, fecha_hora)
+                with self._lock:
+                    self._stats['reenviados'] += 1
+                    self._stats['duplicados'] += tipo_movimiento is None
+            except Exception as ex:
+                if _es_error_de_conexion(ex):
+                    return False
+                print(f"❌ Se descarta de la bitácora el movimiento de {patente} ({fecha_hora}): {ex}")
+                with self._lock:
+                    self._stats['fallidos'] += 1
+            self._bitacora.confirmar(id_fila)
+        return True
+
+def _crear_escritor_movimientos():
+    config = obtener_config()
+    escritor = EscritorMovimientos(
+        max_cola=config.getint('escritor', 'max_cola', fallback=1000),
+        tamano_lote=config.getint('escritor', 'tamano_lote', fallback=20),
+        espera_lote=config.getfloat('escritor', 'espera_lote', fallback=0.2),
+        bitacora=BitacoraMovimientos(config.get('bitacora', 'ruta', fallback='movimientos_pendientes.db')),
+        intervalo_reenvio=config.getfloat('bitacora', 'intervalo_reenvio', fallback=5.0),
+        lote_reenvio=config.getint('bitacora', 'lote_reenvio', fallback=500),
+    )
+    if escritor.hay_atrasados():
+        escritor._iniciar() # Quedaron movimientos de una ejecución anterior: se reenvían en cuanto haya servidor
+    return escritor
+
+escritor_movimientos = _crear_escritor_movimientos()
+atexit.register(escritor_movimientos.detener)
 
 def obtener_ocupacion_estacionamiento():
     """
     Obtiene el número de vehículos actualmente "Dentro" del estacionamiento.
+    Se responde desde estado_estacionamiento (en memoria), sin consultar la base de datos.
     """
-    conn = None
-    try:
-        conn = get_connection()
-        if not conn:
-            print("Error: No se pudo establecer conexión con la base de datos para obtener ocupación.")
-            return 0
-
-        cursor = conn.cursor()
-        cursor.execute("SELECT COUNT(*) FROM Vehiculos WHERE Estado = 'Dentro'")
-        count = cursor.fetchone()[0]
-        return count
-    except Exception as e:
-        print(f"❌ Error al obtener la ocupación del estacionamiento: {e}")
-        return 0
-    finally:
-        if conn:
-            conn.close()
+    return estado_estacionamiento.ocupacion()
 
 def obtener_vehiculos_dentro():
     """
     Obtiene una lista de los vehículos actualmente "Dentro",
-    incluyendo la patente y el nombre del propietario si está asignado.
+    incluyendo la patente y el nombre del propietario si está asignado (desde estado_estacionamiento).
     """
-    sql = """
-        SELECT v.Patente, p.Nombre, p.Apellido
-        FROM Vehiculos v
-        LEFT JOIN Persona p ON v.RUT_Persona = p.RUT
-        WHERE v.Estado = 'Dentro'
-        ORDER BY v.UltimoMovimiento DESC
+    return estado_estacionamiento.vehiculos_dentro()
+
+def vehiculo_esta_dentro(patente):
+    """Indica si la patente está "Dentro", sin consultar la base de datos."""
+    return estado_estacionamiento.esta_dentro(patente)
+
+Movimiento = collections.namedtuple('Movimiento', 'id patente tipo fecha_hora')
+
+def obtener_movimientos_pagina(anterior_a=None, posterior_a=None, limite=100, patente=None, desde=None, hasta=None, tipo=None):
     """
+    Una página del historial de movimientos, del más reciente al más antiguo, paginada por clave
+    (FechaHora, ID) en vez de OFFSET: cada página es una búsqueda en IX_Movimientos_FechaHora (o en
+    IX_Movimientos_Patente si se filtra por patente) sin importar cuán atrás esté.
+    :param anterior_a: (FechaHora, ID) del último movimiento de la página anterior: trae los más antiguos.
+    :param posterior_a: (FechaHora, ID) del primer movimiento mostrado: trae los más recientes que él.
+                        Un ID None compara solo por FechaHora (movimientos recibidos por el bus de eventos).
+    :param patente: Prefijo de patente. :param desde, hasta: Rango [desde, hasta) de FechaHora.
+    :param tipo: 'Entrada' o 'Salida'.
+    :return: (lista de Movimiento en orden descendente, hay_mas), con hay_mas True si quedan más
+             movimientos en la dirección pedida.
+    """
+    condiciones, parametros = [], []
+    if patente:
+        condiciones.append("Patente LIKE ?")
+        parametros.append(re.sub(r'[^A-Z0-9]', '', patente.upper()) + '%')
+    if desde:
+        condiciones.append("FechaHora >= ?")
+        parametros.append(desde)
+    if hasta:
+        condiciones.append("FechaHora < ?")
+        parametros.append(hasta)
+    if tipo:
+        condiciones.append("TipoMovimiento = ?")
+        parametros.append(tipo)
+    for clave, operador in ((anterior_a, '<'), (posterior_a, '>')):
+        if clave is None:
+            continue
+        fecha, id_movimiento = clave
+        if id_movimiento is None:
+            condiciones.append(f"FechaHora {operador} ?")
+            parametros.append(fecha)
+        else:
+            condiciones.append(f"(FechaHora {operador} ? OR (FechaHora = ? AND ID {operador} ?))")
+            parametros.extend((fecha, fecha, id_movimiento))
+    # Hacia los recientes se recorre el índice en orden ascendente desde el cursor y se invierte en Python
+    orden = "ASC" if posterior_a is not None else "DESC"
+    sql = (f"SELECT TOP (?) ID, Patente, TipoMovimiento, FechaHora FROM Movimientos"
+           f"{' WHERE ' + ' AND '.join(condiciones) if condiciones else ''}"
+           f" ORDER BY FechaHora {orden}, ID {orden}")
     try:
-        conn = get_connection()
-        if not conn: return []
-        cursor = conn.cursor()
-        cursor.execute(sql)
-        vehiculos = []
-        for row in cursor.fetchall():
-            propietario = f"{row.Nombre} {row.Apellido}" if row.Nombre else "Sin Asignar"
-            vehiculos.append((row.Patente, propietario))
-        return vehiculos
+        with conexion_bd() as conn:
+            if not conn:
+                print("Error: No se pudo establecer conexión con la base de datos.")
+                return [], False
+            cursor = conn.cursor()
+            cursor.execute(sql, [limite + 1] + parametros) # Una fila de más indica si hay otra página
+            filas = [Movimiento(*row) for row in cursor.fetchall()]
     except Exception as e:
-        print(f"❌ Error al obtener vehículos dentro: {e}")
-        return []
-    finally:
-        if conn: conn.close()
+        print(f"❌ Error al obtener la página de movimientos: {e}")
+        return [], False
+    hay_mas = len(filas) > limite
+    filas = filas[:limite]
+    if posterior_a is not None:
+        filas.reverse()
+    return filas, hay_mas
 
 def obtener_ultimos_movimientos(limit=50):
     """
     Obtiene una lista de los últimos movimientos registrados.
     """
-    conn = None
+    movimientos, _ = obtener_movimientos_pagina(limite=limit)
+    # Formateamos la fecha para que sea más legible en la GUI
+    return [(m.patente, m.tipo, m.fecha_hora.strftime('%Y-%m-%d %H:%M:%S')) for m in movimientos]
+
+def _marcar_cambio(cursor, *tablas):
+    """
+    Incrementa el contador de MarcasCambios de cada tabla ('vehiculos', 'personas', 'roles'), en la misma
+    transacción que el cambio. Lo llaman todas las escrituras de la aplicación sobre esas tablas salvo
+    dbo.sp_RegistrarMovimiento, cuyos cambios en Vehiculos ya se ven en el último ID de Movimientos.
+    """
+    cursor.execute(f"UPDATE MarcasCambios SET Version = Version + 1 WHERE Tabla IN ({', '.join('?' * len(tablas))})", tablas)
+
+def obtener_marcas_cambios():
+    """
+    Obtiene en una sola consulta una marca por tabla que cambia cuando cambian sus datos: el último ID
+    de Movimientos (una búsqueda en la clave primaria) y los contadores de MarcasCambios para Vehiculos,
+    Persona y Rol, sin recorrer esas tablas. La GUI la compara con la anterior para refrescar solo lo que cambió.
+    Los cambios hechos por fuera de la aplicación (p. ej. a mano en SSMS) no mueven los contadores.
+    :return: dict tabla -> marca, o None si no hay conexión.
+    """
+    sql = "SELECT 'movimientos' AS Tabla, CAST(MAX(ID) AS BIGINT) AS Version FROM Movimientos UNION ALL SELECT Tabla, Version FROM MarcasCambios"
     try:
-        conn = get_connection()
-        if not conn:
-            print("Error: No se pudo establecer conexión con la base de datos.")
-            return []
-
-        cursor = conn.cursor()
-        # Usamos TOP para limitar los resultados directamente en la consulta SQL
-        cursor.execute("""
-            SELECT TOP (?) Patente, TipoMovimiento, FechaHora
-            FROM Movimientos
-            ORDER BY FechaHora DESC
-        """, (limit,))
-        
-        # Formateamos la fecha para que sea más legible en la GUI
-        movimientos = []
-        for row in cursor.fetchall():
-            patente, tipo, fecha = row
-            fecha_formateada = fecha.strftime('%Y-%m-%d %H:%M:%S')
-            movimientos.append((patente, tipo, fecha_formateada))
-            
-        return movimientos
+        with conexion_bd() as conn:
+            if not conn: return None
+            cursor = conn.cursor()
+            return {row.Tabla: row.Version for row in cursor.execute(sql).fetchall()}
     except Exception as e:
-        print(f"❌ Error al obtener los últimos movimientos: {e}")
-        return []
-    finally:
-        if conn:
-            conn.close()
+        print(f"❌ Error al obtener las marcas de cambios: {e}")
+        return None
 
 # --- Funciones CRUD para Roles ---
 
@@ -215,91 +964,89 @@ def crear_rol(nombre):
     """Crea un nuevo rol en la base de datos."""
     sql = "INSERT INTO Rol (Nombre) VALUES (?)"
     try:
-        conn = get_connection()
-        if not conn: return False, "Sin conexión a BD"
-        cursor = conn.cursor()
-        cursor.execute(sql, (nombre,))
-        conn.commit()
-        return True, None
+        with conexion_bd() as conn:
+            if not conn: return False, "Sin conexión a BD"
+            cursor = conn.cursor()
+            cursor.execute(sql, (nombre,))
+            _marcar_cambio(cursor, 'roles')
+            conn.commit()
+            return True, None
     except pyodbc.IntegrityError:
         return False, f"El rol '{nombre}' ya existe."
     except Exception as e:
         print(f"❌ Error al crear rol: {e}")
         return False, str(e)
-    finally:
-        if conn: conn.close()
 
 def obtener_roles():
     """Obtiene todos los roles de la base de datos."""
     sql = "SELECT ID, Nombre FROM Rol ORDER BY Nombre"
     try:
-        conn = get_connection()
-        if not conn: return []
-        cursor = conn.cursor()
-        cursor.execute(sql)
-        roles = cursor.fetchall()
-        return roles
+        with conexion_bd() as conn:
+            if not conn: return []
+            cursor = conn.cursor()
+            cursor.execute(sql)
+            roles = cursor.fetchall()
+            return roles
     except Exception as e:
         print(f"❌ Error al obtener roles: {e}")
         return []
-    finally:
-        if conn: conn.close()
 
 def actualizar_rol(rol_id, nombre):
     """Actualiza el nombre de un rol existente."""
     sql = "UPDATE Rol SET Nombre = ? WHERE ID = ?"
     try:
-        conn = get_connection()
-        if not conn: return False, "Sin conexión a BD"
-        cursor = conn.cursor()
-        cursor.execute(sql, (nombre, rol_id))
-        conn.commit()
-        return True, None
+        with conexion_bd() as conn:
+            if not conn: return False, "Sin conexión a BD"
+            cursor = conn.cursor()
+            cursor.execute(sql, (nombre, rol_id))
+            _marcar_cambio(cursor, 'roles')
+            conn.commit()
+            return True, None
     except pyodbc.IntegrityError:
         return False, f"El nombre de rol '{nombre}' ya está en uso."
     except Exception as e:
         print(f"❌ Error al actualizar rol: {e}")
         return False, str(e)
-    finally:
-        if conn: conn.close()
 
 def eliminar_rol(rol_id):
     """Elimina un rol de la base de datos."""
     sql = "DELETE FROM Rol WHERE ID = ?"
     try:
-        conn = get_connection()
-        if not conn: return False, "Sin conexión a BD"
-        cursor = conn.cursor()
-        cursor.execute(sql, (rol_id,))
-        conn.commit()
-        return True, None
+        with conexion_bd() as conn:
+            if not conn: return False, "Sin conexión a BD"
+            cursor = conn.cursor()
+            cursor.execute(sql, (rol_id,))
+            _marcar_cambio(cursor, 'roles')
+            conn.commit()
+            return True, None
     except pyodbc.IntegrityError:
         return False, "No se puede eliminar el rol porque está asignado a una o más personas."
     except Exception as e:
         print(f"❌ Error al eliminar rol: {e}")
         return False, str(e)
-    finally:
-        if conn: conn.close()
 
 # --- Funciones CRUD para Personas ---
 
 def crear_persona(rut, nombre, apellido, telefono, id_rol, activo):
-    """Crea una nueva persona en la base de datos."""
+    """Crea una nueva persona en la base de datos. El RUT se guarda normalizado, como en la carga masiva."""
+    rut_normalizado = normalizar_rut(rut)
+    if not rut_normalizado:
+        return False, f"El RUT '{rut}' no es válido."
+    rut = rut_normalizado
     sql = "INSERT INTO Persona (RUT, Nombre, Apellido, Telefono, ID_Rol, Activo) VALUES (?, ?, ?, ?, ?, ?)"
     try:
-        conn = get_connection()
-        if not conn: return False, "Sin conexión a BD"
-        cursor = conn.cursor()
-        cursor.execute(sql, (rut, nombre, apellido, telefono, id_rol, activo))
-        conn.commit()
-        return True, None
+        with conexion_bd() as conn:
+            if not conn: return False, "Sin conexión a BD"
+            cursor = conn.cursor()
+            cursor.execute(sql, (rut, nombre, apellido, telefono, id_rol, activo))
+            _marcar_cambio(cursor, 'personas')
+            conn.commit()
+            return True, None
     except pyodbc.IntegrityError:
         return False, f"El RUT '{rut}' ya existe."
     except Exception as e:
         print(f"❌ Error al crear persona: {e}")
         return False, str(e)
-    finally:
-        if conn: conn.close()
 
 def obtener_personas():
     """Obtiene todas las personas con el nombre de su rol."""
@@ -310,55 +1057,71 @@ def obtener_personas():
         ORDER BY p.Apellido, p.Nombre
     """
     try:
-        conn = get_connection()
-        if not conn: return []
-        cursor = conn.cursor()
-        cursor.execute(sql)
-        personas = cursor.fetchall()
-        return personas
+        with conexion_bd() as conn:
+            if not conn: return []
+            cursor = conn.cursor()
+            cursor.execute(sql)
+            personas = cursor.fetchall()
+            return personas
     except Exception as e:
         print(f"❌ Error al obtener personas: {e}")
         return []
-    finally:
-        if conn: conn.close()
+
+def _buscar_persona(cursor, rut):
+    """
+    Fila (RUT, Nombre, Apellido) de la persona con ese RUT, o None si no existe o el RUT no es válido.
+    Se busca normalizado y también tal cual, para las personas creadas antes de normalizar los RUT.
+    """
+    rut_normalizado = normalizar_rut(rut)
+    if not rut_normalizado:
+        return None
+    return cursor.execute(
+        "SELECT TOP (1) RUT, Nombre, Apellido FROM Persona WHERE RUT IN (?, ?) ORDER BY CASE WHEN RUT = ? THEN 0 ELSE 1 END",
+        (rut_normalizado, rut, rut_normalizado),
+    ).fetchone()
 
 def actualizar_persona(rut, nombre, apellido, telefono, id_rol, activo):
     """Actualiza los datos de una persona existente."""
+    if not normalizar_rut(rut):
+        return False, f"El RUT '{rut}' no es válido."
     sql = """
         UPDATE Persona 
         SET Nombre = ?, Apellido = ?, Telefono = ?, ID_Rol = ?, Activo = ?
         WHERE RUT = ?
     """
     try:
-        conn = get_connection()
-        if not conn: return False, "Sin conexión a BD"
-        cursor = conn.cursor()
-        cursor.execute(sql, (nombre, apellido, telefono, id_rol, activo, rut))
-        conn.commit()
-        return True, None
+        with conexion_bd() as conn:
+            if not conn: return False, "Sin conexión a BD"
+            cursor = conn.cursor()
+            persona = _buscar_persona(cursor, rut)
+            if not persona:
+                return False, f"No existe una persona con el RUT '{rut}'."
+            cursor.execute(sql, (nombre, apellido, telefono, id_rol, activo, persona.RUT))
+            _marcar_cambio(cursor, 'personas')
+            conn.commit()
+            estado_estacionamiento.invalidar() # Puede cambiar el nombre de propietarios en memoria
+            return True, None
     except Exception as e:
         print(f"❌ Error al actualizar persona: {e}")
         return False, str(e)
-    finally:
-        if conn: conn.close()
 
 def eliminar_persona(rut):
     """Elimina una persona de la base de datos."""
     # Primero, desvincular vehículos asociados
     try:
-        conn = get_connection()
-        if not conn: return False, "Sin conexión a BD"
-        cursor = conn.cursor()
-        cursor.execute("UPDATE Vehiculos SET RUT_Persona = NULL WHERE RUT_Persona = ?", (rut,))
-        # Ahora, eliminar la persona
-        cursor.execute("DELETE FROM Persona WHERE RUT = ?", (rut,))
-        conn.commit()
-        return True, None
+        with conexion_bd() as conn:
+            if not conn: return False, "Sin conexión a BD"
+            cursor = conn.cursor()
+            cursor.execute("UPDATE Vehiculos SET RUT_Persona = NULL WHERE RUT_Persona = ?", (rut,))
+            # Ahora, eliminar la persona
+            cursor.execute("DELETE FROM Persona WHERE RUT = ?", (rut,))
+            _marcar_cambio(cursor, 'personas', 'vehiculos')
+            conn.commit()
+            estado_estacionamiento.invalidar() # Puede cambiar el nombre de propietarios en memoria
+            return True, None
     except Exception as e:
         print(f"❌ Error al eliminar persona: {e}")
         return False, str(e)
-    finally:
-        if conn: conn.close()
 
 # --- Funciones CRUD para Vehiculos (Asignación) ---
 
@@ -373,20 +1136,33 @@ def obtener_vehiculos():
         ORDER BY v.Patente
     """
     try:
-        conn = get_connection()
-        if not conn: return []
-        cursor = conn.cursor()
-        cursor.execute(sql)
-        vehiculos = []
-        for row in cursor.fetchall():
-            propietario = f"{row.Nombre} {row.Apellido}" if row.RUT_Persona else "Sin Asignar"
-            vehiculos.append((row.Patente, row.RUT_Persona or '', propietario))
-        return vehiculos
+        with conexion_bd() as conn:
+            if not conn: return []
+            cursor = conn.cursor()
+            cursor.execute(sql)
+            vehiculos = []
+            for row in cursor.fetchall():
+                propietario = f"{row.Nombre} {row.Apellido}" if row.RUT_Persona else "Sin Asignar"
+                vehiculos.append((row.Patente, row.RUT_Persona or '', propietario))
+            return vehiculos
     except Exception as e:
         print(f"❌ Error al obtener vehículos: {e}")
         return []
-    finally:
-        if conn: conn.close()
+
+def obtener_patentes_registradas():
+    """
+    Obtiene todas las patentes de la tabla Vehiculos, por ejemplo para construir un IndicePatentes
+    y buscar por similitud cada lectura de OCR contra los vehículos conocidos.
+    """
+    try:
+        with conexion_bd() as conn:
+            if not conn: return []
+            cursor = conn.cursor()
+            cursor.execute("SELECT Patente FROM Vehiculos")
+            return [row.Patente for row in cursor.fetchall()]
+    except Exception as e:
+        print(f"❌ Error al obtener patentes registradas: {e}")
+        return []
 
 def obtener_personas_para_asignacion():
     """
@@ -394,32 +1170,279 @@ def obtener_personas_para_asignacion():
     """
     sql = "SELECT RUT, Nombre, Apellido FROM Persona WHERE Activo = 1 ORDER BY Apellido, Nombre"
     try:
-        conn = get_connection()
-        if not conn: return []
-        cursor = conn.cursor()
-        cursor.execute(sql)
-        return cursor.fetchall()
+        with conexion_bd() as conn:
+            if not conn: return []
+            cursor = conn.cursor()
+            cursor.execute(sql)
+            return cursor.fetchall()
     except Exception as e:
         print(f"❌ Error al obtener personas para asignación: {e}")
         return []
-    finally:
-        if conn: conn.close()
 
 def asignar_vehiculo(patente, rut_persona):
     """
     Asigna o desasigna un vehículo a una persona.
-    Si rut_persona es None, se desasigna.
+    Si rut_persona es None, se desasigna. El RUT puede venir con puntos o sin guion.
     """
+    if rut_persona and not normalizar_rut(rut_persona):
+        return False, f"El RUT '{rut_persona}' no es válido."
     sql = "UPDATE Vehiculos SET RUT_Persona = ? WHERE Patente = ?"
     try:
-        conn = get_connection()
-        if not conn: return False, "Sin conexión a BD"
-        cursor = conn.cursor()
-        cursor.execute(sql, (rut_persona, patente))
-        conn.commit()
-        return True, None
+        with conexion_bd() as conn:
+            if not conn: return False, "Sin conexión a BD"
+            cursor = conn.cursor()
+            propietario = "Sin Asignar"
+            if rut_persona:
+                persona = _buscar_persona(cursor, rut_persona)
+                if not persona:
+                    return False, f"No existe una persona con el RUT '{rut_persona}'."
+                rut_persona = persona.RUT # Como está guardado, para que la FK lo encuentre
+                propietario = f"{persona.Nombre} {persona.Apellido}"
+            cursor.execute(sql, (rut_persona, patente))
+            _marcar_cambio(cursor, 'vehiculos')
+            conn.commit()
+            estado_estacionamiento.asignar_propietario(patente, rut_persona, propietario)
+            return True, None
     except Exception as e:
         print(f"❌ Error al asignar vehículo: {e}")
         return False, str(e)
-    finally:
-        if conn: conn.close()
\ No newline at end of file
+
+# --- Importación y Exportación Masiva (CSV) ---
+
+def normalizar_rut(texto):
+    """
+    Valida un RUT chileno (dígito verificador módulo 11) y lo deja como '12345678-5'.
+    Acepta puntos, espacios y el guion opcional. Devuelve None si no es válido.
+    """
+    limpio = re.sub(r'[.\s]', '', texto or '').upper()
+    coincidencia = re.fullmatch(r'(\d{7,8})-?([\dK])', limpio)
+    if not coincidencia:
+        return None
+    cuerpo, dv = coincidencia.groups()
+    suma = sum(int(d) * (2 + i % 6) for i, d in enumerate(reversed(cuerpo)))
+    esperado = {10: 'K', 11: '0'}.get(11 - suma % 11, str(11 - suma % 11))
+    return f"{cuerpo}-{dv}" if dv == esperado else None
+
+def _campo(fila, nombre, largo_maximo, obligatorio=True):
+    valor = (fila.get(nombre) or '').strip()
+    if not valor:
+        if obligatorio:
+            raise ValueError(f"falta {nombre}")
+        return None
+    if len(valor) > largo_maximo:
+        raise ValueError(f"{nombre} supera los {largo_maximo} caracteres")
+    return valor
+
+def _validar_rol(fila):
+    return (_campo(fila, 'Nombre', 50),)
+
+def _validar_persona(fila):
+    rut = normalizar_rut(fila.get('RUT'))
+    if rut is None:
+        raise ValueError(f"RUT inválido: '{fila.get('RUT') or ''}'")
+    activo = (fila.get('Activo') or '1').strip().lower()
+    if activo not in ('1', '0', 'si', 'sí', 'no', 'true', 'false'):
+        raise ValueError(f"Activo inválido: '{activo}' (usar 1/0 o Sí/No)")
+    return (rut, _campo(fila, 'Nombre', 100), _campo(fila, 'Apellido', 100), _campo(fila, 'Telefono', 20, False),
+            _campo(fila, 'Rol', 50, False), activo in ('1', 'si', 'sí', 'true'))
+
+def _validar_vehiculo(fila):
+    patente = re.sub(r'[\s\-·.]', '', fila.get('Patente') or '').upper()
+    if not es_patente_valida(patente):
+        raise ValueError(f"patente inválida: '{fila.get('Patente') or ''}'")
+    rut = None
+    if (fila.get('RUT') or '').strip():
+        rut = normalizar_rut(fila['RUT'])
+        if rut is None:
+            raise ValueError(f"RUT inválido: '{fila['RUT']}'")
+    return (patente, rut)
+
+# Qué hace cada tipo de carga: columnas del CSV, validación por fila, tabla temporal, clave foránea
+# (columna de #Carga, descripción y FROM/WHERE que encuentra las filas cuyo valor no existe) y el
+# MERGE que aplica la carga devolviendo $action por fila.
+_EspecificacionCarga = collections.namedtuple(
+    '_EspecificacionCarga', 'columnas validar tabla_temporal clave_foranea sql_merge sql_exportar'
+)
+
+_CARGAS = {
+    'roles': _EspecificacionCarga(
+        columnas=('Nombre',),
+        validar=_validar_rol,
+        tabla_temporal="CREATE TABLE #Carga (Fila INT PRIMARY KEY, Nombre NVARCHAR(50))",
+        clave_foranea=None,
+        sql_merge="""
+            MERGE Rol AS r USING #Carga AS c ON r.Nombre = c.Nombre
+            WHEN NOT MATCHED THEN INSERT (Nombre) VALUES (c.Nombre)
+            OUTPUT $action;
+        """,
+        sql_exportar="SELECT Nombre FROM Rol ORDER BY Nombre",
+    ),
+    'personas': _EspecificacionCarga(
+        columnas=('RUT', 'Nombre', 'Apellido', 'Telefono', 'Rol', 'Activo'),
+        validar=_validar_persona,
+        tabla_temporal="""
+            CREATE TABLE #Carga (Fila INT PRIMARY KEY, RUT NVARCHAR(12), Nombre NVARCHAR(100), Apellido NVARCHAR(100),
+                                 Telefono NVARCHAR(20), Rol NVARCHAR(50), Activo BIT)
+        """,
+        clave_foranea=('Rol', 'el rol', "FROM #Carga c LEFT JOIN Rol r ON r.Nombre = c.Rol WHERE c.Rol IS NOT NULL AND r.ID IS NULL"),
+        sql_merge="""
+            MERGE Persona AS p
+            USING (SELECT c.RUT, c.Nombre, c.Apellido, c.Telefono, r.ID AS ID_Rol, c.Activo
+                   FROM #Carga c LEFT JOIN Rol r ON r.Nombre = c.Rol) AS c
+                ON p.RUT = c.RUT
+            WHEN MATCHED THEN UPDATE SET Nombre = c.Nombre, Apellido = c.Apellido, Telefono = c.Telefono,
+                                         ID_Rol = c.ID_Rol, Activo = c.Activo
+            WHEN NOT MATCHED THEN INSERT (RUT, Nombre, Apellido, Telefono, ID_Rol, Activo)
+                                  VALUES (c.RUT, c.Nombre, c.Apellido, c.Telefono, c.ID_Rol, c.Activo)
+            OUTPUT $action;
+        """,
+        sql_exportar="""
+            SELECT p.RUT, p.Nombre, p.Apellido, p.Telefono, r.Nombre AS Rol, CAST(p.Activo AS INT) AS Activo
+            FROM Persona p LEFT JOIN Rol r ON p.ID_Rol = r.ID
+            ORDER BY p.RUT
+        """,
+    ),
+    'vehiculos': _EspecificacionCarga(
+        columnas=('Patente', 'RUT'),
+        validar=_validar_vehiculo,
+        tabla_temporal="CREATE TABLE #Carga (Fila INT PRIMARY KEY, Patente NVARCHAR(10), RUT NVARCHAR(12))",
+        clave_foranea=('RUT', 'la persona con RUT', "FROM #Carga c LEFT JOIN Persona p ON p.RUT = c.RUT WHERE c.RUT IS NOT NULL AND p.RUT IS NULL"),
+        # Un vehículo nuevo queda 'Fuera' con un último movimiento antiguo: su primera lectura será una Entrada
+        sql_merge="""
+            MERGE Vehiculos WITH (HOLDLOCK) AS v USING #Carga AS c ON v.Patente = c.Patente
+            WHEN MATCHED THEN UPDATE SET RUT_Persona = c.RUT
+            WHEN NOT MATCHED THEN INSERT (Patente, Estado, UltimoMovimiento, RUT_Persona)
+                                  VALUES (c.Patente, 'Fuera', '19000101', c.RUT)
+            OUTPUT $action;
+        """,
+        sql_exportar="SELECT Patente, RUT_Persona AS RUT FROM Vehiculos ORDER BY Patente",
+    ),
+}
+TIPOS_CARGA = tuple(_CARGAS)
+
+def _clave_columna(nombre):
+    """'Teléfono ' -> 'telefono': los encabezados se comparan sin tildes, mayúsculas ni espacios."""
+    sin_tildes = unicodedata.normalize('NFKD', nombre or '').encode('ascii', 'ignore').decode()
+    return sin_tildes.strip().lower().replace(' ', '_')
+
+def _leer_csv(ruta, columnas):
+    """
+    Recorre un CSV (coma, punto y coma o tabulación; con o sin BOM de Excel) entregando
+    (número de línea, dict con los nombres de `columnas`). Las columnas desconocidas se ignoran.
+    """
+    with open(ruta, newline='', encoding='utf-8-sig') as f:
+        muestra = f.read(4096)
+        f.seek(0)
+        try:
+            dialecto = csv.Sniffer().sniff(muestra, delimiters=',;\t')
+        except csv.Error:
+            dialecto = csv.excel
+        lector = csv.reader(f, dialecto)
+        encabezado = next(lector, [])
+        por_clave = {_clave_columna(c): c for c in columnas}
+        indices = {por_clave[_clave_columna(c)]: i for i, c in enumerate(encabezado) if _clave_columna(c) in por_clave}
+        if columnas[0] not in indices:
+            raise ValueError(f"El archivo no tiene la columna '{columnas[0]}' (columnas esperadas: {', '.join(columnas)})")
+        for valores in lector:
+            if not any(v.strip() for v in valores):
+                continue
+            yield lector.line_num, {c: valores[i] if i < len(valores) else '' for c, i in indices.items()}
+
+def importar_csv(tipo, ruta, tamano_lote=1000):
+    """
+    Carga masiva de roles, personas o vehículos desde un CSV, en una sola transacción.
+    Cada fila se valida (RUT con dígito verificador, es_patente_valida, largos, rol y dueño existentes);
+    las filas válidas se suben con fast_executemany a una tabla temporal y se aplican con un MERGE:
+    las existentes se actualizan y las nuevas se insertan. Las filas con error no se cargan.
+    :param tipo: 'roles', 'personas' o 'vehiculos' (ver TIPOS_CARGA).
+    :param tamano_lote: Filas enviadas por cada executemany.
+    :return: (success, msg, errores) con errores = [(línea del archivo, motivo)].
+    """
+    especificacion = _CARGAS[tipo]
+    errores = []
+    validas = []
+    primera_linea = {} # Clave (RUT/Patente/Nombre) -> línea donde apareció, para detectar repetidos
+    try:
+        for linea, fila in _leer_csv(ruta, especificacion.columnas):
+            try:
+                valores = especificacion.validar(fila)
+            except ValueError as e:
+                errores.append((linea, str(e)))
+                continue
+            if valores[0] in primera_linea:
+                errores.append((linea, f"{valores[0]} está repetido (ya aparece en la línea {primera_linea[valores[0]]})"))
+                continue
+            primera_linea[valores[0]] = linea
+            validas.append((linea,) + valores)
+    except (OSError, UnicodeDecodeError, ValueError, csv.Error) as e:
+        return False, f"No se pudo leer '{ruta}': {e}", errores
+    if not validas:
+        return False, f"No hay filas válidas para cargar ({len(errores)} con errores).", errores
+
+    try:
+        with conexion_bd() as conn:
+            if not conn: return False, "Sin conexión a BD", errores
+            cursor = conn.cursor()
+            cursor.execute("DROP TABLE IF EXISTS #Carga; " + especificacion.tabla_temporal)
+            cursor.fast_executemany = True
+            marcadores = ', '.join('?' * (len(especificacion.columnas) + 1))
+            for inicio in range(0, len(validas), tamano_lote):
+                cursor.executemany(f"INSERT INTO #Carga VALUES ({marcadores})", validas[inicio:inicio + tamano_lote])
+            faltantes = []
+            if especificacion.clave_foranea:
+                columna, descripcion, condicion = especificacion.clave_foranea
+                faltantes = cursor.execute(f"SELECT c.Fila, c.{columna} {condicion}").fetchall()
+                if faltantes:
+                    errores.extend((fila, f"no existe {descripcion} '{valor}'") for fila, valor in faltantes)
+                    cursor.execute(f"DELETE c {condicion}")
+            acciones = [row[0] for row in cursor.execute(especificacion.sql_merge).fetchall()]
+            cursor.execute("DROP TABLE #Carga")
+            _marcar_cambio(cursor, tipo) # Los tipos de carga se llaman igual que las marcas
+            conn.commit()
+    except Exception as e:
+        print(f"❌ Error en la carga masiva de {tipo}: {e}")
+        return False, str(e), errores
+
+    if tipo != 'roles':
+        estado_estacionamiento.invalidar() # Cambian propietarios de vehículos en memoria
+    errores.sort()
+    insertadas, actualizadas = acciones.count('INSERT'), acciones.count('UPDATE')
+    sin_cambios = len(validas) - len(faltantes) - insertadas - actualizadas # Roles que ya existían
+    msg = f"{tipo.capitalize()}: {insertadas} nuevos, {actualizadas} actualizados"
+    if sin_cambios:
+        msg += f", {sin_cambios} ya existían"
+    return True, f"{msg}, {len(errores)} filas con errores.", errores
+
+def escribir_reporte_errores(errores, ruta):
+    """Guarda en un CSV (Linea, Error) el reporte de filas rechazadas por importar_csv."""
+    with open(ruta, 'w', newline='', encoding='utf-8-sig') as f:
+        escritor = csv.writer(f)
+        escritor.writerow(('Linea', 'Error'))
+        escritor.writerows(errores)
+
+def exportar_csv(tipo, ruta, tamano_lote=1000):
+    """
+    Exporta roles, personas o vehículos a un CSV con las mismas columnas que acepta importar_csv.
+    Las filas se leen con fetchmany y se escriben a medida que llegan, sin cargar la tabla en memoria.
+    :return: (success, msg)
+    """
+    especificacion = _CARGAS[tipo]
+    try:
+        with conexion_bd() as conn:
+            if not conn: return False, "Sin conexión a BD"
+            cursor = conn.cursor()
+            cursor.execute(especificacion.sql_exportar)
+            total = 0
+            with open(ruta, 'w', newline='', encoding='utf-8-sig') as f:
+                escritor = csv.writer(f)
+                escritor.writerow(especificacion.columnas)
+                while True:
+                    filas = cursor.fetchmany(tamano_lote)
+                    if not filas:
+                        break
+                    escritor.writerows(tuple('' if v is None else v for v in fila) for fila in filas)
+                    total += len(filas)
+            return True, f"Se exportaron {total} {tipo} a '{ruta}'."
+    except Exception as e:
+        print(f"❌ Error al exportar {tipo}: {e}")
+        return False, str(e)
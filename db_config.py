@@ -1,20 +1,41 @@
 import pyodbc
 import configparser
+import threading
+import time
+from contextlib import contextmanager
 
-def get_connection():
-    config = configparser.ConfigParser()
-    config.read('config.ini')
+_config = None
+_config_lock = threading.Lock()
+
+def obtener_config():
+    """Lee config.ini una sola vez y devuelve siempre el mismo ConfigParser."""
+    global _config
+    if _config is None:
+        with _config_lock:
+            if _config is None:
+                config = configparser.ConfigParser()
+                config.read('config.ini')
+                _config = config
+    return _config
+
+def _cadena_conexion():
+    config = obtener_config()
     server = config['database']['server']
     database = config['database']['database']
+    return (
+        f'DRIVER={{ODBC Driver 17 for SQL Server}};'
+        f'SERVER={server};'
+        f'DATABASE={database};'
+        'Trusted_Connection=yes;'
+        'TrustServerCertificate=yes;'
+    )
 
+def get_connection():
+    """Abre una conexión nueva a SQL Server (sin pool). Devuelve None si falla."""
     try:
-        conn = pyodbc.connect(
-            f'DRIVER={{ODBC Driver 17 for SQL Server}};'
-            f'SERVER={server};'
-            f'DATABASE={database};'
-            'Trusted_Connection=yes;'
-            'TrustServerCertificate=yes;'
-        )
+        # Sin timeout un servidor caído bloquea cada intento durante el timeout de login del driver
+        timeout = obtener_config().getint('database', 'timeout_conexion', fallback=5)
+        conn = pyodbc.connect(_cadena_conexion(), timeout=timeout)
         print("✅ Conexión exitosa a SQL Server.")
         return conn
 
@@ -23,13 +44,262 @@ def get_connection():
         print(e)
         return None
 
+# --- Pool de Conexiones ---
+
+class PoolConexiones:
+    """
+    Pool de conexiones thread-safe y acotado.
+    - Reutiliza conexiones abiertas (LIFO) en vez de conectar en cada llamada.
+    - Verifica con 'SELECT 1' las conexiones que llevan más de `verificar_tras` segundos sin uso.
+    - Cierra las conexiones libres que superan `max_inactividad` segundos sin uso.
+    - Corta el circuito tras `fallos_circuito` conexiones fallidas seguidas: durante `enfriamiento_circuito`
+      segundos obtener() devuelve None de inmediato en vez de esperar el timeout de conexión en cada
+      llamada; después se deja pasar un solo intento de prueba, que lo vuelve a cerrar si tiene éxito.
+    """
+
+    def __init__(self, fabrica, max_conexiones=5, timeout_espera=5.0, max_inactividad=300.0, verificar_tras=30.0,
+                 fallos_circuito=3, enfriamiento_circuito=30.0):
+        self._fabrica = fabrica
+        self._max_conexiones = max_conexiones
+        self._timeout_espera = timeout_espera
+        self._max_inactividad = max_inactividad
+        self._verificar_tras = verificar_tras
+        self._libres = [] # Pila de (conexion, instante_ultimo_uso)
+        self._abiertas = 0 # Conexiones vivas: libres + prestadas
+        self._cond = threading.Condition()
+        self._fallos_circuito = fallos_circuito
+        self._enfriamiento_circuito = enfriamiento_circuito
+        self._fallos_seguidos = 0
+        self._abierto_hasta = 0.0 # Mientras time.monotonic() sea menor, el circuito está abierto
+        self._probando = False # Hay un intento de prueba en curso con el circuito medio abierto
+        self._stats = {
+            'prestamos': 0,   # Checkouts exitosos
+            'esperas': 0,     # Checkouts que tuvieron que esperar una conexión libre
+            'creadas': 0,     # Conexiones nuevas abiertas (handshakes)
+            'descartadas': 0, # Conexiones cerradas por fallar la verificación o por error
+            'desalojadas': 0, # Conexiones cerradas por inactividad
+            'agotados': 0,    # Checkouts que expiraron sin obtener conexión
+            'rechazados': 0,  # Checkouts rechazados al instante por el circuito abierto
+            'aperturas': 0,   # Veces que se abrió el circuito
+        }
+
+    def obtener(self):
+        """Presta una conexión del pool. Devuelve None si no se pudo obtener una."""
+        with self._cond:
+            if not self._permitir_intento():
+                self._stats['rechazados'] += 1
+                return None
+        limite = time.monotonic() + self._timeout_espera
+        espero = False
+        while True:
+            conn = None
+            desalojadas = []
+            try:
+                with self._cond:
+                    while True:
+                        desalojadas += self._desalojar_inactivas()
+                        if self._libres:
+                            conn, ultimo_uso = self._libres.pop()
+                            break
+                        if self._abiertas < self._max_conexiones:
+                            self._abiertas += 1 # Reservar el cupo antes de conectar fuera del lock
+                            ultimo_uso = None
+                            break
+                        restante = limite - time.monotonic()
+                        if restante <= 0:
+                            self._stats['agotados'] += 1
+                            self._probando = False
+                            return None
+                        if not espero:
+                            espero = True
+                            self._stats['esperas'] += 1
+                        self._cond.wait(restante)
+            finally:
+                for vieja in desalojadas: # Fuera del lock, como en cerrar(): close() puede tardar
+                    self._cerrar(vieja)
+
+            if conn is None:
+                conn = self._fabrica()
+                if conn is None:
+                    self._liberar_cupo()
+                    self._registrar_resultado(False)
+                    return None
+                self._registrar_resultado(True)
+                with self._cond:
+                    self._stats['creadas'] += 1
+                    self._stats['prestamos'] += 1
+                return conn
+
+            if time.monotonic() - ultimo_uso > self._verificar_tras and not self._esta_viva(conn):
+                self._cerrar(conn)
+                with self._cond:
+                    self._stats['descartadas'] += 1
+                self._liberar_cupo()
+                continue # Intentar con otra conexión (o crear una nueva)
+
+            self._registrar_resultado(True)
+            with self._cond:
+                self._stats['prestamos'] += 1
+            return conn
+
+    def circuito_abierto(self):
+        """True si el circuito está abierto (servidor considerado caído) y aún no toca probar de nuevo."""
+        with self._cond:
+            return self._fallos_seguidos >= self._fallos_circuito and time.monotonic() < self._abierto_hasta
+
+    def devolver(self, conn, descartar=False):
+        """
+        Devuelve una conexión al pool, o la cierra si `descartar` es True.
+        Antes de dejarla libre se hace rollback: una transacción implícita abierta (p. ej. un SELECT
+        después del commit) no debe heredarla, ni confirmarla, quien pida la conexión después.
+        Si el rollback falla la conexión se descarta.
+        """
+        if not descartar:
+            try:
+                conn.rollback()
+            except pyodbc.Error:
+                descartar = True
+        if descartar:
+            self._cerrar(conn)
+            with self._cond:
+                self._stats['descartadas'] += 1
+            self._liberar_cupo()
+            return
+        with self._cond:
+            self._libres.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    def cerrar(self):
+        """Cierra todas las conexiones libres del pool."""
+        with self._cond:
+            libres, self._libres = self._libres, []
+            self._abiertas -= len(libres)
+            self._cond.notify_all()
+        for conn, _ in libres:
+            self._cerrar(conn)
+
+    def estadisticas(self):
+        """Devuelve una copia de los contadores del pool junto con su ocupación actual."""
+        with self._cond:
+            stats = dict(self._stats)
+            stats['libres'] = len(self._libres)
+            stats['en_uso'] = self._abiertas - len(self._libres)
+            stats['circuito_abierto'] = self._fallos_seguidos >= self._fallos_circuito and time.monotonic() < self._abierto_hasta
+        return stats
+
+    def _permitir_intento(self):
+        # Debe llamarse con el lock tomado
+        if self._fallos_seguidos < self._fallos_circuito:
+            return True
+        if time.monotonic() < self._abierto_hasta or self._probando:
+            return False
+        self._probando = True # Medio abierto: pasa un solo intento
+        return True
+
+    def _registrar_resultado(self, exito):
+        with self._cond:
+            self._probando = False
+            if exito:
+                if self._fallos_seguidos >= self._fallos_circuito:
+                    print("✅ Conexión con SQL Server restablecida.")
+                self._fallos_seguidos = 0
+                return
+            self._fallos_seguidos += 1
+            if self._fallos_seguidos >= self._fallos_circuito:
+                if self._fallos_seguidos == self._fallos_circuito:
+                    self._stats['aperturas'] += 1
+                    print(f"⚠️ SQL Server no responde: se deja de intentar conectar por {self._enfriamiento_circuito:.0f} s.")
+                self._abierto_hasta = time.monotonic() + self._enfriamiento_circuito
+
+    def _desalojar_inactivas(self):
+        # Debe llamarse con el lock tomado. Las más antiguas están al fondo de la pila.
+        # Devuelve las conexiones desalojadas: quien llama las cierra después de soltar el lock.
+        ahora = time.monotonic()
+        desalojadas = []
+        while self._libres and ahora - self._libres[0][1] > self._max_inactividad:
+            conn, _ = self._libres.pop(0)
+            self._abiertas -= 1
+            self._stats['desalojadas'] += 1
+            desalojadas.append(conn)
+        return desalojadas
+
+    def _liberar_cupo(self):
+        with self._cond:
+            self._abiertas -= 1
+            self._cond.notify()
+
+    @staticmethod
+    def _esta_viva(conn):
+        try:
+            conn.cursor().execute("SELECT 1").fetchone()
+            return True
+        except pyodbc.Error:
+            return False
+
+    @staticmethod
+    def _cerrar(conn):
+        try:
+            conn.close()
+        except pyodbc.Error:
+            pass
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def obtener_pool():
+    """Devuelve el pool global, creándolo con la sección [pool] de config.ini la primera vez."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                config = obtener_config()
+                _pool = PoolConexiones(
+                    get_connection,
+                    max_conexiones=config.getint('pool', 'max_conexiones', fallback=5),
+                    timeout_espera=config.getfloat('pool', 'timeout_espera', fallback=5.0),
+                    max_inactividad=config.getfloat('pool', 'max_inactividad', fallback=300.0),
+                    verificar_tras=config.getfloat('pool', 'verificar_tras', fallback=30.0),
+                    fallos_circuito=config.getint('pool', 'fallos_circuito', fallback=3),
+                    enfriamiento_circuito=config.getfloat('pool', 'enfriamiento_circuito', fallback=30.0),
+                )
+    return _pool
+
+@contextmanager
+def conexion_bd():
+    """
+    Presta una conexión del pool durante el bloque 'with' y la devuelve al salir.
+    Entrega None si no hay conexión disponible, igual que get_connection().
+    Lo que no se haya confirmado con commit (también si el bloque lanza una excepción) se deshace
+    al devolverla; si el rollback falla la conexión se descarta (ver PoolConexiones.devolver).
+    """
+    pool = obtener_pool()
+    conn = pool.obtener()
+    if conn is None:
+        yield None
+        return
+    try:
+        yield conn
+    finally:
+        pool.devolver(conn)
+
+def obtener_estadisticas_pool():
+    """Contadores del pool (préstamos, esperas, conexiones creadas, etc.)."""
+    return obtener_pool().estadisticas()
+
+def cerrar_pool():
+    """Cierra las conexiones libres del pool (llamar al cerrar la aplicación)."""
+    if _pool is not None:
+        _pool.cerrar()
+
 
 
 # Ejemplo de uso
 if __name__ == "__main__":
-    connection = get_connection()
-    if connection:
-        cursor = connection.cursor()
-        cursor.execute("SELECT GETDATE();")
-        print("Hora actual del servidor:", cursor.fetchone()[0])
-        connection.close()
+    for _ in range(3):
+        with conexion_bd() as connection:
+            if connection:
+                cursor = connection.cursor()
+                cursor.execute("SELECT GETDATE();")
+                print("Hora actual del servidor:", cursor.fetchone()[0])
+    print("Estadísticas del pool:", obtener_estadisticas_pool())
+    cerrar_pool()
@@ -1,90 +1,213 @@
 import cv2
-import collections
-from core import model, ocr, es_patente_valida, preprocesar_para_ocr, registrar_movimiento_patente, son_patentes_similares
-
+import threading
+import time
+from core import es_patente_valida, escritor_movimientos, crear_confirmador
+from vision import obtener_modelo, obtener_ocr, preprocesar_para_ocr, detectar_patentes, leer_patentes_lote, crear_detector_movimiento, ParametrosDeteccion
+from pipeline import ColaDescartable, iniciar_etapa, EstadisticaLatencia, crear_controlador_muestreo
+from seguimiento import SeguidorPatentes
+from fuente_video import FuenteVideo, FPS_VISTA
+from eventos import bus_eventos, PATENTE_CONFIRMADA
+
+
+# --- Pipeline en hilos para Cámara IP ---
+class PipelineCamara:
+    """
+    Procesa una cámara IP en etapas que corren en hilos separados, conectadas por colas acotadas
+    que descartan lo más antiguo cuando se llenan:
+        captura -> [último frame] -> detección YOLO -> [cajas] -> OCR -> [lecturas] -> confirmación/BD
+    La captura vacía el buffer de la cámara constantemente con grab(), así un OCR lento no hace que los
+    frames analizados queden segundos atrasados: el detector siempre toma el frame más reciente. Solo se
+    decodifican los frames que el detector está esperando y los de la previsualización (hasta FPS_VISTA).
+    Las cajas se siguen entre frames y solo pasan por OCR las pistas que aún no tienen patente confirmada.
+    Si el tiempo entre la captura y el fin del OCR supera el objetivo de [muestreo], el detector salta
+    frames para liberar CPU a las etapas siguientes (ControladorMuestreo).
+    """
+
+    def __init__(self, fuente, detener, parametros=None):
+        self.fuente = fuente
+        self.detener = detener
+        self.parametros = parametros or ParametrosDeteccion() # ROI, imgsz y conf para model.predict
+        self.cola_frames = ColaDescartable(1)      # Captura -> detección (solo el frame más nuevo)
+        self.cola_detecciones = ColaDescartable(2) # Detección -> OCR
+        self.cola_lecturas = ColaDescartable(50)   # OCR -> confirmación/BD
+        self.cola_vista = ColaDescartable(1)       # Captura -> ventana de previsualización
+        self._pide_frame = threading.Event() # El detector está libre y espera un frame
+        self._pide_frame.set()
+
+        # --- Variables para la lógica de confirmación ---
+        self.detector_movimiento = crear_detector_movimiento(self.parametros) # None = analizar siempre el frame más nuevo
+        self.muestreo = crear_controlador_muestreo() # None = no saltar frames aunque el pipeline se atrase
+        self.confirmador = crear_confirmador() # Votos por pista, patentes confirmadas con expiración
+        self.seguidor = SeguidorPatentes(al_olvidar=self.confirmador.olvidar) # Los votos de una pista perdida no se acumulan
+
+        self.anotaciones = [] # Pistas del último frame analizado, para dibujar sobre la previsualización
+        self.frames_capturados = 0
+        self.frames_analizados = 0
+        self.latencia_deteccion = EstadisticaLatencia()
+        self.latencia_ocr = EstadisticaLatencia()
+        self.latencia_registro = EstadisticaLatencia() # Desde la captura del frame hasta encolar el movimiento
+
+    def iniciar(self):
+        hilo_captura = threading.Thread(target=self._capturar, name="CapturaCamara", daemon=True)
+        hilo_captura.start()
+        return [
+            hilo_captura,
+            iniciar_etapa("DeteccionYOLO", self._detectar, self.cola_frames, self.detener),
+            iniciar_etapa("LecturaOCR", self._leer, self.cola_detecciones, self.detener),
+            iniciar_etapa("Confirmacion", self._confirmar, self.cola_lecturas, self.detener),
+        ]
+
+    def _capturar(self):
+        ultima_vista = 0.0
+        while not self.detener.is_set():
+            if not self.fuente.avanzar():
+                print("Error: No se pudo leer el fotograma de la cámara. Posiblemente la conexión se perdió.")
+                self.detener.set()
+                break
+            self.frames_capturados += 1
+            t_captura = self.fuente.t_captura
+            # Mientras el detector está ocupado los frames solo se avanzan; el muestreo puede saltar más
+            para_deteccion = self._pide_frame.is_set() and (not self.muestreo or self.muestreo.debe_analizar())
+            para_vista = t_captura - ultima_vista >= 1 / FPS_VISTA
+            if not (para_deteccion or para_vista):
+                continue
+            frame = self.fuente.leer()
+            if frame is None:
+                continue
+            if para_deteccion:
+                self._pide_frame.clear()
+                self.cola_frames.put((frame, self.fuente.fecha_captura, t_captura))
+            if para_vista:
+                ultima_vista = t_captura
+                self.cola_vista.put(frame)
+
+    def _detectar(self, captura):
+        try:
+            self._detectar_frame(captura)
+        finally:
+            self._pide_frame.set() # Listo para el próximo frame
+
+    def _detectar_frame(self, captura):
+        frame, _, t_captura = captura
+        if self.detector_movimiento and not self.detector_movimiento.hay_movimiento(frame):
+            if self.muestreo:
+                self.muestreo.registrar_retraso(time.monotonic() - t_captura)
+            return # Escena estática: no se corre YOLO
+        inicio = time.monotonic()
+        p = self.parametros
+        cajas = detectar_patentes(frame, conf=p.conf, roi=p.roi, imgsz=p.imgsz) # Solo sobre el ROI del carril
+        pistas = self.seguidor.actualizar(cajas)
+        self.latencia_deteccion.medir_desde(inicio)
+        self.frames_analizados += 1
+        self.anotaciones = pistas
+
+        # Solo se leen las pistas sin patente confirmada; la caja se copia porque la pista se sigue actualizando
+        pendientes = [(pista, pista.caja) for pista in pistas if self.seguidor.necesita_ocr(pista)]
+        if pendientes:
+            self.cola_detecciones.put((captura, pendientes))
+        elif self.muestreo:
+            self.muestreo.registrar_retraso(time.monotonic() - t_captura) # El frame termina su recorrido aquí
+
+    def _leer(self, deteccion):
+        (frame, fecha_captura, t_captura), pendientes = deteccion
+        inicio = time.monotonic()
+        # 1. Pre-procesar todos los recortes del frame y 2. leerlos con una sola llamada al OCR
+        recortes = [preprocesar_para_ocr(frame[y1:y2, x1:x2]) for _, (x1, y1, x2, y2) in pendientes]
+        textos = leer_patentes_lote(recortes)
+        self.latencia_ocr.medir_desde(inicio)
+        if self.muestreo:
+            self.muestreo.registrar_retraso(time.monotonic() - t_captura) # Captura -> fin del OCR
+        self.seguidor.contar_lecturas_ocr([pista for pista, _ in pendientes])
+
+        for (pista, _), texto_limpio in zip(pendientes, textos):
+            # 3. Validar formato de la patente
+            if es_patente_valida(texto_limpio):
+                self.cola_lecturas.put((pista, texto_limpio, fecha_captura, t_captura))
+
+    def _confirmar(self, lectura):
+        pista, texto_limpio, fecha_captura, t_captura = lectura
+        # 4. Lógica de confirmación por votos de la pista
+        # Una pista nueva puede ser el mismo auto de una pista perdida: el confirmador no la vuelve a dar como nueva
+        patente, nueva = self.confirmador.registrar_lectura(texto_limpio, clave=pista.id)
+        self.seguidor.registrar_lectura(pista, texto_limpio, patente)
+        if nueva:
+            print(f"⭐ Patente CONFIRMADA: {patente}")
+            bus_eventos.publicar(PATENTE_CONFIRMADA, patente=patente, fecha_hora=fecha_captura, fuente=self.fuente.origen)
+            escritor_movimientos.encolar(patente, fecha_captura) # No bloquea el pipeline
+            self.latencia_registro.medir_desde(t_captura)
+
+    def dibujar_anotaciones(self, frame):
+        """Dibuja sobre el frame las últimas cajas y lecturas conocidas."""
+        for pista in self.anotaciones:
+            x1, y1, x2, y2 = pista.caja
+            texto_limpio = pista.texto
+            cv2.rectangle(frame, (x1, y1), (x2, y2), (255, 0, 0), 2)
+            if es_patente_valida(texto_limpio):
+                color = (0, 255, 0) if pista.patente else (255, 255, 0)
+                cv2.putText(frame, texto_limpio, (x1, y1 - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.9, color, 2)
+        if self.muestreo:
+            cv2.putText(frame, self.muestreo.texto(), (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 255), 2)
+        return frame
+
+    def metricas(self):
+        """Contadores y latencias de cada etapa, incluidos los frames descartados por cada cola."""
+        return {
+            'frames_capturados': self.frames_capturados,
+            'frames_analizados': self.frames_analizados,
+            'frames_decodificados': self.fuente.decodificados,
+            'muestreo': self.muestreo.como_dict() if self.muestreo else None,
+            'frames_con_movimiento': self.detector_movimiento.frames_activos if self.detector_movimiento else None,
+            'descartados_frames': self.cola_frames.descartados,
+            'descartados_detecciones': self.cola_detecciones.descartados,
+            'descartados_lecturas': self.cola_lecturas.descartados,
+            'latencia_deteccion': self.latencia_deteccion.como_dict(),
+            'latencia_ocr': self.latencia_ocr.como_dict(),
+            'latencia_registro': self.latencia_registro.como_dict(),
+            'seguimiento': self.seguidor.metricas(),
+            'confirmacion': self.confirmador.metricas(),
+        }
 
 # --- Función Principal de Procesamiento para Cámara IP ---
-def procesar_camara(url_camara):
-    cap = cv2.VideoCapture(url_camara)
-    if not cap.isOpened():
+def procesar_camara(url_camara, stop_event=None):
+    obtener_modelo() # Se cargan la primera vez que se procesa algo
+    obtener_ocr()
+    fuente = FuenteVideo(url_camara)
+    if not fuente.abierta():
         print(f"Error: No se pudo conectar a la cámara IP en '{url_camara}'.")
         print("Asegúrate de que la aplicación de cámara IP esté funcionando en tu celular y que la URL sea correcta.")
         return
 
     print(f"Cámara IP conectada en '{url_camara}'. Presiona 'q' para salir.")
 
-    # --- Variables para la lógica de confirmación ---
-    patente_buffer = collections.deque(maxlen=30) # Almacena las últimas N lecturas válidas
-    patentes_confirmadas = set() # Almacena las patentes ya guardadas en esta sesión
-    CONFIRMATION_THRESHOLD = 3 # Número de veces que una patente debe ser leída para confirmarse
-
-    frame_skip = 5 # Procesar 1 de cada X fotogramas para estabilidad
-    frame_actual = 0
-
-    while True:
-        ret, frame = cap.read()
-        if not ret:
-            print("Error: No se pudo leer el fotograma de la cámara. Posiblemente la conexión se perdió.")
-            break
-
-        if frame_actual % frame_skip == 0: # Solo procesar si es un fotograma seleccionado
-            results = model.predict(frame, conf=0.6, verbose=False) # Usamos conf=0.6
-            
-            for r in results:
-                for box in r.boxes:
-                    class_id = int(box.cls[0])
-                    class_name = model.names[class_id].lower()
-
-                    if 'patente' in class_name or 'license_plate' in class_name:
-                        x1, y1, x2, y2 = map(int, box.xyxy[0])
-                        cv2.rectangle(frame, (x1, y1), (x2, y2), (255, 0, 0), 2)
-                        patente_recortada = frame[y1:y2, x1:x2]
-
-                        # 1. Pre-procesar la imagen para mejorar la lectura
-                        imagen_mejorada = preprocesar_para_ocr(patente_recortada)
-                        
-                        # 2. Leer texto con OCR
-                        ocr_result = ocr.readtext(imagen_mejorada, detail=0, paragraph=True)
-
-                        if ocr_result:
-                            texto_sucio = " ".join(ocr_result)
-                            texto_limpio = "".join(filter(str.isalnum, texto_sucio)).upper()
-
-                            # 3. Validar formato de la patente
-                            if es_patente_valida(texto_limpio):
-                                
-                                # 4. Lógica de confirmación por buffer
-                                es_similar_a_confirmada = any(son_patentes_similares(texto_limpio, p_confirmada) for p_confirmada in patentes_confirmadas)
-                                
-                                if not es_similar_a_confirmada:
-                                    patente_buffer.append(texto_limpio)
-                                    count = patente_buffer.count(texto_limpio)
-
-                                    if count >= CONFIRMATION_THRESHOLD and texto_limpio not in patentes_confirmadas:
-                                        print(f"⭐ Patente CONFIRMADA: {texto_limpio}")
-                                        registrar_movimiento_patente(texto_limpio)
-                                        patentes_confirmadas.add(texto_limpio)
-                                    
-                                # Dibujar texto en el frame
-                                color = (0, 255, 0) if texto_limpio in patentes_confirmadas else (255, 255, 0)
-                                cv2.putText(frame, texto_limpio, (x1, y1 - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.9, color, 2)
-
-        cv2.imshow("Detección en Cámara IP", frame)
+    detener = stop_event or threading.Event()
+    pipeline = PipelineCamara(fuente, detener, ParametrosDeteccion.desde_config(url_camara))
+    hilos = pipeline.iniciar()
+
+    # La ventana se actualiza en este hilo con el frame más reciente y las últimas anotaciones
+    while not detener.is_set():
+        frame = pipeline.cola_vista.get(timeout=0.1)
+        if frame is None:
+            continue
+        cv2.imshow("Detección en Cámara IP", pipeline.dibujar_anotaciones(frame.copy()))
         if cv2.waitKey(1) & 0xFF == ord('q'): # Q para salir
-            break
-        
-        frame_actual += 1 # Incrementar el contador de fotogramas
+            detener.set()
 
-    cap.release()
+    for hilo in hilos:
+        hilo.join(timeout=5)
+    fuente.liberar()
     cv2.destroyAllWindows()
+    escritor_movimientos.flush(timeout=10) # Esperar a que se guarden los movimientos pendientes
     print("\n--- Proceso de cámara IP finalizado. ---")
-    print(f"Se confirmaron {len(patentes_confirmadas)} patentes únicas en esta sesión: {sorted(list(patentes_confirmadas))}")
+    confirmadas = pipeline.confirmador.confirmadas()
+    print(f"Patentes confirmadas vigentes al cerrar la sesión ({len(confirmadas)}): {sorted(confirmadas)}")
+    print(f"Métricas del pipeline: {pipeline.metricas()}")
 
 
-import configparser
+from db_config import obtener_config
+from migraciones import migrar_al_iniciar
 
 if __name__ == "__main__":
-    config = configparser.ConfigParser()
-    config.read('config.ini')
+    migrar_al_iniciar()
+    config = obtener_config()
     IP_CAMERA_URL = config['camera']['url']
     procesar_camara(IP_CAMERA_URL)
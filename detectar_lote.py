@@ -0,0 +1,274 @@
+"""
+Procesa videos grabados sin interfaz, tan rápido como permita la CPU: sin pausas, sin dibujar y sin
+ventanas. Los archivos se reparten en un pool de procesos (cada uno con su propio YOLO y EasyOCR) y
+las patentes confirmadas se escriben con su marca de tiempo dentro del video en CSV o JSON, y
+opcionalmente en la base de datos.
+
+    python detectar_lote.py grabaciones/*.mp4 --salida eventos.csv
+    python detectar_lote.py camara1.mp4 --inicio "2024-05-10 08:00:00" --bd
+    python detectar_lote.py grabacion_larga.mp4 --segmentos 8
+"""
+import argparse
+import csv
+import datetime
+import json
+import os
+import sys
+import time
+import cv2
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from fuente_video import FuenteVideo
+
+CAMPOS = ['archivo', 'patente', 'segundo_video', 'frame', 'fecha_hora', 'movimiento']
+
+def _iniciar_proceso(hilos):
+    """Reparte los núcleos entre los procesos del pool en vez de que cada uno use todos."""
+    cv2.setNumThreads(1)
+    import torch
+    torch.set_num_threads(hilos)
+
+def _fecha_inicio(ruta, duracion_s):
+    """Sin --inicio se asume que el archivo se terminó de grabar en su fecha de modificación."""
+    fin = datetime.datetime.fromtimestamp(os.path.getmtime(ruta))
+    return fin - datetime.timedelta(seconds=duracion_s)
+
+def _evento(ruta, patente, n, fps, inicio):
+    segundo = n / fps
+    return {
+        'archivo': ruta,
+        'patente': patente,
+        'segundo_video': round(segundo, 3),
+        'frame': n,
+        'fecha_hora': inicio + datetime.timedelta(seconds=segundo),
+        'movimiento': None,
+    }
+
+def _crear_analizador(ruta, frame_skip):
+    from detectar_video import AnalizadorVideo # Importa los modelos solo en los procesos que analizan
+    from vision import crear_detector_movimiento, ParametrosDeteccion
+    parametros = ParametrosDeteccion.desde_config(ruta)
+    # Sin muestreo adaptativo: no hay stream en vivo que alcanzar
+    return AnalizadorVideo(frame_skip=frame_skip, detector_movimiento=crear_detector_movimiento(parametros), parametros=parametros)
+
+def _abrir(ruta):
+    fuente = FuenteVideo(ruta)
+    if not fuente.abierta():
+        raise IOError(f"No se pudo abrir el video: '{ruta}'")
+    return fuente, fuente.fps, fuente.total_frames
+
+def _recorrer(fuente, analizador, hasta=None):
+    """Procesa la fuente hasta el frame `hasta` (o el final) decodificando solo los frames que se analizan."""
+    fps = fuente.fps
+    nuevas = []
+    while hasta is None or fuente.posicion + 1 < hasta:
+        analizar = analizador.muestrear()
+        ret, frame = fuente.siguiente(decodificar=analizar)
+        if not ret:
+            break
+        n = fuente.posicion
+        # La expiración usa el tiempo del video
+        nuevas.extend((patente, n) for patente in analizador.procesar(frame, instante=n / fps, muestreado=analizar))
+    return nuevas
+
+def analizar_archivo(ruta, frame_skip=3, inicio=None):
+    """
+    Recorre un video completo y devuelve (eventos, métricas). Cada evento es un dict con las claves de
+    CAMPOS; `segundo_video` sale del número de frame, así el resultado no depende de la velocidad de la CPU.
+    :param inicio: datetime del primer frame; si es None se deduce de la fecha de modificación del archivo.
+    """
+    fuente, fps, total = _abrir(ruta)
+    inicio = inicio or _fecha_inicio(ruta, total / fps)
+    analizador = _crear_analizador(ruta, frame_skip)
+    t0 = time.perf_counter()
+    with fuente:
+        eventos = [_evento(ruta, patente, n, fps, inicio) for patente, n in _recorrer(fuente, analizador)]
+    metricas = analizador.metricas()
+    metricas['segundos_proceso'] = time.perf_counter() - t0
+    metricas['segundos_video'] = (fuente.posicion + 1) / fps
+    metricas['frames_decodificados'] = fuente.decodificados
+    return eventos, metricas
+
+def procesar_archivos(rutas, procesos=None, frame_skip=3, inicio=None):
+    """
+    Analiza los videos en paralelo (un archivo por proceso). Devuelve (eventos ordenados por fecha, errores),
+    donde errores es una lista de (ruta, mensaje).
+    """
+    procesos = max(1, min(procesos or os.cpu_count() or 1, len(rutas)))
+    hilos = max(1, (os.cpu_count() or 1) // procesos)
+    eventos, errores = [], []
+    with ProcessPoolExecutor(max_workers=procesos, initializer=_iniciar_proceso, initargs=(hilos,)) as pool:
+        futuros = {pool.submit(analizar_archivo, ruta, frame_skip, inicio): ruta for ruta in rutas}
+        for futuro in as_completed(futuros):
+            ruta = futuros[futuro]
+            try:
+                eventos_archivo, metricas = futuro.result()
+            except Exception as e:
+                print(f"❌ Error procesando '{ruta}': {e}", file=sys.stderr)
+                errores.append((ruta, str(e)))
+                continue
+            velocidad = metricas['segundos_video'] / metricas['segundos_proceso'] if metricas['segundos_proceso'] else 0.0
+            print(f"✅ {ruta}: {len(eventos_archivo)} patentes, {metricas['segundos_video']:.0f} s de video "
+                  f"en {metricas['segundos_proceso']:.0f} s ({velocidad:.1f}x)", file=sys.stderr)
+            eventos.extend(eventos_archivo)
+    eventos.sort(key=lambda e: (e['fecha_hora'], e['archivo']))
+    return eventos, errores
+
+# --- Un solo video largo repartido en segmentos ---
+
+def analizar_segmento(ruta, desde, hasta, frame_skip=3):
+    """
+    Analiza los frames [desde, hasta) de un video y devuelve (lecturas, métricas), donde cada lectura es
+    (frame, id_pista, caja, texto). Las lecturas se confirman después, en orden, en el proceso principal.
+    """
+    fuente, fps, _ = _abrir(ruta)
+    analizador = _crear_analizador(ruta, frame_skip)
+    analizador.lecturas = []
+    t0 = time.perf_counter()
+    with fuente:
+        if desde:
+            fuente.ir_a_frame(desde)
+        _recorrer(fuente, analizador, hasta)
+    lecturas = [(desde + i, id_pista, caja, texto) for i, id_pista, caja, texto in analizador.lecturas]
+    metricas = analizador.metricas()
+    metricas['segundos_proceso'] = time.perf_counter() - t0
+    metricas['segundos_video'] = (fuente.posicion + 1 - desde) / fps
+    metricas['frames_decodificados'] = fuente.decodificados
+    return lecturas, metricas
+
+def _unir_pistas(anteriores, solapadas):
+    """
+    Relaciona las pistas de un segmento con las del segmento anterior usando las lecturas de los frames
+    que ambos analizaron: misma caja en el mismo frame, o el mismo texto (a distancia <= 1).
+    :param anteriores: Lecturas (frame, clave, caja, texto) del segmento anterior en la zona de solapamiento.
+    :param solapadas: Lecturas (frame, id_pista, caja, texto) del segmento nuevo en esa misma zona.
+    :return: dict id_pista -> clave de la pista anterior.
+    """
+    from core import son_patentes_similares
+    from seguimiento import iou
+    alias = {}
+    for frame, id_pista, caja, texto in solapadas:
+        if id_pista in alias:
+            continue
+        for frame_a, clave, caja_a, texto_a in anteriores:
+            if (frame == frame_a and iou(caja, caja_a) >= 0.3) or son_patentes_similares(texto, texto_a):
+                alias[id_pista] = clave
+                break
+    return alias
+
+def procesar_video_segmentado(ruta, segmentos, procesos=None, frame_skip=3, inicio=None, solapamiento=2.0):
+    """
+    Reparte un video en `segmentos` tramos de tiempo que se analizan en paralelo. Cada tramo empieza
+    `solapamiento` segundos antes de su límite para que el seguidor y la compuerta de movimiento lleguen
+    ya inicializados. Las pistas que cruzan un límite se unen con las del tramo anterior y todas las
+    lecturas se confirman en orden con un único ConfirmadorPatentes, igual que en una pasada secuencial:
+    una patente partida entre dos tramos no se pierde ni se cuenta dos veces.
+    Devuelve (eventos, métricas por segmento).
+    """
+    from core import crear_confirmador
+    fuente, fps, total = _abrir(ruta)
+    fuente.liberar()
+    inicio = inicio or _fecha_inicio(ruta, total / fps)
+    segmentos = max(1, min(segmentos, total))
+    limites = [total * i // segmentos for i in range(segmentos + 1)]
+    margen = int(solapamiento * fps)
+    procesos = max(1, min(procesos or os.cpu_count() or 1, segmentos))
+    hilos = max(1, (os.cpu_count() or 1) // procesos)
+
+    resultados = [None] * segmentos
+    with ProcessPoolExecutor(max_workers=procesos, initializer=_iniciar_proceso, initargs=(hilos,)) as pool:
+        futuros = {
+            pool.submit(analizar_segmento, ruta, max(0, limites[i] - margen) if i else 0, limites[i + 1], frame_skip): i
+            for i in range(segmentos)
+        }
+        for futuro in as_completed(futuros):
+            i = futuros[futuro]
+            resultados[i] = futuro.result()
+            print(f"✅ Segmento {i + 1}/{segmentos} listo ({resultados[i][1]['segundos_proceso']:.0f} s)", file=sys.stderr)
+
+    # Cada lectura queda con una clave global de pista; del solapamiento se usan las del tramo anterior
+    lecturas = []
+    for i, (lecturas_segmento, _) in enumerate(resultados):
+        frontera = limites[i]
+        anteriores = [l for l in lecturas if l[0] >= frontera - margen]
+        alias = _unir_pistas(anteriores, [l for l in lecturas_segmento if l[0] < frontera])
+        lecturas.extend((frame, alias.get(id_pista, (i, id_pista)), caja, texto)
+                        for frame, id_pista, caja, texto in lecturas_segmento if frame >= frontera)
+
+    confirmador = crear_confirmador()
+    eventos = []
+    for frame, clave, _, texto in lecturas: # Ya están en orden de frame
+        patente, nueva = confirmador.registrar_lectura(texto, clave=clave, instante=frame / fps)
+        if nueva:
+            eventos.append(_evento(ruta, patente, frame, fps, inicio))
+    return eventos, [m for _, m in resultados]
+
+def registrar_eventos(eventos):
+    """
+    Registra los eventos en la base de datos en orden cronológico, anotando en cada uno si fue Entrada o Salida.
+    El servidor ignora los eventos anteriores al último movimiento ya registrado de la patente: cargar un video
+    más antiguo que lo que ya está en la base no intercala movimientos, y esos eventos quedan sin 'movimiento'.
+    :return: Cantidad de eventos que no generaron movimiento.
+    """
+    from core import registrar_movimiento_patente
+    for evento in eventos:
+        evento['movimiento'] = registrar_movimiento_patente(evento['patente'], evento['fecha_hora'])
+    sin_movimiento = sum(1 for evento in eventos if evento['movimiento'] is None)
+    if sin_movimiento:
+        print(f"⚠️ {sin_movimiento} de {len(eventos)} eventos no generaron movimiento: duplicados dentro de la ventana, "
+              "anteriores al último movimiento registrado de su patente, o guardados en la bitácora local.", file=sys.stderr)
+    return sin_movimiento
+
+def escribir_eventos(eventos, salida):
+    """Escribe los eventos en CSV, o en JSON si `salida` termina en .json. Sin ruta se escribe CSV en stdout."""
+    filas = [dict(e, fecha_hora=e['fecha_hora'].isoformat(sep=' ', timespec='milliseconds')) for e in eventos]
+    if salida and salida.lower().endswith('.json'):
+        with open(salida, 'w', encoding='utf-8') as f:
+            json.dump(filas, f, ensure_ascii=False, indent=2)
+        return
+    f = open(salida, 'w', newline='', encoding='utf-8') if salida else sys.stdout
+    try:
+        escritor = csv.DictWriter(f, fieldnames=CAMPOS)
+        escritor.writeheader()
+        escritor.writerows(filas)
+    finally:
+        if salida:
+            f.close()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('videos', nargs='+', help="Archivos de video a procesar")
+    parser.add_argument('--salida', help="Archivo .csv o .json para los eventos (por defecto, CSV en la salida estándar)")
+    parser.add_argument('--procesos', type=int, help="Procesos en paralelo (por defecto, uno por núcleo)")
+    parser.add_argument('--frame-skip', type=int, default=3, help="Muestreo fijo si la compuerta de movimiento está deshabilitada")
+    parser.add_argument('--inicio', type=datetime.datetime.fromisoformat,
+                        help="Fecha y hora del primer frame (por defecto, la de modificación del archivo menos su duración)")
+    parser.add_argument('--bd', action='store_true', help="Registrar también los movimientos en la base de datos")
+    parser.add_argument('--segmentos', type=int, default=1,
+                        help="Repartir cada video en N tramos procesados en paralelo (para grabaciones largas)")
+    parser.add_argument('--solapamiento', type=float, default=2.0, help="Segundos que cada tramo re-analiza antes de su límite")
+    args = parser.parse_args()
+
+    if args.segmentos > 1:
+        eventos, errores = [], []
+        for ruta in args.videos:
+            try:
+                eventos_video, _ = procesar_video_segmentado(ruta, args.segmentos, args.procesos, args.frame_skip,
+                                                             args.inicio, args.solapamiento)
+            except Exception as e:
+                print(f"❌ Error procesando '{ruta}': {e}", file=sys.stderr)
+                errores.append((ruta, str(e)))
+                continue
+            print(f"✅ {ruta}: {len(eventos_video)} patentes", file=sys.stderr)
+            eventos.extend(eventos_video)
+        eventos.sort(key=lambda e: (e['fecha_hora'], e['archivo']))
+    else:
+        eventos, errores = procesar_archivos(args.videos, args.procesos, args.frame_skip, args.inicio)
+    if args.bd:
+        from migraciones import migrar_al_iniciar
+        migrar_al_iniciar()
+        registrar_eventos(eventos)
+    escribir_eventos(eventos, args.salida)
+    sys.exit(1 if errores else 0)
+
+if __name__ == "__main__":
+    main()
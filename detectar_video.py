@@ -1,85 +1,179 @@
 import cv2
-import collections
+import datetime
 import time
-from core import model, ocr, es_patente_valida, preprocesar_para_ocr, registrar_movimiento_patente, son_patentes_similares
+from core import es_patente_valida, escritor_movimientos, crear_confirmador
+from vision import obtener_modelo, obtener_ocr, preprocesar_para_ocr, detectar_patentes, leer_patentes_lote, crear_detector_movimiento, ParametrosDeteccion
+from seguimiento import SeguidorPatentes
+from pipeline import crear_controlador_muestreo
+from fuente_video import FuenteVideo, FPS_VISTA
+from eventos import bus_eventos, PATENTE_CONFIRMADA
+
+VELOCIDAD_REPRODUCCION = 1.5 # procesar_video reproduce a 1.5x el tiempo real como máximo
+
+# --- Análisis por frame (compartido por la GUI, los benchmarks y el modo por lotes) ---
+class AnalizadorVideo:
+    """
+    Lógica de detección de un frame de video: muestreo adaptativo por retraso, compuerta de movimiento
+    (o frame_skip fijo si ambos están deshabilitados), YOLO, seguimiento de pistas, OCR por lotes de las pistas sin confirmar y confirmación.
+    No dibuja ni registra nada: devuelve las patentes recién confirmadas.
+    """
+
+    def __init__(self, frame_skip=3, detector_movimiento=None, parametros=None, muestreo=None):
+        """
+        :param frame_skip: Sin compuerta de movimiento ni muestreo adaptativo, se analiza 1 de cada N frames.
+        :param detector_movimiento: DetectorMovimiento que decide qué frames analizar (None = usar frame_skip).
+        :param parametros: ParametrosDeteccion (ROI, imgsz, conf) para model.predict.
+        :param muestreo: pipeline.ControladorMuestreo que salta frames cuando el análisis se atrasa.
+        """
+        self.frame_skip = frame_skip
+        self.detector_movimiento = detector_movimiento
+        self.muestreo = muestreo
+        self.parametros = parametros or ParametrosDeteccion()
+        self.confirmador = crear_confirmador() # Votos por pista, patentes confirmadas con expiración
+        self.seguidor = SeguidorPatentes(al_olvidar=self.confirmador.olvidar) # Los votos de una pista perdida no se acumulan
+        self.pistas = [] # Pistas del último frame analizado
+        self.lecturas = None # Si es una lista, se agrega (frame, id_pista, caja, texto) por cada lectura válida
+        self.frames_vistos = 0
+        self.frames_analizados = 0
+
+    def muestrear(self):
+        """
+        Decide, sin mirar el frame, si el próximo frame puede analizarse (muestreo adaptativo o frame_skip).
+        Llamarla antes de decodificar: si devuelve False el frame se puede saltar con FuenteVideo.siguiente(False).
+        """
+        if self.muestreo is not None:
+            return self.muestreo.debe_analizar() # False = frame saltado para no atrasarse
+        if self.detector_movimiento is not None:
+            return True # La compuerta de movimiento necesita ver el frame
+        return self.frames_vistos % self.frame_skip == 0
+
+    def procesar(self, frame, instante=None, muestreado=None):
+        """
+        Analiza el frame si corresponde y devuelve la lista de patentes confirmadas por primera vez en él.
+        :param instante: Segundos usados para expirar confirmaciones (por defecto, el reloj del sistema).
+        :param muestreado: Resultado de muestrear() si ya se llamó antes de decodificar; con False `frame` puede ser None.
+        """
+        analizar = self.muestrear() if muestreado is None else muestreado
+        self.frames_vistos += 1
+        if not analizar:
+            return []
+        if self.detector_movimiento is not None and not self.detector_movimiento.hay_movimiento(frame):
+            return [] # Sin movimiento no se corre YOLO
+        self.frames_analizados += 1
+
+        p = self.parametros
+        cajas = detectar_patentes(frame, conf=p.conf, roi=p.roi, imgsz=p.imgsz) # Solo sobre el ROI
+        self.pistas = self.seguidor.actualizar(cajas)
+        pendientes = [pista for pista in self.pistas if self.seguidor.necesita_ocr(pista)] # Las confirmadas ya no se leen
+
+        try:
+            recortes = [preprocesar_para_ocr(frame[y1:y2, x1:x2]) for x1, y1, x2, y2 in (p.caja for p in pendientes)]
+            textos = leer_patentes_lote(recortes) # Una sola llamada al OCR por frame
+            self.seguidor.contar_lecturas_ocr(pendientes)
+        except Exception as e:
+            print(f"Error procesando recortes de patente: {e}")
+            textos = [""] * len(pendientes)
+
+        nuevas = []
+        for pista, texto_limpio in zip(pendientes, textos):
+            if es_patente_valida(texto_limpio):
+                if self.lecturas is not None:
+                    self.lecturas.append((self.frames_vistos - 1, pista.id, pista.caja, texto_limpio))
+                patente, nueva = self.confirmador.registrar_lectura(texto_limpio, clave=pista.id, instante=instante)
+                self.seguidor.registrar_lectura(pista, texto_limpio, patente)
+                if nueva:
+                    nuevas.append(patente)
+        return nuevas
+
+    def dibujar(self, frame):
+        """Dibuja las cajas y lecturas del último frame analizado."""
+        for pista in self.pistas:
+            x1, y1, x2, y2 = pista.caja
+            cv2.rectangle(frame, (x1, y1), (x2, y2), (255, 0, 0), 2)
+            if es_patente_valida(pista.texto):
+                color = (0, 255, 0) if pista.patente else (255, 255, 0)
+                cv2.putText(frame, pista.texto, (x1, y1 - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.9, color, 2)
+        return frame
+
+    def metricas(self):
+        return {
+            'frames_vistos': self.frames_vistos,
+            'frames_analizados': self.frames_analizados,
+            'muestreo': self.muestreo.como_dict() if self.muestreo else None,
+            'seguimiento': self.seguidor.metricas(),
+            'confirmacion': self.confirmador.metricas(),
+        }
 
 # --- Función Principal de Procesamiento de Video (Refactorizada para GUI) ---
 def procesar_video(ruta_video, frame_callback, stop_event, frame_skip=3):
     """
-    Procesa un video para detectar patentes y llama a un callback en cada frame.
+    Procesa un video para detectar patentes y llama a un callback con los frames decodificados
+    (los analizados y, como máximo, FPS_VISTA por segundo de los demás).
     :param ruta_video: Ruta del archivo de video.
     :param frame_callback: Función a la que se le pasa cada frame procesado.
     :param stop_event: threading.Event para detener el bucle de procesamiento.
-    :param frame_skip: Número de frames a saltar para optimizar el rendimiento.
+    :param frame_skip: Número de frames a saltar si la compuerta de movimiento ([movimiento]) y el muestreo adaptativo ([muestreo]) están deshabilitados.
     """
-    cap = cv2.VideoCapture(ruta_video)
-    if not cap.isOpened():
+    obtener_modelo() # Se cargan la primera vez que se procesa algo
+    obtener_ocr()
+    fuente = FuenteVideo(ruta_video)
+    if not fuente.abierta():
         print(f"Error al abrir el video: '{ruta_video}'")
         return
 
-    fps = int(cap.get(cv2.CAP_PROP_FPS))
-    print(f"Video cargado. Procesando a aprox. {fps/frame_skip:.1f} FPS.")
-
-    patente_buffer = collections.deque(maxlen=30)
-    patentes_confirmadas = set()
-    CONFIRMATION_THRESHOLD = 3
-    frame_actual = 0
-
+    fps = int(fuente.fps)
+    parametros = ParametrosDeteccion.desde_config(ruta_video)
+    muestreo = crear_controlador_muestreo()
+    analizador = AnalizadorVideo(frame_skip=frame_skip, detector_movimiento=crear_detector_movimiento(parametros),
+                                 parametros=parametros, muestreo=muestreo)
+    if analizador.detector_movimiento:
+        print(f"Video cargado ({fps} FPS). Se analizan solo los frames con movimiento.")
+    elif muestreo:
+        print(f"Video cargado ({fps} FPS). Se saltan frames solo si el análisis se atrasa más de {muestreo.objetivo * 1000:.0f} ms.")
+    else:
+        print(f"Video cargado. Procesando a aprox. {fps/frame_skip:.1f} FPS.")
+
+    # Reloj de reproducción: el frame n debería terminar de procesarse a los n / (fps * velocidad) segundos
+    periodo = 1 / (fps * VELOCIDAD_REPRODUCCION)
+    intervalo_vista = max(1, round(fps / FPS_VISTA))
+    inicio = time.monotonic()
+    n = 0
     while not stop_event.is_set():
-        ret, frame = cap.read()
+        # Los frames que no se analizan ni se muestran solo se avanzan (grab), sin decodificarlos
+        analizar = analizador.muestrear()
+        mostrar = frame_callback is not None and n % intervalo_vista == 0
+        ret, frame = fuente.siguiente(decodificar=analizar or mostrar)
+        fecha_captura = datetime.datetime.now()
         if not ret:
             print("Fin del video.")
             break
 
-        if frame_actual % frame_skip == 0:
-            results = model.predict(frame, conf=0.6, verbose=False)
-            
-            for r in results:
-                for box in r.boxes:
-                    class_id = int(box.cls[0])
-                    class_name = model.names[class_id].lower()
-
-                    if 'patente' in class_name or 'license_plate' in class_name:
-                        x1, y1, x2, y2 = map(int, box.xyxy[0])
-                        cv2.rectangle(frame, (x1, y1), (x2, y2), (255, 0, 0), 2)
-                        patente_recortada = frame[y1:y2, x1:x2]
-
-                        try:
-                            imagen_mejorada = preprocesar_para_ocr(patente_recortada)
-                            ocr_result = ocr.readtext(imagen_mejorada, detail=0, paragraph=True)
-
-                            if ocr_result:
-                                texto_sucio = " ".join(ocr_result)
-                                texto_limpio = "".join(filter(str.isalnum, texto_sucio)).upper()
-
-                                if es_patente_valida(texto_limpio):
-                                    es_similar_a_confirmada = any(son_patentes_similares(texto_limpio, p_confirmada) for p_confirmada in patentes_confirmadas)
-                                    
-                                    if not es_similar_a_confirmada:
-                                        patente_buffer.append(texto_limpio)
-                                        count = patente_buffer.count(texto_limpio)
-
-                                        if count >= CONFIRMATION_THRESHOLD and texto_limpio not in patentes_confirmadas:
-                                            print(f"⭐ Patente CONFIRMADA: {texto_limpio}")
-                                            registrar_movimiento_patente(texto_limpio)
-                                            patentes_confirmadas.add(texto_limpio)
-                                    
-                                    color = (0, 255, 0) if texto_limpio in patentes_confirmadas else (255, 255, 0)
-                                    cv2.putText(frame, texto_limpio, (x1, y1 - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.9, color, 2)
-                        except Exception as e:
-                            print(f"Error procesando recorte de patente: {e}")
+        for patente in analizador.procesar(frame, muestreado=analizar):
+            print(f"⭐ Patente CONFIRMADA: {patente}")
+            bus_eventos.publicar(PATENTE_CONFIRMADA, patente=patente, fecha_hora=fecha_captura, fuente=ruta_video)
+            escritor_movimientos.encolar(patente, fecha_captura) # No bloquea el bucle
+
+        n += 1
+        retraso = time.monotonic() - inicio - n * periodo
+        if muestreo:
+            muestreo.registrar_retraso(max(0.0, retraso))
 
         # Enviar el frame a la GUI a través del callback
-        if frame_callback:
+        if frame is not None and frame_callback:
+            analizador.dibujar(frame)
+            if muestreo:
+                cv2.putText(frame, muestreo.texto(), (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 255), 2)
             frame_callback(frame)
-        
-        frame_actual += 1
-        # Pequeña pausa para no saturar la GUI y controlar la velocidad de reproducción
-        time.sleep(1 / (fps * 1.5))
+
+        # Si vamos adelantados se espera al reloj de reproducción; si vamos atrasados no se duerme
+        if retraso < 0:
+            time.sleep(-retraso)
 
 
-    cap.release()
+    fuente.liberar()
+    escritor_movimientos.flush(timeout=10) # Esperar a que se guarden los movimientos pendientes
     print("\n--- Proceso de video finalizado. ---")
+    print(f"Métricas: {analizador.metricas()} | frames decodificados: {fuente.decodificados}/{fuente.avanzados}")
     # La GUI será notificada de la finalización porque el hilo terminará.
 
 if __name__ == "__main__":
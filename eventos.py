@@ -0,0 +1,79 @@
+import collections
+import threading
+import time
+
+# --- Bus de eventos en proceso ---
+
+Evento = collections.namedtuple('Evento', 'tipo datos instante')
+
+# Tipos de evento publicados
+PATENTE_CONFIRMADA = 'patente_confirmada'       # datos: patente, fecha_hora, fuente
+MOVIMIENTO_REGISTRADO = 'movimiento_registrado' # datos: patente, tipo_movimiento, fecha_hora
+
+class Suscripcion:
+    """
+    Cola de eventos de un suscriptor. Es acotada y nunca bloquea a quien publica: si el suscriptor
+    no la vacía a tiempo se descartan los eventos más antiguos (y se cuentan en `descartados`).
+    """
+
+    def __init__(self, bus, tipos, maxsize):
+        self._bus = bus
+        self.tipos = tipos
+        self._eventos = collections.deque(maxlen=maxsize)
+        self._lock = threading.Lock()
+        self.descartados = 0
+
+    def _entregar(self, evento):
+        with self._lock:
+            if len(self._eventos) == self._eventos.maxlen:
+                self.descartados += 1
+            self._eventos.append(evento)
+
+    def pendientes(self):
+        """Devuelve y quita todos los eventos recibidos desde la última llamada, en orden de publicación."""
+        with self._lock:
+            eventos = list(self._eventos)
+            self._eventos.clear()
+        return eventos
+
+    def cancelar(self):
+        self._bus.cancelar(self)
+
+class BusEventos:
+    """
+    Bus publicar/suscribir dentro del proceso, thread-safe y con varios suscriptores. Los hilos de
+    detección y el escritor de movimientos publican; la GUI vacía su Suscripcion desde el hilo de Tk
+    con after(), así nunca toca widgets desde otro hilo.
+    """
+
+    def __init__(self):
+        self._suscripciones = []
+        self._lock = threading.Lock()
+        self.publicados = 0
+
+    def suscribir(self, tipos=None, maxsize=1000):
+        """
+        :param tipos: Tipos de evento que interesan (None = todos).
+        :param maxsize: Eventos que se guardan mientras el suscriptor no los lee.
+        """
+        suscripcion = Suscripcion(self, frozenset(tipos) if tipos else None, maxsize)
+        with self._lock:
+            self._suscripciones.append(suscripcion)
+        return suscripcion
+
+    def cancelar(self, suscripcion):
+        with self._lock:
+            if suscripcion in self._suscripciones:
+                self._suscripciones.remove(suscripcion)
+
+    def publicar(self, tipo, **datos):
+        evento = Evento(tipo, datos, time.time())
+        with self._lock:
+            suscripciones = list(self._suscripciones)
+            self.publicados += 1
+        for suscripcion in suscripciones:
+            if suscripcion.tipos is None or tipo in suscripcion.tipos:
+                suscripcion._entregar(evento)
+        return evento
+
+bus_eventos = BusEventos()
@@ -0,0 +1,98 @@
+import datetime
+import threading
+import time
+import cv2
+
+FPS_VISTA = 15 # Tasa máxima a la que se decodifican frames solo para la previsualización
+
+# --- Fuente de frames (archivo de video o cámara IP) ---
+
+class FuenteVideo:
+    """
+    Envoltorio de cv2.VideoCapture que separa avanzar (grab) de decodificar (retrieve): los frames que
+    nadie va a analizar ni mostrar se saltan sin convertirlos a BGR ni copiarlos.
+    - avanzar() toma el siguiente frame del stream; leer() entrega el último tomado como imagen BGR.
+    - En archivos, ir_a() / ir_a_frame() saltan directo a un instante o a un número de frame.
+    Es thread-safe: un hilo puede avanzar continuamente (vaciando el buffer de una cámara) mientras
+    otro lee solo cuando necesita el frame más reciente.
+    """
+
+    def __init__(self, origen):
+        """:param origen: Ruta de un archivo de video o URL de una cámara IP."""
+        self.origen = origen
+        self.es_archivo = '://' not in str(origen)
+        self._cap = cv2.VideoCapture(origen)
+        self._lock = threading.Lock()
+        self.posicion = -1 # Índice del último frame tomado con avanzar()
+        self.fecha_captura = None # datetime y time.monotonic() del último avanzar(), para cámaras en vivo
+        self.t_captura = None
+        self.avanzados = 0
+        self.decodificados = 0
+
+    def abierta(self):
+        return self._cap.isOpened()
+
+    @property
+    def fps(self):
+        return self._cap.get(cv2.CAP_PROP_FPS) or 30
+
+    @property
+    def total_frames(self):
+        """Cantidad de frames del archivo (0 en cámaras)."""
+        return int(self._cap.get(cv2.CAP_PROP_FRAME_COUNT)) if self.es_archivo else 0
+
+    @property
+    def segundo(self):
+        """Segundo del video en que está el último frame tomado."""
+        return self.posicion / self.fps
+
+    def avanzar(self):
+        """Toma el siguiente frame sin decodificarlo a BGR. Devuelve False al terminar el video o perder la cámara."""
+        with self._lock:
+            if not self._cap.grab():
+                return False
+            self.posicion += 1
+            self.avanzados += 1
+            self.fecha_captura = datetime.datetime.now()
+            self.t_captura = time.monotonic()
+            return True
+
+    def leer(self):
+        """Decodifica el último frame tomado con avanzar(). Devuelve None si no se pudo."""
+        with self._lock:
+            ok, frame = self._cap.retrieve()
+            if not ok:
+                return None
+            self.decodificados += 1
+            return frame
+
+    def siguiente(self, decodificar=True):
+        """
+        Avanza un frame y lo decodifica solo si `decodificar` es True.
+        :return: (hay_frame, frame o None si no se decodificó)
+        """
+        if not self.avanzar():
+            return False, None
+        return True, self.leer() if decodificar else None
+
+    def ir_a_frame(self, n):
+        """Posiciona un archivo para que el próximo avanzar() tome el frame `n`."""
+        if not self.es_archivo:
+            raise ValueError("Solo se puede buscar dentro de un archivo de video")
+        with self._lock:
+            self._cap.set(cv2.CAP_PROP_POS_FRAMES, n)
+            self.posicion = int(self._cap.get(cv2.CAP_PROP_POS_FRAMES)) - 1
+
+    def ir_a(self, segundo):
+        """Posiciona un archivo en el instante `segundo` del video."""
+        self.ir_a_frame(int(round(segundo * self.fps)))
+
+    def liberar(self):
+        with self._lock:
+            self._cap.release()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.liberar()
@@ -1,21 +1,67 @@
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
 import threading
+import datetime
 import cv2
 from PIL import Image, ImageTk
 from detectar_video import procesar_video
 from detectar_camara import procesar_camara
 from core import (
     obtener_ocupacion_estacionamiento, obtener_vehiculos_dentro, 
-    obtener_ultimos_movimientos, crear_rol, obtener_roles, 
+    obtener_movimientos_pagina, crear_rol, obtener_roles, 
     actualizar_rol, eliminar_rol, crear_persona, obtener_personas,
     actualizar_persona, eliminar_persona, obtener_vehiculos,
-    obtener_personas_para_asignacion, asignar_vehiculo
+    obtener_personas_para_asignacion, asignar_vehiculo, escritor_movimientos,
+    obtener_marcas_cambios, estado_estacionamiento, importar_csv, exportar_csv, escribir_reporte_errores
 )
-import configparser
+from db_config import cerrar_pool, obtener_config
+from migraciones import migrar_al_iniciar
+from vision import precargar_modelos
+from pipeline import ColaDescartable
+from fuente_video import FPS_VISTA
+from eventos import bus_eventos, MOVIMIENTO_REGISTRADO, PATENTE_CONFIRMADA
+from analitica import actualizar_agregados, obtener_ocupacion_horaria, obtener_estadia_por_rol, obtener_horas_punta
 
 # --- Constantes ---
 TOTAL_ESPACIOS = 30
+INTERVALO_DASHBOARD_MS = 30000 # Reconciliación lenta con la BD; los movimientos de este proceso llegan por el bus de eventos
+INTERVALO_EVENTOS_MS = 200
+FILAS_POR_PAGINA_LOG = 100
+MAX_FILAS_LOG = 500 # Filas del registro en memoria: al cargar más en un extremo se descartan del otro
+DIAS_REPORTE = 7 # Rango por defecto de la pestaña de reportes
+HORAS_PUNTA = 5
+# Tablas de las que depende cada vista: se refresca solo si cambió la marca de alguna (core.obtener_marcas_cambios)
+VISTAS = {
+    'ocupacion': ('movimientos', 'vehiculos'),
+    'dentro': ('movimientos', 'vehiculos', 'personas'),
+    'log': ('movimientos',),
+    'roles': ('roles',),
+    'personas': ('personas', 'roles'),
+    'vehiculos': ('vehiculos', 'personas', 'movimientos'), # Las patentes nuevas las crea el primer movimiento
+    'reportes': ('movimientos', 'personas', 'roles'),
+}
+
+def actualizar_treeview(tree, filas, clave=lambda fila: fila[0]):
+    """
+    Deja en el Treeview exactamente `filas`, en ese orden, tocando solo lo que cambió: cada fila usa su
+    clave como iid, así se insertan las nuevas, se borran las que ya no están y se editan las modificadas
+    (la selección y el scroll se mantienen).
+    """
+    # Se compara contra lo último que se mostró (Tk devuelve los valores convertidos, p. ej. '012' -> 12)
+    anteriores = getattr(tree, 'filas_mostradas', {})
+    filas = {str(clave(fila)): tuple(str(v) for v in fila) for fila in filas}
+    sobrantes = [iid for iid in tree.get_children() if iid not in filas]
+    if sobrantes: tree.delete(*sobrantes)
+    for iid, valores in filas.items():
+        if not tree.exists(iid): tree.insert('', 'end', iid=iid, values=valores)
+        elif anteriores.get(iid) != valores: tree.item(iid, values=valores)
+    tree.filas_mostradas = filas
+    orden = tuple(filas)
+    if tree.get_children() != orden: tree.set_children('', *orden)
+
+def formatear_minutos(minutos):
+    horas, minutos = divmod(int(round(minutos or 0)), 60)
+    return f"{horas} h {minutos:02d} min" if horas else f"{minutos} min"
 
 class App(tk.Tk):
     def __init__(self):
@@ -25,8 +71,12 @@ class App(tk.Tk):
 
         self.processing_thread = None
         self.stop_event = threading.Event()
+        self.buzon_video = ColaDescartable(1) # Último frame del video; lo dibuja el hilo principal a FPS_VISTA
+        self.tamano_vista = (0, 0)
         self.roles_map = {}
         self.personas_map = {}
+        self.marcas = None # Última respuesta de obtener_marcas_cambios()
+        self.marcas_vista = {} # Vista -> marcas de sus tablas la última vez que se refrescó
 
         style = ttk.Style(self)
         style.configure("Treeview", rowheight=25)
@@ -36,6 +86,7 @@ class App(tk.Tk):
         dashboard_frame.pack(pady=10, padx=10, fill="x")
         self.occupancy_label = ttk.Label(dashboard_frame, text="Calculando...", font=("Arial", 16, "bold"))
         self.occupancy_label.pack(pady=(0, 10))
+        self.ultima_patente_label = ttk.Label(dashboard_frame, text="", font=("Arial", 11)); self.ultima_patente_label.pack()
 
         self.main_notebook = ttk.Notebook(self)
         self.main_notebook.pack(pady=10, padx=10, expand=True, fill="both")
@@ -52,8 +103,22 @@ class App(tk.Tk):
         self.main_notebook.add(gestion_tab, text="Gestión")
         self.create_gestion_tab(gestion_tab)
 
-        self.update_dashboard()
+        reportes_tab = ttk.Frame(self.main_notebook)
+        self.main_notebook.add(reportes_tab, text="Reportes")
+        self.create_reportes_tab(reportes_tab)
+
+        self.refrescadores = {
+            'ocupacion': self.refrescar_ocupacion, 'dentro': self.refrescar_dentro_treeview, 'log': self.refrescar_log_treeview,
+            'roles': self.refrescar_roles_treeview, 'personas': self.refrescar_personas_treeview, 'vehiculos': self.refrescar_vehiculos_treeview,
+            'reportes': self.refrescar_reportes,
+        }
+        for notebook in (self.main_notebook, self.gestion_notebook): notebook.bind("<<NotebookTabChanged>>", lambda e: self.update_dashboard(consultar=False))
+        self.ciclo_dashboard()
+        self.suscripcion_eventos = bus_eventos.suscribir((MOVIMIENTO_REGISTRADO, PATENTE_CONFIRMADA)); self.eventos_descartados = 0
+        self.after(INTERVALO_EVENTOS_MS, self.procesar_eventos)
         self.protocol("WM_DELETE_WINDOW", self.on_closing)
+        # Los modelos se cargan en segundo plano una vez que la ventana ya está visible
+        if obtener_config().getboolean('modelos', 'precargar', fallback=True): self.after(1000, precargar_modelos)
 
     def create_dashboard_tab(self, parent_tab):
         main_frame = ttk.Frame(parent_tab)
@@ -76,15 +141,41 @@ class App(tk.Tk):
         self.create_camera_tab(camera_tab)
 
     def create_log_tab(self, parent_tab):
-        log_frame = ttk.LabelFrame(parent_tab, text="Últimos 50 Movimientos")
+        filtros_frame = ttk.Frame(parent_tab); filtros_frame.pack(fill="x", padx=5, pady=(5, 0)); self.log_filtro_entries = {}
+        for texto, clave, ancho in (("Patente:", 'patente', 10), ("Desde (AAAA-MM-DD):", 'desde', 12), ("Hasta:", 'hasta', 12)):
+            ttk.Label(filtros_frame, text=texto).pack(side="left", padx=(5, 2)); entry = ttk.Entry(filtros_frame, width=ancho); entry.pack(side="left"); entry.bind('<Return>', lambda e: self.buscar_movimientos()); self.log_filtro_entries[clave] = entry
+        ttk.Label(filtros_frame, text="Tipo:").pack(side="left", padx=(5, 2)); self.log_tipo_combo = ttk.Combobox(filtros_frame, state="readonly", width=8, values=("Todos", "Entrada", "Salida")); self.log_tipo_combo.set("Todos"); self.log_tipo_combo.pack(side="left")
+        ttk.Button(filtros_frame, text="Buscar", command=self.buscar_movimientos).pack(side="left", padx=5); ttk.Button(filtros_frame, text="Limpiar", command=self.limpiar_filtros_log).pack(side="left")
+        log_frame = ttk.LabelFrame(parent_tab, text="Registro de Movimientos (desplázate para ver más)")
         log_frame.pack(expand=True, fill="both", padx=5, pady=5)
-        self.log_tree = ttk.Treeview(log_frame, columns=('Patente', 'Movimiento', 'FechaHora'), show='headings')
+        self.log_scrollbar = ttk.Scrollbar(log_frame, orient="vertical"); self.log_scrollbar.pack(side="right", fill="y")
+        self.log_tree = ttk.Treeview(log_frame, columns=('Patente', 'Movimiento', 'FechaHora'), show='headings', yscrollcommand=self.on_log_scroll); self.log_scrollbar.config(command=self.log_tree.yview)
         self.log_tree.heading('Patente', text='Patente'); self.log_tree.heading('Movimiento', text='Movimiento'); self.log_tree.heading('FechaHora', text='Fecha y Hora')
         self.log_tree.column('Patente', width=100, anchor='center'); self.log_tree.column('Movimiento', width=100, anchor='center'); self.log_tree.column('FechaHora', width=200)
         self.log_tree.pack(fill="both", expand=True)
+        # Ventana de filas cargadas: (FechaHora, ID) de cada fila para pedir la página siguiente o la anterior por clave
+        self.log_cursores = {}; self.log_filtros = {}; self.log_cargado = False; self.log_cargando = False; self.log_hay_antiguos = False; self.log_hay_recientes = False
+
+    def create_reportes_tab(self, parent_tab):
+        filtros_frame = ttk.Frame(parent_tab); filtros_frame.pack(fill="x", padx=5, pady=(5, 0)); self.reporte_entries = {}; hoy = datetime.date.today()
+        for texto, clave, valor in (("Desde (AAAA-MM-DD):", 'desde', hoy - datetime.timedelta(days=DIAS_REPORTE - 1)), ("Hasta:", 'hasta', hoy)):
+            ttk.Label(filtros_frame, text=texto).pack(side="left", padx=(5, 2)); entry = ttk.Entry(filtros_frame, width=12); entry.insert(0, valor.isoformat()); entry.pack(side="left"); entry.bind('<Return>', lambda e: self.actualizar_reportes()); self.reporte_entries[clave] = entry
+        self.actualizar_reportes_button = ttk.Button(filtros_frame, text="Actualizar", command=self.actualizar_reportes); self.actualizar_reportes_button.pack(side="left", padx=5); self.reporte_estado_label = ttk.Label(filtros_frame, text=""); self.reporte_estado_label.pack(side="left", padx=5)
+        curva_frame = ttk.LabelFrame(parent_tab, text="Ocupación por hora (máxima de cada hora)"); curva_frame.pack(fill="both", expand=True, padx=5, pady=5)
+        self.ocupacion_canvas = tk.Canvas(curva_frame, height=220, background="white", highlightthickness=0); self.ocupacion_canvas.pack(fill="both", expand=True)
+        self.ocupacion_canvas.bind('<Configure>', lambda e: self.dibujar_curva_ocupacion()); self.horas_ocupacion = []
+        tablas_frame = ttk.Frame(parent_tab); tablas_frame.pack(fill="both", expand=True, padx=5, pady=(0, 5))
+        punta_frame = ttk.LabelFrame(tablas_frame, text=f"Horas punta (top {HORAS_PUNTA})"); punta_frame.pack(side="left", fill="both", expand=True, padx=(0, 5))
+        cols = ('Hora', 'Entradas por día', 'Ocupación máxima'); self.horas_punta_tree = ttk.Treeview(punta_frame, columns=cols, show='headings', height=HORAS_PUNTA)
+        for col in cols: self.horas_punta_tree.heading(col, text=col); self.horas_punta_tree.column(col, width=110, anchor='center')
+        self.horas_punta_tree.pack(fill="both", expand=True)
+        estadia_frame = ttk.LabelFrame(tablas_frame, text="Estadía por rol"); estadia_frame.pack(side="right", fill="both", expand=True, padx=(5, 0))
+        cols = ('Rol', 'Estadías', 'Promedio', 'Máxima'); self.estadia_tree = ttk.Treeview(estadia_frame, columns=cols, show='headings', height=HORAS_PUNTA)
+        for col in cols: self.estadia_tree.heading(col, text=col); self.estadia_tree.column(col, width=90, anchor='center')
+        self.estadia_tree.column('Rol', width=160, anchor='w'); self.estadia_tree.pack(fill="both", expand=True)
 
     def create_gestion_tab(self, parent_tab):
-        gestion_notebook = ttk.Notebook(parent_tab)
+        gestion_notebook = self.gestion_notebook = ttk.Notebook(parent_tab)
         gestion_notebook.pack(expand=True, fill="both", padx=5, pady=5)
         roles_tab = ttk.Frame(gestion_notebook); gestion_notebook.add(roles_tab, text="Roles"); self.create_gestion_roles_tab(roles_tab)
         personas_tab = ttk.Frame(gestion_notebook); gestion_notebook.add(personas_tab, text="Personas"); self.create_gestion_personas_tab(personas_tab)
@@ -102,7 +193,7 @@ class App(tk.Tk):
         ttk.Button(buttons_frame, text="Agregar Rol", command=self.agregar_rol).pack(fill='x', pady=2)
         ttk.Button(buttons_frame, text="Guardar Cambios", command=self.guardar_rol).pack(fill='x', pady=2)
         ttk.Button(buttons_frame, text="Eliminar Rol", command=self.eliminar_rol_seleccionado).pack(fill='x', pady=2)
-        self.refrescar_roles_treeview()
+        self.crear_botones_csv(buttons_frame, 'roles')
 
     def create_gestion_personas_tab(self, parent_tab):
         main_frame = ttk.Frame(parent_tab); main_frame.pack(fill='both', expand=True, padx=10, pady=10)
@@ -115,7 +206,7 @@ class App(tk.Tk):
         form_labels = ["RUT:", "Nombre:", "Apellido:", "Teléfono:", "Rol:"]; self.persona_entries = {}
         for i, label in enumerate(form_labels):
             ttk.Label(form_grid, text=label).grid(row=i, column=0, sticky='w', padx=5, pady=5)
-            if label == "Rol:": self.persona_entries['Rol'] = ttk.Combobox(form_grid, state="readonly"); self.persona_entries['Rol'].grid(row=i, column=1, sticky='ew', padx=5, pady=5)
+            if label == "Rol:": self.persona_entries['Rol'] = ttk.Combobox(form_grid, state="readonly", postcommand=self.cargar_opciones_roles); self.persona_entries['Rol'].grid(row=i, column=1, sticky='ew', padx=5, pady=5)
             else: entry = ttk.Entry(form_grid); entry.grid(row=i, column=1, sticky='ew', padx=5, pady=5); self.persona_entries[label[:-1]] = entry
         self.persona_activo_var = tk.BooleanVar(value=True); ttk.Checkbutton(form_grid, text="Activo", variable=self.persona_activo_var).grid(row=len(form_labels), column=1, sticky='w', padx=5, pady=5)
         buttons_frame = ttk.Frame(form_frame); buttons_frame.pack(pady=10)
@@ -123,7 +214,7 @@ class App(tk.Tk):
         ttk.Button(buttons_frame, text="Agregar Persona", command=self.agregar_persona).pack(side='left', padx=5)
         ttk.Button(buttons_frame, text="Guardar Cambios", command=self.guardar_persona).pack(side='left', padx=5)
         ttk.Button(buttons_frame, text="Eliminar Persona", command=self.eliminar_persona_seleccionada).pack(side='left', padx=5)
-        self.refrescar_personas_treeview()
+        self.crear_botones_csv(buttons_frame, 'personas', en_fila=True)
 
     def create_gestion_vehiculos_tab(self, parent_tab):
         main_frame = ttk.Frame(parent_tab); main_frame.pack(fill='both', expand=True, padx=10, pady=10)
@@ -134,17 +225,33 @@ class App(tk.Tk):
         self.vehiculos_tree.pack(fill='both', expand=True)
         self.vehiculos_tree.bind('<<TreeviewSelect>>', self.on_vehiculo_select)
         ttk.Label(form_frame, text="Vehículo Seleccionado:").pack(padx=10, pady=(10,0)); self.vehiculo_seleccionado_label = ttk.Label(form_frame, text="Ninguno", font=('Arial', 10, 'bold')); self.vehiculo_seleccionado_label.pack(padx=10, pady=2)
-        ttk.Label(form_frame, text="Asignar a Persona:").pack(padx=10, pady=(10,0)); self.vehiculo_persona_combo = ttk.Combobox(form_frame, state="readonly", width=35); self.vehiculo_persona_combo.pack(padx=10, pady=5)
+        ttk.Label(form_frame, text="Asignar a Persona:").pack(padx=10, pady=(10,0)); self.vehiculo_persona_combo = ttk.Combobox(form_frame, state="readonly", width=35, postcommand=self.cargar_opciones_personas); self.vehiculo_persona_combo.pack(padx=10, pady=5)
         buttons_frame = ttk.Frame(form_frame); buttons_frame.pack(padx=10, pady=20, fill='x')
         ttk.Button(buttons_frame, text="Asignar", command=self.asignar_vehiculo_seleccionado).pack(fill='x', pady=2)
         ttk.Button(buttons_frame, text="Quitar Asignación", command=self.desasignar_vehiculo_seleccionado).pack(fill='x', pady=2)
-        self.refrescar_vehiculos_treeview()
+        self.crear_botones_csv(buttons_frame, 'vehiculos')
+
+    def crear_botones_csv(self, frame, tipo, en_fila=False):
+        opciones = {'side': 'left', 'padx': 5} if en_fila else {'fill': 'x', 'pady': 2}
+        ttk.Button(frame, text="Importar CSV...", command=lambda: self.importar_csv(tipo)).pack(**opciones); ttk.Button(frame, text="Exportar CSV...", command=lambda: self.exportar_csv(tipo)).pack(**opciones)
+    def importar_csv(self, tipo):
+        ruta = filedialog.askopenfilename(title=f"Importar {tipo}", filetypes=[("CSV", "*.csv"), ("Todos los archivos", "*.*")])
+        if not ruta: return
+        success, msg, errores = importar_csv(tipo, ruta); self.refrescadores[tipo]()
+        if not errores: messagebox.showinfo("Resultado", msg); return
+        detalle = "\n".join(f"Línea {linea}: {error}" for linea, error in errores[:10]) + ("\n..." if len(errores) > 10 else "")
+        if messagebox.askyesno("Resultado", f"{msg}\n\n{detalle}\n\n¿Guardar el reporte completo de errores?"):
+            destino = filedialog.asksaveasfilename(defaultextension=".csv", initialfile=f"errores_{tipo}.csv", filetypes=[("CSV", "*.csv")])
+            if destino: escribir_reporte_errores(errores, destino)
+    def exportar_csv(self, tipo):
+        ruta = filedialog.asksaveasfilename(title=f"Exportar {tipo}", defaultextension=".csv", initialfile=f"{tipo}.csv", filetypes=[("CSV", "*.csv")])
+        if ruta: success, msg = exportar_csv(tipo, ruta); messagebox.showinfo("Resultado", msg)
 
     def refrescar_roles_treeview(self):
         self.roles_map = {name: id for id, name in obtener_roles()}
-        self.roles_tree.delete(*self.roles_tree.get_children())
-        for name, id in self.roles_map.items(): self.roles_tree.insert('', 'end', values=(id, name))
+        actualizar_treeview(self.roles_tree, [(id, name) for name, id in self.roles_map.items()])
         if hasattr(self, 'persona_entries'): self.persona_entries['Rol']['values'] = list(self.roles_map.keys())
+    def cargar_opciones_roles(self): self.roles_map = {name: id for id, name in obtener_roles()}; self.persona_entries['Rol']['values'] = list(self.roles_map.keys()) # Al desplegar el combo
     def on_rol_select(self, event): item = self.roles_tree.focus(); self.rol_nombre_entry.delete(0, tk.END); self.rol_nombre_entry.insert(0, self.roles_tree.item(item, 'values')[1]) if item else None
     def limpiar_form_rol(self): self.rol_nombre_entry.delete(0, tk.END); self.roles_tree.selection_remove(self.roles_tree.selection())
     def agregar_rol(self): nombre = self.rol_nombre_entry.get().strip(); success, msg = crear_rol(nombre); messagebox.showinfo("Resultado", msg or "Éxito"); self.limpiar_form_rol(); self.refrescar_roles_treeview()
@@ -152,11 +259,11 @@ class App(tk.Tk):
     def eliminar_rol_seleccionado(self): item = self.roles_tree.focus(); rol_id, nombre = self.roles_tree.item(item, 'values'); success, msg = eliminar_rol(rol_id); messagebox.showinfo("Resultado", msg or "Éxito"); self.limpiar_form_rol(); self.refrescar_roles_treeview()
 
     def refrescar_personas_treeview(self):
-        self.personas_tree.delete(*self.personas_tree.get_children())
         personas_list = obtener_personas()
-        for p in personas_list: self.personas_tree.insert('', 'end', values=(p.RUT, p.Nombre, p.Apellido, p.Telefono or '', p.Rol or '', 'Sí' if p.Activo else 'No'))
+        actualizar_treeview(self.personas_tree, [(p.RUT, p.Nombre, p.Apellido, p.Telefono or '', p.Rol or '', 'Sí' if p.Activo else 'No') for p in personas_list])
         self.personas_map = {f"{p.Nombre} {p.Apellido} ({p.RUT})": p.RUT for p in personas_list}
         if hasattr(self, 'vehiculo_persona_combo'): self.vehiculo_persona_combo['values'] = list(self.personas_map.keys())
+    def cargar_opciones_personas(self): self.personas_map = {f"{p.Nombre} {p.Apellido} ({p.RUT})": p.RUT for p in obtener_personas_para_asignacion()}; self.vehiculo_persona_combo['values'] = list(self.personas_map.keys()) # Al desplegar el combo
     def on_persona_select(self, event):
         item = self.personas_tree.focus(); values = self.personas_tree.item(item, 'values'); self.limpiar_form_persona(keep_selection=True)
         self.persona_entries['RUT'].insert(0, values[0]); self.persona_entries['RUT'].config(state='readonly'); self.persona_entries['Nombre'].insert(0, values[1]); self.persona_entries['Apellido'].insert(0, values[2]); self.persona_entries['Teléfono'].insert(0, values[3]); self.persona_entries['Rol'].set(values[4]); self.persona_activo_var.set(True if values[5] == 'Sí' else False)
@@ -170,9 +277,7 @@ class App(tk.Tk):
     def guardar_persona(self): rut = self.persona_entries['RUT'].get().strip(); nombre, apellido, telefono, rol_nombre = [self.persona_entries[k].get().strip() for k in ['Nombre', 'Apellido', 'Teléfono', 'Rol']]; id_rol = self.roles_map.get(rol_nombre); activo = self.persona_activo_var.get(); success, msg = actualizar_persona(rut, nombre, apellido, telefono, id_rol, activo); messagebox.showinfo("Resultado", msg or "Éxito"); self.limpiar_form_persona(); self.refrescar_personas_treeview()
     def eliminar_persona_seleccionada(self): rut = self.persona_entries['RUT'].get().strip(); success, msg = eliminar_persona(rut); messagebox.showinfo("Resultado", msg or "Éxito"); self.limpiar_form_persona(); self.refrescar_personas_treeview()
 
-    def refrescar_vehiculos_treeview(self):
-        self.vehiculos_tree.delete(*self.vehiculos_tree.get_children())
-        for v in obtener_vehiculos(): self.vehiculos_tree.insert('', 'end', values=v)
+    def refrescar_vehiculos_treeview(self): actualizar_treeview(self.vehiculos_tree, obtener_vehiculos())
     def on_vehiculo_select(self, event): item = self.vehiculos_tree.focus(); patente = self.vehiculos_tree.item(item, 'values')[0]; self.vehiculo_seleccionado_label.config(text=patente)
     def asignar_vehiculo_seleccionado(self):
         patente = self.vehiculo_seleccionado_label.cget("text")
@@ -188,42 +293,161 @@ class App(tk.Tk):
     def create_video_tab(self, parent):
         controls_frame = ttk.Frame(parent); controls_frame.pack(fill="x", pady=5); ttk.Label(controls_frame, text="Ruta:").pack(side="left", padx=(0, 5)); self.video_path_entry = ttk.Entry(controls_frame, width=40); self.video_path_entry.pack(side="left", expand=True, fill="x"); self.browse_button = ttk.Button(controls_frame, text="Examinar", command=self.browse_video); self.browse_button.pack(side="left", padx=5)
         action_frame = ttk.Frame(parent); action_frame.pack(fill="x", pady=5); self.process_video_button = ttk.Button(action_frame, text="Procesar", command=self.process_video); self.process_video_button.pack(side="left", padx=5); self.stop_video_button = ttk.Button(action_frame, text="Detener", command=self.stop_processing, state="disabled"); self.stop_video_button.pack(side="left", padx=5)
-        self.video_label = ttk.Label(parent, background="black"); self.video_label.pack(expand=True, fill="both", pady=10)
+        self.video_label = ttk.Label(parent, background="black"); self.video_label.pack(expand=True, fill="both", pady=10); self.video_label.bind("<Configure>", lambda e: setattr(self, 'tamano_vista', (e.width, e.height)))
     def create_camera_tab(self, parent):
-        ttk.Label(parent, text="URL de la cámara IP:").pack(pady=5); self.camera_url_entry = ttk.Entry(parent, width=40); self.camera_url_entry.pack(pady=5); config = configparser.ConfigParser(); config.read('config.ini'); self.camera_url_entry.insert(0, config.get('camera', 'url', fallback='rtsp://...')); self.process_camera_button = ttk.Button(parent, text="Procesar Cámara", command=self.process_camera); self.process_camera_button.pack(pady=10)
+        ttk.Label(parent, text="URL de la cámara IP:").pack(pady=5); self.camera_url_entry = ttk.Entry(parent, width=40); self.camera_url_entry.pack(pady=5); config = obtener_config(); self.camera_url_entry.insert(0, config.get('camera', 'url', fallback='rtsp://...')); self.process_camera_button = ttk.Button(parent, text="Procesar Cámara", command=self.process_camera); self.process_camera_button.pack(pady=10)
     def browse_video(self): filepath = filedialog.askopenfilename(filetypes=[("Video files", "*.mp4 *.avi *.mov")]); self.video_path_entry.delete(0, tk.END); self.video_path_entry.insert(0, filepath)
     def process_video(self):
         video_path = self.video_path_entry.get()
-        if video_path: self.stop_event.clear(); self.process_video_button.config(state="disabled"); self.stop_video_button.config(state="normal"); self.browse_button.config(state="disabled"); self.processing_thread = threading.Thread(target=self._run_video_processing, args=(video_path,)); self.processing_thread.start()
-    def _run_video_processing(self, video_path): procesar_video(video_path, self.update_video_frame, self.stop_event); self.process_video_button.config(state="normal"); self.stop_video_button.config(state="disabled"); self.browse_button.config(state="normal"); self.after(100, self.update_dashboard)
+        if video_path: self.stop_event.clear(); self.process_video_button.config(state="disabled"); self.stop_video_button.config(state="normal"); self.browse_button.config(state="disabled"); self.processing_thread = threading.Thread(target=self._run_video_processing, args=(video_path,)); self.processing_thread.start(); self.after(0, self.refrescar_vista_video)
+    def _run_video_processing(self, video_path): procesar_video(video_path, self.update_video_frame, self.stop_event) # Los widgets se actualizan desde refrescar_vista_video
     def update_video_frame(self, frame):
-        try:
-            h, w, _ = frame.shape; max_h = self.video_label.winfo_height(); max_w = self.video_label.winfo_width()
-            if max_h < 2 or max_w < 2: self.after(20, lambda: self.update_video_frame(frame)); return
-            scale = min(max_w/w, max_h/h); new_w, new_h = int(w*scale), int(h*scale); resized_frame = cv2.resize(frame, (new_w, new_h)); rgb_frame = cv2.cvtColor(resized_frame, cv2.COLOR_BGR2RGB); img = Image.fromarray(rgb_frame); imgtk = ImageTk.PhotoImage(image=img)
-            self.video_label.imgtk = imgtk; self.video_label.config(image=imgtk)
-        except Exception as e: print(f"Error al actualizar frame de video: {e}")
+        # Se llama desde el hilo de procesamiento: solo deja el frame en el buzón (reemplaza al anterior) y vuelve
+        self.buzon_video.put(frame)
+    def refrescar_vista_video(self):
+        # Hilo principal: dibuja el último frame recibido a como máximo FPS_VISTA y sigue mientras el video se procesa
+        frame = self.buzon_video.get(timeout=0); max_w, max_h = self.tamano_vista
+        if frame is not None and max_w > 1 and max_h > 1:
+            try:
+                h, w, _ = frame.shape; scale = min(max_w/w, max_h/h); new_w, new_h = max(1, int(w*scale)), max(1, int(h*scale)); resized_frame = cv2.resize(frame, (new_w, new_h), interpolation=cv2.INTER_AREA); rgb_frame = cv2.cvtColor(resized_frame, cv2.COLOR_BGR2RGB); img = Image.fromarray(rgb_frame); imgtk = ImageTk.PhotoImage(image=img)
+                self.video_label.imgtk = imgtk; self.video_label.config(image=imgtk)
+            except Exception as e: print(f"Error al actualizar frame de video: {e}")
+        if self.processing_thread and self.processing_thread.is_alive(): self.after(int(1000 / FPS_VISTA), self.refrescar_vista_video); return
+        self.process_video_button.config(state="normal"); self.stop_video_button.config(state="disabled"); self.browse_button.config(state="normal"); self.after(100, self.update_dashboard)
     def stop_processing(self): self.stop_event.set()
-    def process_camera(self): camera_url = self.camera_url_entry.get(); thread = threading.Thread(target=self._run_camera_processing, args=(camera_url,)); thread.start()
-    def _run_camera_processing(self, camera_url): self.process_camera_button.config(state="disabled"); procesar_camara(camera_url); self.process_camera_button.config(state="normal"); self.after(100, self.update_dashboard)
-    def update_dashboard(self):
+    def process_camera(self): camera_url = self.camera_url_entry.get(); self.stop_event.clear(); self.process_camera_button.config(state="disabled"); thread = threading.Thread(target=self._run_camera_processing, args=(camera_url,)); thread.start()
+    def _run_camera_processing(self, camera_url):
+        try: procesar_camara(camera_url, stop_event=self.stop_event) # Se detiene también al cerrar la ventana
+        finally:
+            try: self.after(0, self._fin_procesamiento_camara) # Tk solo se toca desde el hilo principal
+            except (RuntimeError, tk.TclError): pass # La ventana ya se cerró
+    def _fin_procesamiento_camara(self): self.process_camera_button.config(state="normal"); self.update_dashboard()
+    def refrescar_ocupacion(self): ocupados = obtener_ocupacion_estacionamiento(); disponibles = TOTAL_ESPACIOS - ocupados; self.occupancy_label.config(text=f"Espacios Disponibles: {disponibles} de {TOTAL_ESPACIOS}")
+    def refrescar_dentro_treeview(self): actualizar_treeview(self.patentes_tree, obtener_vehiculos_dentro())
+    def refrescar_log_treeview(self):
+        # Con la vista en los más recientes se agregan arriba los movimientos nuevos; si el usuario está más atrás, aparecen al volver a subir
+        if not self.log_cargado: self.buscar_movimientos()
+        elif not self.log_tree.get_children(): self.recargar_log()
+        elif not self.log_hay_recientes: self.cargar_pagina_log(recientes=True, mantener_vista=self.log_tree.yview()[0] > 0) # Quien mira el tope ve entrar los nuevos
+    def limpiar_filtros_log(self):
+        for entry in self.log_filtro_entries.values(): entry.delete(0, tk.END)
+        self.log_tipo_combo.set("Todos"); self.buscar_movimientos()
+    def buscar_movimientos(self):
+        try:
+            desde, hasta = [self.log_filtro_entries[k].get().strip() for k in ('desde', 'hasta')]
+            desde = datetime.datetime.fromisoformat(desde) if desde else None; hasta = datetime.datetime.fromisoformat(hasta) + datetime.timedelta(days=1) if hasta else None # Hasta incluye todo ese día
+        except ValueError: messagebox.showwarning("Filtro inválido", "Las fechas deben tener el formato AAAA-MM-DD."); return
+        tipo = self.log_tipo_combo.get(); self.log_filtros = {'patente': self.log_filtro_entries['patente'].get().strip() or None, 'desde': desde, 'hasta': hasta, 'tipo': None if tipo == "Todos" else tipo}; self.recargar_log()
+    def recargar_log(self): self.log_tree.delete(*self.log_tree.get_children()); self.log_cursores.clear(); self.log_hay_antiguos = True; self.log_hay_recientes = False; self.log_cargado = True; self.cargar_pagina_log(recientes=False)
+    def cargar_pagina_log(self, recientes, mantener_vista=True):
+        # Trae una página por clave en la dirección pedida y recorta el extremo opuesto para no pasar de MAX_FILAS_LOG filas
+        hijos = self.log_tree.get_children(); self.log_cargando = True
         try:
-            ocupados = obtener_ocupacion_estacionamiento(); disponibles = TOTAL_ESPACIOS - ocupados; self.occupancy_label.config(text=f"Espacios Disponibles: {disponibles} de {TOTAL_ESPACIOS}")
-            self.patentes_tree.delete(*self.patentes_tree.get_children())
-            for vehiculo in obtener_vehiculos_dentro(): self.patentes_tree.insert('', 'end', values=vehiculo)
-            self.log_tree.delete(*self.log_tree.get_children())
-            for movimiento in obtener_ultimos_movimientos(limit=50): self.log_tree.insert('', 'end', values=movimiento)
-            if hasattr(self, 'roles_tree'): self.refrescar_roles_treeview()
-            if hasattr(self, 'personas_tree'): self.refrescar_personas_treeview()
-            if hasattr(self, 'vehiculos_tree'): self.refrescar_vehiculos_treeview()
+            if recientes: filas, hay_mas = obtener_movimientos_pagina(posterior_a=self.log_cursores[hijos[0]] if hijos else None, limite=FILAS_POR_PAGINA_LOG, **self.log_filtros); self.log_hay_recientes = hay_mas
+            else: filas, hay_mas = obtener_movimientos_pagina(anterior_a=self.log_cursores[hijos[-1]] if hijos else None, limite=FILAS_POR_PAGINA_LOG, **self.log_filtros); self.log_hay_antiguos = hay_mas
+            for i, m in enumerate(filas): self.insertar_fila_log(m.patente, m.tipo, m.fecha_hora, m.id, i if recientes else 'end')
+            todas = self.log_tree.get_children(); sobrantes = todas[MAX_FILAS_LOG:] if recientes else todas[:max(0, len(todas) - MAX_FILAS_LOG)]
+            if sobrantes: self.log_tree.delete(*sobrantes); [self.log_cursores.pop(iid, None) for iid in sobrantes]
+            if recientes and sobrantes: self.log_hay_antiguos = True
+            if not recientes and sobrantes: self.log_hay_recientes = True
+            # Las filas agregadas o quitadas arriba desplazan el contenido: se compensa para que la vista no salte
+            desplazamiento = len(filas) if recientes else -len(sobrantes)
+            if hijos and desplazamiento and mantener_vista: self.log_tree.yview_scroll(desplazamiento, 'units')
+        finally: self.log_cargando = False
+    def insertar_fila_log(self, patente, tipo, fecha_hora, id_movimiento, posicion):
+        fecha = fecha_hora.strftime('%Y-%m-%d %H:%M:%S'); iid = f"{patente}|{fecha}|{tipo}"
+        if not self.log_tree.exists(iid): self.log_tree.insert('', posicion, iid=iid, values=(patente, tipo, fecha)); self.log_cursores[iid] = (fecha_hora, id_movimiento)
+    def on_log_scroll(self, primero, ultimo):
+        # yscrollcommand del registro: al acercarse a un extremo se pide la página siguiente en esa dirección
+        self.log_scrollbar.set(primero, ultimo)
+        if self.log_cargando or not self.log_cargado: return
+        if float(ultimo) >= 0.95 and self.log_hay_antiguos: self.log_cargando = True; self.after_idle(lambda: self.cargar_pagina_log(recientes=False))
+        elif float(primero) <= 0.0 and self.log_hay_recientes: self.log_cargando = True; self.after_idle(lambda: self.cargar_pagina_log(recientes=True))
+    def coincide_filtros_log(self, patente, tipo, fecha_hora):
+        f = self.log_filtros
+        return (not f.get('patente') or patente.startswith(f['patente'].upper())) and (not f.get('tipo') or tipo == f['tipo']) and (not f.get('desde') or fecha_hora >= f['desde']) and (not f.get('hasta') or fecha_hora < f['hasta'])
+    def rango_reportes(self):
+        # (desde, hasta) de los filtros, o None si alguna fecha no es AAAA-MM-DD; hasta incluye todo ese día
+        try: desde, hasta = [datetime.datetime.fromisoformat(self.reporte_entries[k].get().strip()) for k in ('desde', 'hasta')]; return desde, hasta + datetime.timedelta(days=1)
+        except ValueError: return None
+    def actualizar_reportes(self):
+        # Botón "Actualizar": incorpora los movimientos nuevos a los agregados en otro hilo (puede esperar el bloqueo de analitica.py) y después relee
+        if not self.rango_reportes(): messagebox.showwarning("Rango inválido", "Las fechas deben tener el formato AAAA-MM-DD."); return
+        self.actualizar_reportes_button.config(state="disabled"); self.reporte_estado_label.config(text="Actualizando..."); threading.Thread(target=self._run_actualizar_agregados, daemon=True).start()
+    def _run_actualizar_agregados(self):
+        success, msg = actualizar_agregados()
+        try: self.after(0, lambda: self._fin_actualizar_reportes(success, msg)) # Tk solo se toca desde el hilo principal
+        except (RuntimeError, tk.TclError): pass # La ventana ya se cerró
+    def _fin_actualizar_reportes(self, success, msg): self.actualizar_reportes_button.config(state="normal"); self.reporte_estado_label.config(text=msg if success else f"⚠️ {msg}"); self.refrescar_reportes()
+    def refrescar_reportes(self):
+        # Refresco periódico: solo lee OcupacionHoraria y EstadiaDiaria; con un rango inválido no consulta ni interrumpe con avisos
+        rango = self.rango_reportes()
+        if not rango: self.reporte_estado_label.config(text="⚠️ Fechas en formato AAAA-MM-DD"); return
+        desde, hasta = rango
+        if self.reporte_estado_label.cget('text').startswith("⚠️ Fechas"): self.reporte_estado_label.config(text="")
+        self.horas_ocupacion = obtener_ocupacion_horaria(desde, hasta); self.dibujar_curva_ocupacion()
+        actualizar_treeview(self.horas_punta_tree, [(f"{h.hora:02d}:00", f"{h.entradas_por_dia:.1f}", h.ocupacion_maxima) for h in obtener_horas_punta(desde, hasta)[:HORAS_PUNTA]])
+        actualizar_treeview(self.estadia_tree, [(e.rol, e.estadias, formatear_minutos(e.promedio_min), formatear_minutos(e.maxima_min)) for e in obtener_estadia_por_rol(desde, hasta)])
+    def dibujar_curva_ocupacion(self):
+        canvas = self.ocupacion_canvas; canvas.delete('all'); ancho, alto = canvas.winfo_width(), canvas.winfo_height(); horas = self.horas_ocupacion; margen = 40
+        if not horas or ancho <= 2 * margen or alto <= 2 * margen: return
+        tope = max(TOTAL_ESPACIOS, max(h.ocupacion_maxima for h in horas)); paso = (ancho - 2 * margen) / max(1, len(horas) - 1)
+        y = lambda valor: alto - margen - (alto - 2 * margen) * max(0, valor) / tope
+        canvas.create_line(margen, y(0), ancho - margen, y(0)); canvas.create_line(margen, y(0), margen, y(tope))
+        canvas.create_line(margen, y(TOTAL_ESPACIOS), ancho - margen, y(TOTAL_ESPACIOS), fill="red", dash=(4, 2)); canvas.create_text(margen - 5, y(TOTAL_ESPACIOS), text=str(TOTAL_ESPACIOS), anchor="e", fill="red")
+        for i, h in enumerate(horas):
+            if h.hora.hour == 0: x = margen + i * paso; canvas.create_line(x, y(0), x, y(0) + 4); canvas.create_text(x, y(0) + 6, text=h.hora.strftime('%d-%m'), anchor="n")
+        puntos = [coordenada for i, h in enumerate(horas) for coordenada in (margen + i * paso, y(h.ocupacion_maxima))]
+        if len(puntos) >= 4: canvas.create_line(*puntos, fill="steelblue", width=2)
+    def vistas_visibles(self):
+        # La ocupación siempre está a la vista; del resto, solo la pestaña abierta
+        pestana = self.main_notebook.index('current')
+        if pestana == 0: return ['ocupacion', 'dentro']
+        if pestana == 1: return ['ocupacion', 'log']
+        if pestana == 3: return ['ocupacion', 'reportes']
+        return ['ocupacion', ('roles', 'personas', 'vehiculos')[self.gestion_notebook.index('current')]]
+    def update_dashboard(self, consultar=True):
+        # Primero una consulta barata de marcas; después se consultan y parchan solo las vistas visibles cuyos datos cambiaron
+        try:
+            if consultar or self.marcas is None:
+                marcas = obtener_marcas_cambios()
+                if marcas is None: return
+                self.marcas = marcas
+            for vista in self.vistas_visibles():
+                firma = tuple(self.marcas.get(tabla) for tabla in VISTAS[vista])
+                if self.marcas_vista.get(vista) != firma: self.refrescadores[vista](); self.marcas_vista[vista] = firma
         except Exception as e: print(f"Error en update_dashboard: {e}")
-        finally: self.after(5000, self.update_dashboard)
+    def ciclo_dashboard(self): self.update_dashboard(); self.after(INTERVALO_DASHBOARD_MS, self.ciclo_dashboard)
+    def procesar_eventos(self):
+        # Hilo de Tk: aplica los eventos publicados por la detección y el escritor de movimientos desde la última vuelta
+        try:
+            eventos = self.suscripcion_eventos.pendientes()
+            if self.suscripcion_eventos.descartados != self.eventos_descartados:
+                self.eventos_descartados = self.suscripcion_eventos.descartados; self.marcas_vista.clear(); self.update_dashboard() # Se perdieron eventos: reconciliar todo
+            for evento in eventos:
+                if evento.tipo == PATENTE_CONFIRMADA: self.ultima_patente_label.config(text=f"Última patente confirmada: {evento.datos['patente']} ({evento.datos['fecha_hora']:%H:%M:%S})")
+                else: self.aplicar_movimiento(**evento.datos)
+            if any(evento.tipo == MOVIMIENTO_REGISTRADO for evento in eventos): self.refrescar_ocupacion()
+        except Exception as e: print(f"Error al procesar eventos: {e}")
+        finally: self.after(INTERVALO_EVENTOS_MS, self.procesar_eventos)
+    def aplicar_movimiento(self, patente, tipo_movimiento, fecha_hora):
+        # Agrega el movimiento al registro y actualiza la lista de vehículos dentro, sin consultar la BD
+        if self.log_cargado and not self.log_hay_recientes and self.coincide_filtros_log(patente, tipo_movimiento, fecha_hora):
+            self.insertar_fila_log(patente, tipo_movimiento, fecha_hora, None, 0) # Sin ID: la próxima página compara solo por FechaHora
+            sobrantes = self.log_tree.get_children()[MAX_FILAS_LOG:]
+            if sobrantes: self.log_tree.delete(*sobrantes); [self.log_cursores.pop(iid, None) for iid in sobrantes]; self.log_hay_antiguos = True
+        if tipo_movimiento == 'Entrada':
+            vehiculo = estado_estacionamiento.obtener(patente); propietario = vehiculo.propietario if vehiculo else "Sin Asignar"
+            if self.patentes_tree.exists(patente): self.patentes_tree.move(patente, '', 0)
+            else: self.patentes_tree.insert('', 0, iid=patente, values=(patente, propietario))
+        elif self.patentes_tree.exists(patente): self.patentes_tree.delete(patente)
     def on_closing(self):
-        print("Cerrando aplicación..."); self.stop_event.set()
+        print("Cerrando aplicación..."); self.stop_event.set(); self.suscripcion_eventos.cancelar()
         if self.processing_thread and self.processing_thread.is_alive(): self.processing_thread.join(timeout=1.0)
-        self.destroy()
+        escritor_movimientos.detener(); cerrar_pool(); self.destroy()
 
 if __name__ == "__main__":
+    migrar_al_iniciar()
     app = App()
     app.mainloop()
 
@@ -0,0 +1,230 @@
+"""
+Migraciones versionadas del esquema de EstacionamientoPatentes. Cada migración se aplica una sola vez,
+en orden y en su propia transacción, y queda anotada en la tabla VersionEsquema; volver a ejecutarlas
+no hace nada. Las sentencias están protegidas con IF ... IS NULL, así una base creada con una versión
+anterior de EstacionamientoPatentes.sql se adopta sin errores.
+
+    python migraciones.py           # Aplica las pendientes
+    python migraciones.py --estado  # Muestra la versión de la base y las migraciones pendientes
+
+Las aplicaciones (GUI, cámara, lote, carga masiva) las aplican al iniciar si
+[database] migrar_al_iniciar está habilitado (por defecto, sí).
+"""
+import argparse
+import collections
+import sys
+from db_config import conexion_bd, get_connection, obtener_config
+
+Migracion = collections.namedtuple('Migracion', 'version descripcion sentencias')
+
+def _tabla(nombre, definicion):
+    return f"IF OBJECT_ID('dbo.{nombre}', 'U') IS NULL CREATE TABLE {nombre} ({definicion})"
+
+def _indice(tabla, nombre, definicion):
+    return (f"IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = '{nombre}' AND object_id = OBJECT_ID('dbo.{tabla}')) "
+            f"CREATE INDEX {nombre} ON {tabla} {definicion}")
+
+_SP_REGISTRAR_MOVIMIENTO = """
+CREATE OR ALTER PROCEDURE dbo.sp_RegistrarMovimiento
+    @Patente NVARCHAR(10),
+    @FechaHora DATETIME,
+    @VentanaSegundos INT = 10
+AS
+BEGIN
+    SET NOCOUNT ON;
+    SET XACT_ABORT ON;
+    -- OUTPUT INTO no admite tablas destino con restricciones CHECK (Movimientos): se pasa por una variable de tabla
+    DECLARE @Registrado TABLE (TipoMovimiento NVARCHAR(10) NOT NULL);
+
+    BEGIN TRANSACTION;
+    -- HOLDLOCK serializa los MERGE concurrentes sobre la misma patente (dos cámaras a la vez)
+    MERGE Vehiculos WITH (HOLDLOCK) AS v
+    USING (SELECT @Patente AS Patente) AS s
+        ON v.Patente = s.Patente
+    WHEN MATCHED AND v.UltimoMovimiento <= DATEADD(SECOND, -@VentanaSegundos, @FechaHora) THEN
+        UPDATE SET Estado = CASE v.Estado WHEN 'Dentro' THEN 'Fuera' ELSE 'Dentro' END,
+                   UltimoMovimiento = @FechaHora
+    WHEN NOT MATCHED THEN
+        INSERT (Patente, Estado, UltimoMovimiento) VALUES (@Patente, 'Dentro', @FechaHora)
+    OUTPUT CASE inserted.Estado WHEN 'Dentro' THEN 'Entrada' ELSE 'Salida' END INTO @Registrado (TipoMovimiento);
+
+    INSERT INTO Movimientos (Patente, TipoMovimiento, FechaHora)
+    SELECT @Patente, TipoMovimiento, @FechaHora FROM @Registrado;
+    COMMIT TRANSACTION;
+
+    SELECT TipoMovimiento FROM @Registrado;
+END
+"""
+
+_SQL_MARCAS_INICIALES = """
+INSERT INTO MarcasCambios (Tabla)
+SELECT t.Tabla FROM (VALUES ('vehiculos'), ('personas'), ('roles')) AS t (Tabla)
+WHERE NOT EXISTS (SELECT 1 FROM MarcasCambios m WHERE m.Tabla = t.Tabla)
+"""
+
+MIGRACIONES = [
+    # Rol y Persona antes que Vehiculos: la clave foránea de Vehiculos necesita que Persona exista
+    Migracion(1, "Tablas base", [
+        _tabla('Rol', """
+            ID INT PRIMARY KEY IDENTITY(1,1),
+            Nombre NVARCHAR(50) NOT NULL UNIQUE"""),
+        _tabla('Persona', """
+            RUT NVARCHAR(12) PRIMARY KEY,
+            Nombre NVARCHAR(100) NOT NULL,
+            Apellido NVARCHAR(100) NOT NULL,
+            Telefono NVARCHAR(20) NULL,
+            ID_Rol INT NULL,
+            Activo BIT NOT NULL DEFAULT 1,
+            CONSTRAINT FK_Persona_Rol FOREIGN KEY (ID_Rol) REFERENCES Rol(ID)"""),
+        _tabla('Vehiculos', """
+            Patente NVARCHAR(10) PRIMARY KEY,
+            Estado NVARCHAR(10) NOT NULL CHECK (Estado IN ('Dentro', 'Fuera')),
+            UltimoMovimiento DATETIME NOT NULL,
+            RUT_Persona NVARCHAR(12) NULL,
+            CONSTRAINT FK_Vehiculo_Persona FOREIGN KEY (RUT_Persona) REFERENCES Persona(RUT)"""),
+        _tabla('Movimientos', """
+            ID INT PRIMARY KEY IDENTITY(1,1),
+            Patente NVARCHAR(10) NOT NULL,
+            TipoMovimiento NVARCHAR(10) NOT NULL CHECK (TipoMovimiento IN ('Entrada', 'Salida')),
+            FechaHora DATETIME NOT NULL"""),
+    ]),
+    Migracion(2, "Procedimiento dbo.sp_RegistrarMovimiento", [_SP_REGISTRAR_MOVIMIENTO]),
+    Migracion(3, "Índices del historial de movimientos", [
+        # Historial paginado por (FechaHora, ID) y marcas de cambio
+        _indice('Movimientos', 'IX_Movimientos_FechaHora', "(FechaHora DESC, ID DESC) INCLUDE (Patente, TipoMovimiento)"),
+        # Historial de una patente (filtro por prefijo)
+        _indice('Movimientos', 'IX_Movimientos_Patente', "(Patente, FechaHora DESC, ID DESC) INCLUDE (TipoMovimiento)"),
+    ]),
+    Migracion(4, "Índices de vehículos dentro, dueños y personas activas", [
+        # Vehículos dentro: el índice filtrado solo contiene los que están en el estacionamiento
+        _indice('Vehiculos', 'IX_Vehiculos_Dentro', "(Patente) INCLUDE (UltimoMovimiento, RUT_Persona) WHERE Estado = 'Dentro'"),
+        # JOIN Persona por dueño y desvinculación de vehículos al eliminar una persona
+        _indice('Vehiculos', 'IX_Vehiculos_RUT_Persona', "(RUT_Persona) WHERE RUT_Persona IS NOT NULL"),
+        # Verificación de la clave foránea al eliminar un rol y JOIN con Rol
+        _indice('Persona', 'IX_Persona_ID_Rol', "(ID_Rol) WHERE ID_Rol IS NOT NULL"),
+        # Combo de asignación: personas activas ordenadas por apellido
+        _indice('Persona', 'IX_Persona_Activas', "(Apellido, Nombre) INCLUDE (RUT) WHERE Activo = 1"),
+    ]),
+    # Agregados de analitica.py, mantenidos de forma incremental a partir de Movimientos
+    Migracion(5, "Tablas de agregados para reportes", [
+        _tabla('OcupacionHoraria', """
+            Hora DATETIME PRIMARY KEY,
+            Entradas INT NOT NULL,
+            Salidas INT NOT NULL,
+            OcupacionMaxima INT NOT NULL,
+            OcupacionFinal INT NOT NULL"""),
+        _tabla('EstadiaDiaria', """
+            Dia DATE NOT NULL,
+            ID_Rol INT NOT NULL,
+            Estadias INT NOT NULL,
+            SegundosTotales BIGINT NOT NULL,
+            SegundosMaximos INT NOT NULL,
+            PRIMARY KEY (Dia, ID_Rol)"""),
+        _tabla('ProgresoAnalitica', """
+            Clave NVARCHAR(50) PRIMARY KEY,
+            UltimoID INT NOT NULL"""),
+    ]),
+    # Contadores que incrementan las escrituras de core.py: la GUI detecta cambios sin recorrer las tablas
+    Migracion(6, "Marcas de cambios de Vehiculos, Persona y Rol", [
+        _tabla('MarcasCambios', """
+            Tabla NVARCHAR(20) PRIMARY KEY,
+            Version BIGINT NOT NULL DEFAULT 0"""),
+        _SQL_MARCAS_INICIALES,
+    ]),
+]
+
+_SQL_VERSIONES = """
+IF OBJECT_ID('dbo.VersionEsquema', 'U') IS NULL
+    CREATE TABLE VersionEsquema (
+        Version INT PRIMARY KEY,
+        Descripcion NVARCHAR(200) NOT NULL,
+        Aplicada DATETIME NOT NULL DEFAULT GETDATE()
+    )
+"""
+
+def _versiones_aplicadas(cursor):
+    cursor.execute(_SQL_VERSIONES)
+    return {row.Version for row in cursor.execute("SELECT Version FROM VersionEsquema").fetchall()}
+
+def version_actual():
+    """Devuelve la versión más alta aplicada, 0 si la base aún no tiene migraciones, o None sin conexión."""
+    try:
+        with conexion_bd() as conn:
+            if not conn: return None
+            aplicadas = _versiones_aplicadas(conn.cursor())
+            conn.commit()
+            return max(aplicadas, default=0)
+    except Exception as e:
+        print(f"❌ Error al leer la versión del esquema: {e}")
+        return None
+
+def aplicar_migraciones():
+    """
+    Aplica en orden las migraciones pendientes, cada una en su transacción. Un bloqueo de aplicación
+    (sp_getapplock) evita que dos procesos que arrancan a la vez apliquen la misma migración.
+    :return: (success, msg)
+    """
+    aplicadas_ahora = []
+    # Conexión propia, fuera del pool: el bloqueo es de la sesión y se libera al cerrarla aunque falle sp_releaseapplock
+    conn = get_connection()
+    if not conn: return False, "Sin conexión a BD"
+    try:
+        cursor = conn.cursor()
+        cursor.execute("EXEC sp_getapplock @Resource = 'migraciones', @LockMode = 'Exclusive', "
+                       "@LockOwner = 'Session', @LockTimeout = 30000")
+        try:
+            aplicadas = _versiones_aplicadas(cursor)
+            conn.commit()
+            for migracion in MIGRACIONES:
+                if migracion.version in aplicadas:
+                    continue
+                for sentencia in migracion.sentencias:
+                    cursor.execute(sentencia)
+                cursor.execute("INSERT INTO VersionEsquema (Version, Descripcion) VALUES (?, ?)",
+                               (migracion.version, migracion.descripcion))
+                conn.commit()
+                aplicadas_ahora.append(migracion)
+                print(f"✅ Migración {migracion.version} aplicada: {migracion.descripcion}")
+        except Exception:
+            conn.rollback() # Que el commit de abajo no confirme una migración a medias
+            raise
+        finally:
+            cursor.execute("EXEC sp_releaseapplock @Resource = 'migraciones', @LockOwner = 'Session'")
+            conn.commit()
+    except Exception as e:
+        print(f"❌ Error al aplicar migraciones: {e}")
+        return False, str(e)
+    finally:
+        conn.close()
+    if not aplicadas_ahora:
+        return True, f"El esquema está al día (versión {MIGRACIONES[-1].version})."
+    return True, f"Se aplicaron {len(aplicadas_ahora)} migraciones; esquema en la versión {aplicadas_ahora[-1].version}."
+
+def migrar_al_iniciar():
+    """Aplica las migraciones pendientes si [database] migrar_al_iniciar lo permite (lo llaman los puntos de entrada)."""
+    if obtener_config().getboolean('database', 'migrar_al_iniciar', fallback=True):
+        success, msg = aplicar_migraciones()
+        if not success:
+            print(f"⚠️ No se pudo verificar el esquema de la base de datos: {msg}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--estado', action='store_true', help="Solo mostrar la versión actual y las pendientes")
+    args = parser.parse_args()
+
+    if args.estado:
+        version = version_actual()
+        if version is None:
+            sys.exit(1)
+        pendientes = [m for m in MIGRACIONES if m.version > version]
+        print(f"Versión del esquema: {version}")
+        for migracion in pendientes:
+            print(f"  Pendiente {migracion.version}: {migracion.descripcion}")
+        return
+
+    success, msg = aplicar_migraciones()
+    print(msg)
+    sys.exit(0 if success else 1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+import collections
+import threading
+import time
+from db_config import obtener_config
+
+# --- Primitivas para pipelines de procesamiento en hilos ---
+
+class ColaDescartable:
+    """
+    Cola acotada que nunca bloquea al productor: si está llena se descarta el elemento más antiguo.
+    Con maxsize=1 funciona como buzón que siempre guarda solo el último elemento.
+    """
+
+    def __init__(self, maxsize):
+        self._items = collections.deque()
+        self._maxsize = maxsize
+        self._cond = threading.Condition()
+        self.descartados = 0
+
+    def put(self, item):
+        with self._cond:
+            if len(self._items) >= self._maxsize:
+                self._items.popleft()
+                self.descartados += 1
+            self._items.append(item)
+            self._cond.notify()
+
+    def get(self, timeout=None):
+        """Devuelve el siguiente elemento, o None si no llegó ninguno antes del timeout."""
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._items, timeout):
+                return None
+            return self._items.popleft()
+
+    def __len__(self):
+        with self._cond:
+            return len(self._items)
+
+def iniciar_etapa(nombre, funcion, entrada, detener, timeout=0.1):
+    """
+    Inicia un hilo que toma elementos de `entrada` y llama a funcion(elemento) hasta que se active
+    el evento `detener`. La función es responsable de dejar su resultado en la cola siguiente.
+    """
+    def _bucle():
+        while not detener.is_set():
+            item = entrada.get(timeout)
+            if item is None:
+                continue
+            try:
+                funcion(item)
+            except Exception as e:
+                print(f"❌ Error en la etapa '{nombre}': {e}")
+
+    hilo = threading.Thread(target=_bucle, name=nombre, daemon=True)
+    hilo.start()
+    return hilo
+
+class EstadisticaLatencia:
+    """Acumula latencias en segundos: última, promedio móvil exponencial y máxima (thread-safe)."""
+
+    def __init__(self, alfa=0.2):
+        self._alfa = alfa
+        self._lock = threading.Lock()
+        self.n = 0
+        self.ultima = 0.0
+        self.promedio = 0.0
+        self.maxima = 0.0
+
+    def registrar(self, segundos):
+        with self._lock:
+            self.n += 1
+            self.ultima = segundos
+            self.promedio = segundos if self.n == 1 else self._alfa * segundos + (1 - self._alfa) * self.promedio
+            self.maxima = max(self.maxima, segundos)
+
+    def medir_desde(self, inicio):
+        """Registra el tiempo transcurrido desde `inicio` (time.monotonic())."""
+        self.registrar(time.monotonic() - inicio)
+
+    def como_dict(self):
+        with self._lock:
+            return {'n': self.n, 'ultima_ms': self.ultima * 1000, 'promedio_ms': self.promedio * 1000, 'maxima_ms': self.maxima * 1000}
+
+class ControladorMuestreo:
+    """
+    Ajusta cuántos frames se saltan entre análisis para que el procesamiento no se atrase respecto
+    del stream más que `objetivo` segundos. Cada `periodo_ajuste` se mira el retraso promedio:
+    si supera el objetivo el intervalo se duplica, si viene creciendo se aumenta en uno y si está
+    estable bajo la mitad del objetivo se reduce en uno. En un equipo lento se analizan menos frames
+    sin quedar atrás; en uno rápido se analizan todos.
+    Es thread-safe: el hilo de detección consulta debe_analizar() y cualquier etapa puede registrar retrasos.
+    """
+
+    def __init__(self, objetivo=0.2, intervalo_maximo=30, alfa=0.3, ventana=30, periodo_ajuste=0.5, reloj=time.monotonic):
+        """
+        :param objetivo: Retraso máximo tolerado (segundos) entre el frame y el fin de su procesamiento.
+        :param intervalo_maximo: Como mucho se salta hasta analizar 1 de cada N frames.
+        :param alfa: Peso de la última medición en el promedio móvil del retraso.
+        :param ventana: Cantidad de análisis recientes usados para estimar la tasa de análisis.
+        :param periodo_ajuste: Segundos mínimos entre ajustes, para que cada cambio alcance a notarse en el retraso.
+        """
+        self.objetivo = objetivo
+        self.intervalo_maximo = intervalo_maximo
+        self._alfa = alfa
+        self._periodo_ajuste = periodo_ajuste
+        self._reloj = reloj
+        self._ultimo_ajuste = float('-inf')
+        self._retraso_anterior = 0.0 # Retraso promedio en la última evaluación
+        self._lock = threading.Lock()
+        self._analisis = collections.deque(maxlen=ventana) # Instantes de los últimos frames elegidos
+        self._contador = 0
+        self.intervalo = 1
+        self.retraso = 0.0 # Promedio móvil, en segundos
+        self.ajustes = 0
+
+    def debe_analizar(self):
+        """Llamar una vez por frame: True si toca analizarlo con el intervalo actual."""
+        with self._lock:
+            elegido = self._contador % self.intervalo == 0
+            self._contador += 1
+            if elegido:
+                self._analisis.append(self._reloj())
+            return elegido
+
+    def registrar_retraso(self, segundos):
+        """Registra cuánto va atrasado el procesamiento respecto del stream y ajusta el intervalo."""
+        with self._lock:
+            self.retraso = self._alfa * segundos + (1 - self._alfa) * self.retraso
+            ahora = self._reloj()
+            if ahora - self._ultimo_ajuste < self._periodo_ajuste:
+                return
+            self._ultimo_ajuste = ahora
+            creciendo = self.retraso - self._retraso_anterior > self.objetivo / 10
+            self._retraso_anterior = self.retraso
+            if self.retraso > self.objetivo:
+                intervalo = self.intervalo * 2 # Ponerse al día rápido
+            elif creciendo:
+                intervalo = self.intervalo + 1 # Aún dentro del objetivo, pero el análisis no da abasto
+            elif self.retraso < self.objetivo / 2:
+                intervalo = self.intervalo - 1 # Recuperar frames de a poco para no oscilar
+            else:
+                return
+            intervalo = max(1, min(self.intervalo_maximo, intervalo))
+            if intervalo != self.intervalo:
+                self.intervalo = intervalo
+                self._contador = 1 # El intervalo nuevo empieza a contar desde el último frame elegido
+                self.ajustes += 1
+
+    def tasa(self):
+        """Frames analizados por segundo en la ventana reciente."""
+        with self._lock:
+            if len(self._analisis) < 2:
+                return 0.0
+            duracion = self._analisis[-1] - self._analisis[0]
+            return (len(self._analisis) - 1) / duracion if duracion > 0 else 0.0
+
+    def como_dict(self):
+        tasa = self.tasa()
+        with self._lock:
+            return {'intervalo': self.intervalo, 'tasa_fps': tasa, 'retraso_ms': self.retraso * 1000,
+                    'objetivo_ms': self.objetivo * 1000, 'ajustes': self.ajustes}
+
+    def texto(self):
+        """Resumen corto para mostrar sobre la previsualización."""
+        d = self.como_dict()
+        return f"1/{d['intervalo']} frames | {d['tasa_fps']:.1f} FPS | retraso {d['retraso_ms']:.0f} ms"
+
+def crear_controlador_muestreo():
+    """Crea el ControladorMuestreo de la sección [muestreo] de config.ini, o None si está deshabilitado."""
+    config = obtener_config()
+    if not config.getboolean('muestreo', 'habilitado', fallback=True):
+        return None
+    return ControladorMuestreo(
+        objetivo=config.getfloat('muestreo', 'retraso_objetivo_ms', fallback=200) / 1000,
+        intervalo_maximo=config.getint('muestreo', 'intervalo_maximo', fallback=30),
+    )
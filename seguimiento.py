@@ -0,0 +1,144 @@
+import itertools
+import threading
+
+# --- Seguimiento de patentes entre frames ---
+
+def iou(a, b):
+    """Intersección sobre unión de dos cajas (x1, y1, x2, y2)."""
+    ix1, iy1 = max(a[0], b[0]), max(a[1], b[1])
+    ix2, iy2 = min(a[2], b[2]), min(a[3], b[3])
+    interseccion = max(0, ix2 - ix1) * max(0, iy2 - iy1)
+    if interseccion == 0:
+        return 0.0
+    area_a = (a[2] - a[0]) * (a[3] - a[1])
+    area_b = (b[2] - b[0]) * (b[3] - b[1])
+    return interseccion / (area_a + area_b - interseccion)
+
+def _centros_cercanos(a, b):
+    """True si el centro de `b` cae a menos de un ancho de caja del centro de `a` (autos rápidos o pocos frames)."""
+    dx = (a[0] + a[2] - b[0] - b[2]) / 2
+    dy = (a[1] + a[3] - b[1] - b[3]) / 2
+    return dx * dx + dy * dy <= max(a[2] - a[0], a[3] - a[1]) ** 2
+
+class Pista:
+    """Una patente seguida a lo largo de varios frames. Su id es la clave de sus votos en el ConfirmadorPatentes."""
+
+    __slots__ = ('id', 'caja', 'ultima_lectura', 'patente', 'lecturas_ocr', 'frames_vista', 'frames_perdida')
+
+    def __init__(self, id_pista, caja):
+        self.id = id_pista
+        self.caja = caja
+        self.ultima_lectura = ""
+        self.patente = None # Texto confirmado; una vez fijado no se vuelve a pasar por OCR
+        self.lecturas_ocr = 0
+        self.frames_vista = 1
+        self.frames_perdida = 0
+
+    @property
+    def texto(self):
+        """La patente confirmada o, si aún no hay, la última lectura válida."""
+        return self.patente or self.ultima_lectura
+
+class SeguidorPatentes:
+    """
+    Asocia las cajas de cada frame con las pistas del frame anterior (IoU, o cercanía de centros si
+    el IoU no alcanza). Los votos de OCR se cuentan por pista (core.ConfirmadorPatentes con clave=pista.id),
+    así un mismo auto detenido en la barrera se lee unas pocas veces hasta confirmarse, en vez de pasar
+    por OCR en todos los frames.
+    Es thread-safe: el detector y la etapa de confirmación pueden usarlo desde hilos distintos.
+    """
+
+    def __init__(self, iou_minimo=0.3, max_frames_perdida=15, max_lecturas=10, intervalo_reintento=5, al_olvidar=None):
+        """
+        :param iou_minimo: IoU mínimo para considerar que una caja continúa una pista.
+        :param max_frames_perdida: Frames analizados sin ver la pista antes de olvidarla.
+        :param max_lecturas: Lecturas de OCR sin confirmar tras las cuales la pista se lee con menos frecuencia.
+        :param intervalo_reintento: Pasado `max_lecturas`, se lee solo uno de cada N frames en que aparece.
+        :param al_olvidar: Se llama con el id de cada pista que se deja de seguir (p. ej. ConfirmadorPatentes.olvidar).
+        """
+        self.iou_minimo = iou_minimo
+        self.max_frames_perdida = max_frames_perdida
+        self.max_lecturas = max_lecturas
+        self.intervalo_reintento = intervalo_reintento
+        self.al_olvidar = al_olvidar
+        self.pistas = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self.pistas_creadas = 0
+        self.lecturas_ocr = 0
+
+    def actualizar(self, cajas):
+        """Asigna cada caja del frame a una pista (existente o nueva). Devuelve las pistas en el orden de `cajas`."""
+        olvidadas = []
+        with self._lock:
+            candidatos = sorted(
+                ((iou(p.caja, caja), p.id, i) for p in self.pistas.values() for i, caja in enumerate(cajas)),
+                reverse=True,
+            )
+            asignadas = [None] * len(cajas)
+            usadas = set()
+            for valor, id_pista, i in candidatos:
+                if asignadas[i] is not None or id_pista in usadas:
+                    continue
+                pista = self.pistas[id_pista]
+                if valor >= self.iou_minimo or _centros_cercanos(pista.caja, cajas[i]):
+                    asignadas[i] = pista
+                    usadas.add(id_pista)
+
+            for i, caja in enumerate(cajas):
+                if asignadas[i] is None:
+                    pista = Pista(next(self._ids), caja)
+                    self.pistas[pista.id] = pista
+                    self.pistas_creadas += 1
+                    asignadas[i] = pista
+                    usadas.add(pista.id)
+                else:
+                    asignadas[i].caja = caja
+                    asignadas[i].frames_vista += 1
+                    asignadas[i].frames_perdida = 0
+
+            for id_pista in [i for i, p in self.pistas.items() if i not in usadas]:
+                pista = self.pistas[id_pista]
+                pista.frames_perdida += 1
+                if pista.frames_perdida > self.max_frames_perdida:
+                    del self.pistas[id_pista]
+                    olvidadas.append(id_pista)
+        if self.al_olvidar is not None:
+            for id_pista in olvidadas: # Fuera del lock: el callback toma el suyo
+                self.al_olvidar(id_pista)
+        return asignadas
+
+    def necesita_ocr(self, pista):
+        """
+        Las pistas con patente confirmada ya no se leen. Una patente ilegible que no se confirma
+        tras `max_lecturas` intentos se sigue leyendo, pero solo cada `intervalo_reintento` frames.
+        """
+        if pista.patente is not None:
+            return False
+        return pista.lecturas_ocr < self.max_lecturas or pista.frames_vista % self.intervalo_reintento == 0
+
+    def registrar_lectura(self, pista, texto, patente=None):
+        """
+        Anota en la pista su última lectura válida y, si el confirmador ya resolvió la patente
+        (nueva o repetida), la fija para que la pista deje de pasar por OCR.
+        """
+        with self._lock:
+            pista.ultima_lectura = texto
+            if patente is not None:
+                pista.patente = patente
+
+    def contar_lecturas_ocr(self, pistas):
+        """Lleva la cuenta de cuántas veces se pasó cada pista por el OCR."""
+        with self._lock:
+            for pista in pistas:
+                pista.lecturas_ocr += 1
+            self.lecturas_ocr += len(pistas)
+
+    def metricas(self):
+        with self._lock:
+            return {
+                'pistas_activas': len(self.pistas),
+                'pistas_creadas': self.pistas_creadas,
+                'lecturas_ocr': self.lecturas_ocr,
+                'ocr_por_pista': self.lecturas_ocr / self.pistas_creadas if self.pistas_creadas else 0.0,
+            }
@@ -0,0 +1,292 @@
+import os
+import threading
+import cv2
+import numpy as np
+from db_config import obtener_config
+
+# --- Modelos YOLO y OCR (carga diferida) ---
+# Importar ultralytics/easyocr arrastra torch y construir los modelos toma varios segundos,
+# por eso no se hace al importar el módulo sino la primera vez que se necesitan.
+
+_modelo = None
+_ocr = None
+_modelo_lock = threading.Lock()
+_ocr_lock = threading.Lock()
+
+def obtener_modelo():
+    """Devuelve el modelo YOLO entrenado, cargándolo la primera vez que se pide."""
+    global _modelo
+    if _modelo is None:
+        with _modelo_lock:
+            if _modelo is None:
+                from ultralytics import YOLO
+                _modelo = YOLO('model/best.pt')
+    return _modelo
+
+def obtener_ocr():
+    """Devuelve el lector de EasyOCR, cargándolo la primera vez que se pide."""
+    global _ocr
+    if _ocr is None:
+        with _ocr_lock:
+            if _ocr is None:
+                import easyocr
+                _ocr = easyocr.Reader(['es'], gpu=False)
+    return _ocr
+
+def modelos_cargados():
+    """Indica si ambos modelos ya están en memoria."""
+    return _modelo is not None and _ocr is not None
+
+def precargar_modelos():
+    """Carga ambos modelos en un hilo de fondo para que la primera detección no tenga que esperar."""
+    def _precargar():
+        try:
+            obtener_modelo()
+            obtener_ocr()
+            print("✅ Modelos YOLO y OCR cargados.")
+        except Exception as e:
+            print(f"❌ Error al precargar los modelos: {e}")
+    hilo = threading.Thread(target=_precargar, name="PrecargaModelos", daemon=True)
+    hilo.start()
+    return hilo
+
+# --- Procesamiento de Imagen ---
+
+def preprocesar_para_ocr(imagen_recortada):
+    """Aplica técnicas para mejorar la legibilidad de la imagen antes de pasarla al OCR."""
+    gray = cv2.cvtColor(imagen_recortada, cv2.COLOR_BGR2GRAY)
+    
+    # Agrandar la imagen (Interpolación) - Ayuda mucho al OCR
+    h, w = gray.shape
+    scale_factor = 3
+    gray_resized = cv2.resize(gray, (w * scale_factor, h * scale_factor), interpolation=cv2.INTER_CUBIC)
+
+    # Aplicar un filtro de enfoque (Sharpening) para realzar los bordes
+    kernel = np.array([[-1,-1,-1], [-1,9,-1], [-1,-1,-1]])
+    sharpened = cv2.filter2D(gray_resized, -1, kernel)
+
+    # Convertir a blanco y negro puro (Binarización con método de Otsu)
+    _, thresh = cv2.threshold(sharpened, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+
+    return thresh
+
+def limpiar_texto_ocr(texto):
+    """Deja solo letras y números en mayúscula (así se comparan las lecturas con los formatos de patente)."""
+    return "".join(filter(str.isalnum, texto)).upper()
+
+# --- Región de Interés y Parámetros de Detección ---
+
+class RegionInteres:
+    """
+    Región del frame donde pueden aparecer patentes (por ejemplo, el carril junto a la barrera).
+    Se define en fracciones del frame (0 a 1) para no depender de la resolución de la cámara:
+    - rectángulo: 'x1,y1,x2,y2'
+    - polígono:   'x,y;x,y;x,y;...' (lo que queda fuera del polígono se pinta de negro antes de inferir)
+    """
+
+    def __init__(self, puntos):
+        self.puntos = puntos
+        xs = [x for x, _ in puntos]
+        ys = [y for _, y in puntos]
+        self.limites = (min(xs), min(ys), max(xs), max(ys))
+        self.es_poligono = len(puntos) > 2
+
+    @classmethod
+    def desde_texto(cls, texto):
+        """Lee la región desde config.ini; devuelve None si el texto está vacío (frame completo)."""
+        if not texto or not texto.strip():
+            return None
+        if ';' in texto:
+            puntos = [tuple(float(v) for v in par.split(',')) for par in texto.split(';') if par.strip()]
+            return cls(puntos)
+        x1, y1, x2, y2 = (float(v) for v in texto.split(','))
+        return cls([(x1, y1), (x2, y2)])
+
+    def rectangulo(self, ancho, alto):
+        """Rectángulo envolvente (x1, y1, x2, y2) en píxeles para un frame de ancho x alto."""
+        x1, y1, x2, y2 = self.limites
+        return (max(0, int(x1 * ancho)), max(0, int(y1 * alto)), min(ancho, int(round(x2 * ancho))), min(alto, int(round(y2 * alto))))
+
+    def recortar(self, frame):
+        """Devuelve (recorte, (dx, dy)): el recorte de la región y su desplazamiento dentro del frame."""
+        alto, ancho = frame.shape[:2]
+        x1, y1, x2, y2 = self.rectangulo(ancho, alto)
+        recorte = frame[y1:y2, x1:x2]
+        if self.es_poligono:
+            mascara = np.zeros(recorte.shape[:2], dtype=np.uint8)
+            poligono = np.array([(x * ancho - x1, y * alto - y1) for x, y in self.puntos], dtype=np.int32)
+            cv2.fillPoly(mascara, [poligono], 255)
+            recorte = cv2.bitwise_and(recorte, recorte, mask=mascara)
+        return recorte, (x1, y1)
+
+class ParametrosDeteccion:
+    """
+    Parámetros de model.predict para una fuente (cámara o video): ROI, resolución de inferencia y confianza.
+    Se leen de la sección [deteccion] de config.ini; una sección [deteccion:NOMBRE] cuyo valor `fuente`
+    coincida con la URL de la cámara (o el nombre del archivo de video) reemplaza esos valores.
+    """
+
+    def __init__(self, roi=None, imgsz=None, conf=0.6):
+        """
+        :param roi: RegionInteres o None para usar el frame completo.
+        :param imgsz: Resolución de inferencia para el frame completo (None = la del modelo). Con ROI se
+                      escala según el tamaño del recorte, así se mantiene la resolución por píxel y el costo
+                      baja en proporción al área analizada.
+        """
+        self.roi = roi
+        self.imgsz = imgsz
+        self.conf = conf
+
+    @classmethod
+    def desde_config(cls, fuente=None):
+        config = obtener_config()
+        seccion = 'deteccion'
+        if fuente:
+            nombre_archivo = os.path.basename(str(fuente))
+            for candidata in config.sections():
+                if candidata.startswith('deteccion:') and config.get(candidata, 'fuente', fallback=None) in (str(fuente), nombre_archivo):
+                    seccion = candidata
+                    break
+        def valor(clave, fallback=None):
+            return config.get(seccion, clave, fallback=config.get('deteccion', clave, fallback=fallback))
+        imgsz = valor('imgsz', '')
+        return cls(
+            roi=RegionInteres.desde_texto(valor('roi', '')),
+            imgsz=int(imgsz) if imgsz.strip() else None,
+            conf=float(valor('conf', '0.6')),
+        )
+
+def _imgsz_para_recorte(imgsz, recorte, frame):
+    """Escala imgsz según el lado mayor del recorte respecto del frame, en múltiplos de 32 (stride de YOLO)."""
+    proporcion = max(recorte.shape[0], recorte.shape[1]) / max(frame.shape[0], frame.shape[1])
+    return max(32, int(round(imgsz * proporcion / 32)) * 32)
+
+# --- Detección y Lectura de Patentes ---
+
+def detectar_patentes(frame, conf=0.6, roi=None, imgsz=None):
+    """
+    Ejecuta YOLO sobre el frame y devuelve las cajas (x1, y1, x2, y2) de las patentes detectadas,
+    recortadas a los bordes del frame y descartando las de área vacía.
+    Con `roi` solo se infiere sobre esa región y las cajas se devuelven en coordenadas del frame completo.
+    """
+    model = obtener_modelo()
+    alto, ancho = frame.shape[:2]
+    imagen, (dx, dy) = roi.recortar(frame) if roi is not None else (frame, (0, 0))
+    if imagen.size == 0:
+        return []
+    opciones = {}
+    if imgsz:
+        opciones['imgsz'] = _imgsz_para_recorte(imgsz, imagen, frame) if roi is not None else imgsz
+    cajas = []
+    for r in model.predict(imagen, conf=conf, verbose=False, **opciones):
+        for box in r.boxes:
+            class_name = model.names[int(box.cls[0])].lower()
+            if 'patente' in class_name or 'license_plate' in class_name:
+                x1, y1, x2, y2 = map(int, box.xyxy[0])
+                x1, y1, x2, y2 = max(x1 + dx, 0), max(y1 + dy, 0), min(x2 + dx, ancho), min(y2 + dy, alto)
+                if x2 > x1 and y2 > y1:
+                    cajas.append((x1, y1, x2, y2))
+    return cajas
+
+MARGEN_LIENZO = 8 # Píxeles de separación entre recortes apilados para el OCR por lotes
+
+def leer_patentes_lote(imagenes):
+    """
+    Lee el texto de varias imágenes de patente ya preprocesadas (escala de grises) con una sola
+    llamada al reconocedor de EasyOCR.
+    Las imágenes se apilan en un lienzo y se le entrega al reconocedor la caja de cada una, así se
+    evita correr el detector de texto de EasyOCR en cada recorte (YOLO ya localizó la patente).
+    Devuelve el texto limpio de cada imagen en el mismo orden ('' si no se leyó nada).
+    """
+    if not imagenes:
+        return []
+
+    ancho = max(img.shape[1] for img in imagenes) + 2 * MARGEN_LIENZO
+    alto = sum(img.shape[0] for img in imagenes) + (len(imagenes) + 1) * MARGEN_LIENZO
+    lienzo = np.full((alto, ancho), 255, dtype=np.uint8)
+    cajas = [] # Formato de EasyOCR: [x_min, x_max, y_min, y_max]
+    indice_por_y = {}
+    y = MARGEN_LIENZO
+    for i, img in enumerate(imagenes):
+        h, w = img.shape[:2]
+        lienzo[y:y + h, MARGEN_LIENZO:MARGEN_LIENZO + w] = img
+        cajas.append([MARGEN_LIENZO, MARGEN_LIENZO + w, y, y + h])
+        indice_por_y[y] = i
+        y += h + MARGEN_LIENZO
+
+    resultados = obtener_ocr().recognize(lienzo, horizontal_list=cajas, free_list=[], detail=1,
+                                         paragraph=False, batch_size=len(imagenes))
+
+    # El reconocedor puede reordenar las cajas, se asocian de vuelta por su coordenada y superior
+    textos = [""] * len(imagenes)
+    for caja, texto, _confianza in resultados:
+        i = indice_por_y.get(int(caja[0][1]))
+        if i is not None:
+            textos[i] = limpiar_texto_ocr(texto)
+    return textos
+
+# --- Compuerta de Movimiento ---
+
+class DetectorMovimiento:
+    """
+    Detector de cambios barato para decidir si vale la pena correr YOLO sobre un frame.
+    Compara el frame con el anterior en escala de grises y reducido a `ancho` píxeles, solo dentro del
+    rectángulo envolvente del ROI (una RegionInteres):
+    si cambia más de `fraccion_minima` de los píxeles hay movimiento. Tras el último movimiento se siguen
+    analizando `frames_gracia` frames más, para leer la patente de un auto que se detiene en la barrera.
+    """
+
+    def __init__(self, roi=None, ancho=160, umbral_pixel=25, fraccion_minima=0.002, frames_gracia=10):
+        self.roi = roi
+        self.ancho = ancho
+        self.umbral_pixel = umbral_pixel
+        self.fraccion_minima = fraccion_minima
+        self.frames_gracia = frames_gracia
+        self._anterior = None
+        self._gracia = 0
+        self.frames_evaluados = 0
+        self.frames_activos = 0
+
+    def hay_movimiento(self, frame):
+        """Indica si se debe analizar este frame."""
+        self.frames_evaluados += 1
+        alto, ancho = frame.shape[:2]
+        x1, y1, x2, y2 = self.roi.rectangulo(ancho, alto) if self.roi is not None else (0, 0, ancho, alto)
+        zona = frame[y1:y2, x1:x2]
+        escala = self.ancho / max(zona.shape[1], 1)
+        pequeno = cv2.resize(zona, (self.ancho, max(1, int(zona.shape[0] * escala))), interpolation=cv2.INTER_AREA)
+        gris = cv2.GaussianBlur(cv2.cvtColor(pequeno, cv2.COLOR_BGR2GRAY), (5, 5), 0)
+
+        anterior, self._anterior = self._anterior, gris
+        if anterior is None or anterior.shape != gris.shape:
+            movimiento = True # Primer frame: no hay con qué comparar
+        else:
+            _, cambios = cv2.threshold(cv2.absdiff(gris, anterior), self.umbral_pixel, 255, cv2.THRESH_BINARY)
+            movimiento = cv2.countNonZero(cambios) > self.fraccion_minima * cambios.size
+
+        if movimiento:
+            self._gracia = self.frames_gracia
+        elif self._gracia > 0:
+            self._gracia -= 1
+            movimiento = True
+        self.frames_activos += movimiento
+        return movimiento
+
+def crear_detector_movimiento(parametros=None):
+    """
+    Crea el DetectorMovimiento de la sección [movimiento] de config.ini, o None si está deshabilitado.
+    Si [movimiento] no define un ROI se usa el de los ParametrosDeteccion de la fuente.
+    """
+    config = obtener_config()
+    if not config.getboolean('movimiento', 'habilitado', fallback=True):
+        return None
+    roi = RegionInteres.desde_texto(config.get('movimiento', 'roi', fallback=''))
+    if roi is None and parametros is not None:
+        roi = parametros.roi
+    return DetectorMovimiento(
+        roi=roi,
+        ancho=config.getint('movimiento', 'ancho', fallback=160),
+        umbral_pixel=config.getint('movimiento', 'umbral_pixel', fallback=25),
+        fraccion_minima=config.getfloat('movimiento', 'fraccion_minima', fallback=0.002),
+        frames_gracia=config.getint('movimiento', 'frames_gracia', fallback=10),
+    )